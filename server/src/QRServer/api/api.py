@@ -3,11 +3,12 @@ from enum import Enum
 import logging
 
 from QRServer.api.auth import decode_token, make_access_token, make_refresh_token
+from QRServer.common.stats import message_stats, prometheus_histogram
 from QRServer.config import Config
 from QRServer.db.connector import DbConnector
 from QRServer.db.models import DbUser, Tournament, TournamentDuel, TournamentMatch
 from QRServer.game.gameserver import GameServer
-from QRServer.lobby.lobbyserver import LobbyServer
+from QRServer.lobby.lobbymanager import LobbyManager
 from aiohttp import web
 
 log = logging.getLogger('qr.api')
@@ -26,14 +27,14 @@ class ApiServer:
     site: web.TCPSite
     config: Config
     connector: DbConnector
-    lobby_server: LobbyServer
+    lobby_manager: LobbyManager
     game_server: GameServer
 
-    def __init__(self, config: Config, connector: DbConnector, lobby_server: LobbyServer, game_server: GameServer):
+    def __init__(self, config: Config, connector: DbConnector, lobby_manager: LobbyManager, game_server: GameServer):
         self.config = config
         self.connector = connector
         self.app = web.Application()
-        self.lobby_server = lobby_server
+        self.lobby_manager = lobby_manager
         self.game_server = game_server
         self.runner = web.AppRunner(self.app)
         self.origin = self.config.origin.get()
@@ -69,6 +70,8 @@ class ApiServer:
             web.get('/api/v1/game/stats', self._v1_game_stats),
             web.get('/api/v1/health', self._v1_health),
             web.get('/api/v1/lobby/stats', self._v1_lobby_stats),
+            web.get('/api/v1/lobby/stats/broadcasts', self._v1_lobby_broadcast_stats),
+            web.get('/api/v1/metrics', self._v1_metrics),
 
             # Tournaments
             web.get('/api/v1/tournaments/{id}', self._v1_tournaments),
@@ -82,20 +85,49 @@ class ApiServer:
         ])
 
     async def _v1_game_stats(self, _request: web.Request) -> web.Response:
-        player_count = self.game_server.get_player_count()
+        playing_count = self.game_server.get_playing_count()
+        waiting_count = self.game_server.get_waiting_count()
         return web.json_response({
-            'player_count': player_count,
+            'player_count': playing_count + waiting_count,
+            'playing_count': playing_count,
+            'waiting_count': waiting_count,
         })
 
     async def _v1_health(self, _request: web.Request) -> web.Response:
         return web.json_response({})
 
     async def _v1_lobby_stats(self, _request: web.Request):
-        player_count = self.lobby_server.get_player_count()
+        rooms = self.lobby_manager.get_room_stats()
         return web.json_response({
-            'player_count': player_count,
+            'player_count': sum(room['player_count'] for room in rooms),
+            'room_count': len(rooms),
+            'rooms': rooms,
         })
 
+    async def _v1_lobby_broadcast_stats(self, _request: web.Request):
+        return web.json_response({
+            'latency_seconds': self.lobby_manager.broadcast_latency.to_dict(),
+        })
+
+    async def _v1_metrics(self, _request: web.Request) -> web.Response:
+        """Metrics in the Prometheus text format"""
+        lines = [
+            '# TYPE qr_lobby_players gauge',
+            f'qr_lobby_players {self.lobby_manager.get_player_count()}',
+            '# TYPE qr_lobby_rooms gauge',
+            f'qr_lobby_rooms {len(self.lobby_manager.rooms)}',
+            '# TYPE qr_game_players gauge',
+            f'qr_game_players {self.game_server.get_player_count()}',
+            '# TYPE qr_game_waiting_players gauge',
+            f'qr_game_waiting_players {self.game_server.get_waiting_count()}',
+            '# TYPE qr_lobby_broadcast_duration_seconds histogram',
+            *prometheus_histogram('qr_lobby_broadcast_duration_seconds', self.lobby_manager.broadcast_latency),
+            *message_stats.to_prometheus(),
+        ]
+        return web.Response(
+            body='\n'.join(lines).encode('utf-8') + b'\n',
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
     async def _v1_tournament_users(self, request) -> web.Response:
         tournament_id = request.match_info['id']
         users: list[DbUser] | None = await self.connector.list_tournament_users(tournament_id)
@@ -0,0 +1,4 @@
+from QRServer.bench.replay import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import time
+import tracemalloc
+from typing import Callable
+
+from QRServer.common import messages
+from QRServer.common.messages import Message, ConstantResponseMessage
+from QRServer.bench.transcript import game_transcript
+
+
+def _parse_args_linear(args: list[str]) -> Message | None:
+    # The dispatcher used before the prefix trie, kept as a baseline
+    for clazz in getattr(messages, '__message_classes'):
+        if messages._valid(args, clazz.prefix, clazz.argc):
+            try:
+                return clazz.from_args(args)
+            except ValueError:
+                return None
+    return None
+
+
+def _parse_args_indexed(args: list[str]) -> Message | None:
+    return messages._parse_args(args)
+
+
+def _measure(parse: Callable[[list[str]], Message | None], frames: list[bytes], repeat: int) -> float:
+    decoded = [f.decode('ascii', 'replace') for f in frames]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in decoded:
+            parse(data.split(messages.delim))
+    elapsed = time.perf_counter() - start
+    return len(decoded) * repeat / elapsed
+
+
+def run_dispatch_benchmark(turns: int, repeat: int) -> None:
+    frames = game_transcript(turns)
+    for frame in frames:
+        args = frame.decode('ascii').split(messages.delim)
+        if type(_parse_args_linear(args)) is not type(_parse_args_indexed(args)):
+            raise AssertionError(f'Dispatchers disagree on {frame!r}')
+
+    linear = _measure(_parse_args_linear, frames, repeat)
+    indexed = _measure(_parse_args_indexed, frames, repeat)
+    print(f'Transcript: {len(frames)} frames x {repeat}')
+    print(f'  linear scan:  {linear:12,.0f} messages/s')
+    print(f'  prefix trie:  {indexed:12,.0f} messages/s  ({indexed / linear:.2f}x)')
+
+
+def run_forward_benchmark(turns: int, repeat: int) -> None:
+    frames = game_transcript(turns)
+    forwarded = [f for f in frames if f.startswith(b'<S>~')]
+
+    def forward_parsed(data: bytes) -> bytes | None:
+        message = Message.from_data(data)
+        return message.to_data() if message is not None else None
+
+    def forward_raw(data: bytes) -> bytes | None:
+        if data.isascii() and messages.get_message_type_from_data(data) is not None:
+            return data + b'\x00'
+        return None
+
+    def cpu_per_frame(forward: Callable[[bytes], bytes | None]) -> float:
+        start = time.process_time()
+        for _ in range(repeat):
+            for data in forwarded:
+                forward(data)
+        return (time.process_time() - start) / (len(forwarded) * repeat)
+
+    parsed = cpu_per_frame(forward_parsed)
+    raw = cpu_per_frame(forward_raw)
+    print(f'Forwarding: {len(forwarded)} frames x {repeat}')
+    print(f'  parse and re-encode: {parsed * 1e6:8.2f} us CPU/frame')
+    print(f'  raw relay:           {raw * 1e6:8.2f} us CPU/frame  ({parsed / raw:.2f}x)')
+
+
+def run_parse_benchmark(turns: int, frame_count: int) -> None:
+    transcript = game_transcript(turns)
+    stream = (transcript * (frame_count // len(transcript) + 1))[:frame_count]
+
+    start = time.perf_counter()
+    for data in stream:
+        Message.from_data(data)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    allocated_before = tracemalloc.get_traced_memory()[0]
+    retained = [Message.from_data(data) for data in transcript]
+    allocated = tracemalloc.get_traced_memory()[0] - allocated_before
+    tracemalloc.stop()
+
+    print(f'Parsing: {frame_count:,} frames')
+    print(f'  throughput:         {frame_count / elapsed:12,.0f} messages/s')
+    print(f'  retained memory:    {allocated / len(retained):12,.0f} bytes/message')
+
+
+def _sample_messages(turns: int) -> list[Message]:
+    # Messages seen in the transcript are used as they are, the remaining
+    # classes get their prefix padded with zeros
+    samples: dict[type[Message], Message] = {}
+    for frame in game_transcript(turns):
+        message = Message.from_data(frame)
+        if message is not None:
+            samples.setdefault(type(message), message)
+
+    for clazz in getattr(messages, '__message_classes'):
+        if clazz in samples:
+            continue
+        argc = next((argc for argc in clazz.argc if argc >= 0), len(clazz.prefix))
+        args = [p if p is not None else '0' for p in clazz.prefix]
+        samples[clazz] = clazz([*args, *(['0'] * (argc - len(args)))])
+
+    return sorted(samples.values(), key=lambda message: type(message).__name__)
+
+
+def _constructor(message: Message) -> Callable[[], bytes]:
+    """
+    Returns:
+        a function constructing and encoding a message of the same class and arguments
+    """
+    clazz = type(message)
+    if issubclass(clazz, ConstantResponseMessage):
+        constant_clazz = clazz
+        return lambda: constant_clazz.new().to_data()
+
+    args = message.args
+    return lambda: clazz(list(args)).to_data()
+
+
+def run_encode_benchmark(turns: int, repeat: int) -> None:
+    def ns_per_call(fn: Callable[[], bytes]) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) / repeat * 1e9
+
+    print(f'Encoding: {repeat} times per message class')
+    print(f'  {"message class":36} {"new + to_data":>14} {"to_data":>10}')
+    for message in _sample_messages(turns):
+        print(f'  {type(message).__name__:36} {ns_per_call(_constructor(message)):11,.0f} ns '
+              f'{ns_per_call(message.to_data):7,.0f} ns')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark message classification, forwarding, parsing and encoding')
+    parser.add_argument('--turns', type=int, default=200, help='turns in the game transcript')
+    parser.add_argument('--repeat', type=int, default=50, help='how many times to replay the transcript')
+    parser.add_argument('--frames', type=int, default=1_000_000, help='frames in the parsed stream')
+    args = parser.parse_args()
+    run_dispatch_benchmark(args.turns, args.repeat)
+    run_forward_benchmark(args.turns, args.repeat)
+    run_parse_benchmark(args.turns, args.frames)
+    run_encode_benchmark(args.turns, args.repeat * 1000)
+
+
+if __name__ == '__main__':
+    main()
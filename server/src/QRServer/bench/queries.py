@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from tempfile import TemporaryDirectory
+
+from QRServer.config import Config
+from QRServer.db.connector import DbConnector
+
+
+async def _populate(connector: DbConnector, users: int) -> list[tuple[str, str]]:
+    user_ids = [(str(uuid.uuid4()), f'Bench {i}') for i in range(users)]
+    async with connector._transaction('w') as c:
+        await c.executemany(
+            "insert into users (id, username, password, created_at) values (?, ?, 'x', 0)", user_ids)
+        await c.executemany(
+            "insert into bans (user_id, banned_at, ban_reason) values (?, 1, 'bench')",
+            [(user_id,) for user_id, _ in user_ids[::10]])
+    return user_ids
+
+
+async def _time(lookup, keys: list[str], concurrency: int) -> float:
+    async def worker(worker_keys: list[str]):
+        for key in worker_keys:
+            await lookup(key)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(keys[i::concurrency]) for i in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_queries_benchmark(lookups: int, users: int, concurrency: int):
+    rng = random.Random(0)
+    with TemporaryDirectory() as data_dir:
+        connector = DbConnector(os.path.join(data_dir, 'database.sqlite3'), Config())
+        await connector.connect()
+        try:
+            user_ids = await _populate(connector, users)
+            sample = [rng.choice(user_ids) for _ in range(lookups)]
+
+            print(f'User lookups: {lookups:,} of {users:,} users, {concurrency} concurrent')
+            for name, lookup, keys in [
+                ('get_user', connector.get_user, [user_id for user_id, _ in sample]),
+                ('get_user_by_username', connector.get_user_by_username, [username for _, username in sample]),
+            ]:
+                duration = await _time(lookup, keys, concurrency)
+                print(f'  {name + ":":22}{duration:8.3f} s, {lookups / duration:9,.0f} lookups/s')
+        finally:
+            await connector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark looking up users in the database')
+    parser.add_argument('--lookups', type=int, default=100_000, help='how many users are looked up')
+    parser.add_argument('--users', type=int, default=10_000, help='users in the database')
+    parser.add_argument('--concurrency', type=int, default=8, help='how many lookups run at the same time')
+    args = parser.parse_args()
+    asyncio.run(run_queries_benchmark(args.lookups, args.users, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
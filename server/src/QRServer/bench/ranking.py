@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from tempfile import TemporaryDirectory
+
+from QRServer.config import Config
+from QRServer.db.connector import DbConnector
+from QRServer.db.models import DbMatchReport
+
+_month_start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def _random_match(users: list[str], rng: random.Random) -> DbMatchReport:
+    winner_id, loser_id = rng.sample(users, 2)
+    finished_at = _month_start + timedelta(seconds=rng.randrange(28 * 24 * 3600))
+    return DbMatchReport(
+        winner_id=winner_id,
+        loser_id=loser_id,
+        winner_pieces_left=rng.randrange(1, 20),
+        loser_pieces_left=0,
+        move_counter=rng.randrange(20, 200),
+        grid_size='standard',
+        squadron_size='standard',
+        started_at=finished_at - timedelta(minutes=10),
+        finished_at=finished_at,
+        is_ranked=True,
+        is_void=False,
+    )
+
+
+async def _populate(connector: DbConnector, users: list[str], matches: int, rng: random.Random):
+    # Written in bulk, only refreshing the ranking after a match is measured
+    results = [_random_match(users, rng) for _ in range(matches)]
+    async with connector._transaction('w') as c:
+        await c.executemany(
+            "insert into users (id, username, created_at) values (?, ?, 0)",
+            [(user_id, f'Bench {i} GUEST') for i, user_id in enumerate(users)])
+        await c.executemany(
+            "insert into matches (id, user_1, user_2, is_ranked, started_at) values (?, ?, ?, 1, ?)",
+            [(r.match_id, *sorted((r.winner_id, r.loser_id)), r.started_at.timestamp()) for r in results])
+        await c.executemany(
+            "insert into match_results ("
+            "  match_id, winner_id, loser_id, winner_pieces_left, loser_pieces_left,"
+            "  move_counter, grid_size, squadron_size, finished_at, is_void"
+            ") values (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            [(r.match_id, r.winner_id, r.loser_id, r.winner_pieces_left, r.loser_pieces_left,
+              r.move_counter, r.grid_size, r.squadron_size, r.finished_at.timestamp()) for r in results])
+        await c.executemany(
+            "insert into user_ratings (user_id, year, month, revision, rating) values (?, ?, ?, 0, ?)",
+            [(user_id, _month_start.year, _month_start.month, rng.uniform(1000, 2000)) for user_id in users])
+    await connector.rebuild_rankings()
+
+
+async def _regenerate_ranking(connector: DbConnector):
+    # How the ranking was refreshed after every match before the monthly statistics were introduced
+    start_date, end_date = _month_start, datetime(2020, 2, 1, tzinfo=timezone.utc)
+    async with connector._transaction('r') as c:
+        await c.execute(
+            "select"
+            " u.username,"
+            " u.id,"
+            " sum(mr.winner_id = u.id) as total_wins,"
+            " count(*) as total_games"
+            " from users u"
+            " inner join match_results mr on (u.id = mr.winner_id or u.id = mr.loser_id)"
+            " inner join matches m on m.id = mr.match_id"
+            " inner join user_ratings r on (u.id = r.user_id) and r.month = ? and r.year = ?"
+            " where mr.finished_at >= ?"
+            " and mr.finished_at < ?"
+            " and m.is_ranked = 1"
+            " and mr.is_void = 0"
+            " group by u.username"
+            " order by rating desc, total_games desc, total_wins desc, u.id desc"
+            " limit 100", (
+                start_date.month,
+                start_date.year,
+                start_date.timestamp(),
+                end_date.timestamp(),
+            )
+        )
+        rows = await c.fetchall()
+
+    async with connector._transaction('w') as c:
+        for position, row in enumerate(rows):
+            await c.execute(
+                "insert or replace into rankings (year, month, position, user_id, wins, total_games)"
+                " values (?, ?, ?, ?, ?, ?)",
+                (start_date.year, start_date.month, position + 1, row[1], row[2], row[3]))
+
+
+async def _update_ranking(connector: DbConnector):
+    async with connector._transaction('w') as c:
+        await connector._update_ranking(c, year=_month_start.year, month=_month_start.month)
+
+
+async def _time(fn, repeat: int) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _summary(durations: list[float]) -> str:
+    return f'median {statistics.median(durations) * 1e3:8.3f} ms, max {max(durations) * 1e3:8.3f} ms'
+
+
+async def run_ranking_benchmark(users: int, matches: int, repeat: int):
+    rng = random.Random(0)
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    with TemporaryDirectory() as data_dir:
+        connector = DbConnector(os.path.join(data_dir, 'database.sqlite3'), Config())
+        await connector.connect()
+        try:
+            await _populate(connector, user_ids, matches, rng)
+
+            print(f'Ranking refresh: {matches:,} matches of {users:,} users in a month, {repeat} times')
+            print(f'  full regeneration:  {_summary(await _time(lambda: _regenerate_ranking(connector), repeat))}')
+            print(f'  _update_ranking:    {_summary(await _time(lambda: _update_ranking(connector), repeat))}')
+            print(f'  add_match_result:   '
+                  f'{_summary(await _time(lambda: connector.add_match_result(_random_match(user_ids, rng)), repeat))}')
+        finally:
+            await connector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark refreshing the monthly ranking after a match')
+    parser.add_argument('--users', type=int, default=1000, help='users playing in the month')
+    parser.add_argument('--matches', type=int, default=10_000, help='matches played in the month')
+    parser.add_argument('--repeat', type=int, default=50, help='how many times each refresh is measured')
+    args = parser.parse_args()
+    asyncio.run(run_ranking_benchmark(args.users, args.matches, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
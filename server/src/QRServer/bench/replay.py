@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from tempfile import TemporaryDirectory
+
+from QRServer.bench.transcript import game_transcript
+from QRServer.common.frames import read_frames
+from QRServer.common.messages import DisconnectRequest, HelloGameRequest, JoinGameRequest, JoinLobbyRequest, \
+    LobbyChatMessage
+from QRServer.config import Config
+from QRServer.server import QRServer
+
+_guest_password = hashlib.md5(b'<NOPASS>').hexdigest()
+_max_frame_size = 1024 * 1024
+_timeout = 60
+# Users a lobby room holds, the next ones join another room
+_lobby_room_size = 13
+
+
+@dataclass
+class ReplayOptions:
+    lobby_users: int
+    lobby_messages: int
+    game_pairs: int
+    turns: int
+    interval: float
+    logins: int = 0
+    lobby_rooms: int = 1
+
+
+@dataclass
+class ReplayResults:
+    relay_latencies: list[float] = field(default_factory=list)
+    login_relay_latencies: list[float] = field(default_factory=list)
+    broadcast_latencies: list[float] = field(default_factory=list)
+    login_durations: list[float] = field(default_factory=list)
+    logging_in: bool = False
+    relayed_frames: int = 0
+    failed_matches: int = 0
+    duration: float = 0.0
+
+
+def _game_usernames(pair: int) -> tuple[str, str]:
+    return f'Bench {pair}A GUEST', f'Bench {pair}B GUEST'
+
+
+def _lobby_username(user: int) -> str:
+    return f'Bench {user}L GUEST'
+
+
+def _member_credentials(member: int) -> tuple[str, str]:
+    return f'Bench {member}M', hashlib.md5(f'bench {member}'.encode('ascii')).hexdigest()
+
+
+class _Connection:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, address: tuple[str, int]) -> '_Connection':
+        reader, writer = await asyncio.open_connection(*address)
+        return cls(reader, writer)
+
+    async def send(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def frames(self):
+        return read_frames(self.reader, _max_frame_size)
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class _GameSide:
+    """
+    One player of a replayed match. Frames sent by the player are remembered
+    with their send time until the opponent receives them, the relay
+    preserves their order.
+    """
+    connection: _Connection
+    pending: deque[tuple[bytes, float]]
+    joined: asyncio.Event
+    delivered: asyncio.Event
+    done_sending: bool
+
+    def __init__(self, connection: _Connection):
+        self.connection = connection
+        self.pending = deque()
+        self.joined = asyncio.Event()
+        self.delivered = asyncio.Event()
+        self.done_sending = False
+
+    async def receive(self, opponent: '_GameSide', results: ReplayResults):
+        async for frame in self.connection.frames():
+            if frame.startswith(b'<S>~<SERVER>~'):
+                # Responses of the server, e.g. the player count after joining
+                self.joined.set()
+                continue
+
+            received_at = time.perf_counter()
+            while opponent.pending:
+                sent, sent_at = opponent.pending.popleft()
+                if sent == frame:
+                    if results.logging_in:
+                        results.login_relay_latencies.append(received_at - sent_at)
+                    else:
+                        results.relay_latencies.append(received_at - sent_at)
+                    results.relayed_frames += 1
+                    break
+            if opponent.done_sending and not opponent.pending:
+                opponent.delivered.set()
+
+    async def replay(self, frames: list[bytes], interval: float):
+        for frame in frames:
+            if frame.startswith(b'<S>~'):
+                self.pending.append((frame, time.perf_counter()))
+            await self.connection.send(frame + b'\x00')
+            await asyncio.sleep(interval)
+        self.done_sending = True
+        if not self.pending:
+            self.delivered.set()
+
+
+async def _join_game(side: _GameSide, username: str, opponent_username: str):
+    await side.connection.send(HelloGameRequest.new().to_data())
+    await side.connection.send(JoinGameRequest.new(
+        username, username, opponent_username, opponent_username, _guest_password).to_data())
+    await side.joined.wait()
+
+
+async def _play_match(game_address: tuple[str, int], pair: int, options: ReplayOptions, results: ReplayResults):
+    username_a, username_b = _game_usernames(pair)
+    side_a = _GameSide(await _Connection.open(game_address))
+    side_b = _GameSide(await _Connection.open(game_address))
+    receivers = [
+        asyncio.create_task(side_a.receive(side_b, results)),
+        asyncio.create_task(side_b.receive(side_a, results)),
+    ]
+    try:
+        await _join_game(side_a, username_a, username_b)
+        await _join_game(side_b, username_b, username_a)
+
+        # Skip the hello and join frames, and the final disconnect
+        await asyncio.gather(
+            side_a.replay(game_transcript(options.turns, seed=2 * pair)[2:-1], options.interval),
+            side_b.replay(game_transcript(options.turns, seed=2 * pair + 1)[2:-1], options.interval))
+        await asyncio.gather(side_a.delivered.wait(), side_b.delivered.wait())
+
+        for side in (side_a, side_b):
+            await side.connection.send(DisconnectRequest.new().to_data())
+    finally:
+        for receiver in receivers:
+            receiver.cancel()
+        await side_a.connection.close()
+        await side_b.connection.close()
+
+
+class _LobbyUser:
+    connection: _Connection
+    joined: asyncio.Event
+    received_all: asyncio.Event
+
+    def __init__(self, connection: _Connection):
+        self.connection = connection
+        self.joined = asyncio.Event()
+        self.received_all = asyncio.Event()
+
+    async def receive(self, expected: int, results: ReplayResults):
+        count = 0
+        async for frame in self.connection.frames():
+            if frame.startswith(b'<L>~'):
+                self.joined.set()
+                continue
+
+            message_at = frame.rfind(b' bench ')
+            if not frame.startswith(b'<B>~<CHAT>~') or message_at == -1:
+                continue
+            sent_at = int(frame[message_at + len(b' bench '):])
+            results.broadcast_latencies.append((time.perf_counter_ns() - sent_at) / 1e9)
+            count += 1
+            if count == expected:
+                self.received_all.set()
+
+    async def chat(self, username: str, options: ReplayOptions):
+        for _ in range(options.lobby_messages):
+            text = f'{username}: bench {time.perf_counter_ns()}'
+            await self.connection.send(LobbyChatMessage.new(None, text).to_data())
+            await asyncio.sleep(max(options.interval, 0.01))
+
+
+async def _chat_in_lobby(lobby_address: tuple[str, int], options: ReplayOptions, results: ReplayResults):
+    users: list[_LobbyUser] = []
+    receivers = []
+    try:
+        for user in range(options.lobby_users):
+            lobby_user = _LobbyUser(await _Connection.open(lobby_address))
+            users.append(lobby_user)
+            # Users join one at a time, so they fill the rooms in order and chat reaches only their room
+            room_start = user // _lobby_room_size * _lobby_room_size
+            expected = min(_lobby_room_size, options.lobby_users - room_start) * options.lobby_messages
+            receivers.append(asyncio.create_task(lobby_user.receive(expected, results)))
+            await lobby_user.connection.send(JoinLobbyRequest.new(_lobby_username(user), _guest_password).to_data())
+            await lobby_user.joined.wait()
+
+        await asyncio.gather(*(u.chat(_lobby_username(user), options) for user, u in enumerate(users)))
+        await asyncio.gather(*(u.received_all.wait() for u in users))
+        for lobby_user in users:
+            await lobby_user.connection.send(DisconnectRequest.new().to_data())
+    finally:
+        for receiver in receivers:
+            receiver.cancel()
+        for lobby_user in users:
+            await lobby_user.connection.close()
+
+
+async def _log_in(game_address: tuple[str, int], member: int, results: ReplayResults) -> _Connection:
+    username, password = _member_credentials(member)
+    opponent_username, _ = _member_credentials(member ^ 1)
+    started_at = time.perf_counter()
+    connection = await _Connection.open(game_address)
+    await connection.send(HelloGameRequest.new().to_data())
+    await connection.send(JoinGameRequest.new(
+        username, username, opponent_username, opponent_username, password).to_data())
+    async for frame in connection.frames():
+        if frame.startswith(b'<S>~<SERVER>~'):
+            results.login_durations.append(time.perf_counter() - started_at)
+            break
+    return connection
+
+
+async def _login_burst(game_address: tuple[str, int], options: ReplayOptions, results: ReplayResults):
+    # Let the matches start replaying first, the burst should hit them mid-game
+    await asyncio.sleep(1.0)
+    results.logging_in = True
+    try:
+        connections = await asyncio.gather(
+            *(_log_in(game_address, member, results) for member in range(options.logins)))
+    finally:
+        results.logging_in = False
+    for connection in connections:
+        await connection.send(DisconnectRequest.new().to_data())
+        await connection.close()
+
+
+async def _drive_clients(
+        lobby_address: tuple[str, int], game_address: tuple[str, int], options: ReplayOptions) -> ReplayResults:
+    results = ReplayResults()
+
+    async def play_match(pair: int):
+        try:
+            await asyncio.wait_for(_play_match(game_address, pair, options, results), _timeout)
+        except (TimeoutError, ConnectionError):
+            results.failed_matches += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        asyncio.wait_for(_chat_in_lobby(lobby_address, options, results), _timeout),
+        *(play_match(pair) for pair in range(options.game_pairs)),
+        *([asyncio.wait_for(_login_burst(game_address, options, results), _timeout)] if options.logins else []))
+    results.duration = time.perf_counter() - start
+    return results
+
+
+def _run_clients(
+        lobby_address: tuple[str, int], game_address: tuple[str, int], options: ReplayOptions, conn: Connection):
+    # Runs in a separate process, so that the CPU time of the server is not mixed with the clients
+    conn.send(asyncio.run(_drive_clients(lobby_address, game_address, options)))
+    conn.close()
+
+
+def _percentiles(values: list[float]) -> str:
+    if len(values) < 2:
+        return 'n/a'
+    quantiles = statistics.quantiles(values, n=100)
+    return f'p50 {quantiles[49] * 1e3:8.3f} ms, p99 {quantiles[98] * 1e3:8.3f} ms'
+
+
+async def run_replay(options: ReplayOptions) -> ReplayResults:
+    with TemporaryDirectory() as data_dir:
+        config = Config()
+        config.set('address', '127.0.0.1')
+        config.set('port.lobby', 0)
+        config.set('port.game', 0)
+        config.set('data.dir', data_dir)
+        config.set('lobby.max_rooms', options.lobby_rooms)
+        server = QRServer(config)
+        await server.start()
+        try:
+            # The opponent has to exist before a player joins a game
+            connector = server.connector
+            if not connector:
+                raise AssertionError('Connector not set up')
+            for pair in range(options.game_pairs):
+                for username in _game_usernames(pair):
+                    await connector.authenticate_user(username, None, auto_create=True)
+            for member in range(options.logins):
+                username, password = _member_credentials(member)
+                await connector.create_member(username, password.encode('ascii'))
+
+            lobby_address = server.lobby_socks[0].getsockname()[:2]
+            game_address = server.game_socks[0].getsockname()[:2]
+            context = multiprocessing.get_context('spawn')
+            receiving_conn, sending_conn = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_run_clients,
+                args=(lobby_address, game_address, options, sending_conn))
+
+            cpu_start = time.process_time()
+            process.start()
+            sending_conn.close()
+            results: ReplayResults = await asyncio.to_thread(receiving_conn.recv)
+            server_cpu = time.process_time() - cpu_start
+            await asyncio.to_thread(process.join)
+        finally:
+            await server.stop()
+
+    matches = options.game_pairs - results.failed_matches
+    print(f'Replay: {options.lobby_users} lobby users in {options.lobby_rooms} rooms '
+          f'x {options.lobby_messages} messages, '
+          f'{options.game_pairs} game pairs x {options.turns} turns')
+    print(f'  relayed frames:     {results.relayed_frames:12,} ({results.relayed_frames / results.duration:,.0f}/s)')
+    print(f'  relay latency:      {_percentiles(results.relay_latencies)}')
+    if options.logins:
+        print(f'  during logins:      {_percentiles(results.login_relay_latencies)}')
+        print(f'  {options.logins} logins:' + ' ' * (18 - len(str(options.logins)))
+              + _percentiles(results.login_durations))
+    print(f'  lobby broadcast:    {_percentiles(results.broadcast_latencies)}')
+    print(f'  server CPU:         {server_cpu:12.3f} s ({server_cpu / max(matches, 1) * 1e3:,.1f} ms/match)')
+    if results.failed_matches:
+        print(f'  failed matches:     {results.failed_matches:12}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay lobby and game traffic against a local server')
+    parser.add_argument('--lobby-users', type=int, default=13,
+                        help=f'concurrent lobby users (at most {_lobby_room_size} per room)')
+    parser.add_argument('--lobby-rooms', type=int, default=Config().lobby_max_rooms.get(),
+                        help='lobby rooms the server opens (lobby.max_rooms)')
+    parser.add_argument('--lobby-messages', type=int, default=50, help='chat messages sent by each lobby user')
+    parser.add_argument('--game-pairs', type=int, default=8, help='concurrent matches')
+    parser.add_argument('--turns', type=int, default=200, help='turns replayed in each match')
+    parser.add_argument('--interval', type=float, default=0.005, help='delay in seconds between frames of a client')
+    parser.add_argument('--logins', type=int, default=0,
+                        help='members logging in to the game server at once during the replay')
+    args = parser.parse_args()
+    if args.lobby_rooms < 1:
+        parser.error('the lobby needs at least one room')
+    max_lobby_users = _lobby_room_size * args.lobby_rooms
+    if not 0 <= args.lobby_users <= max_lobby_users:
+        parser.error(f'lobby.max_rooms {args.lobby_rooms} allows at most {max_lobby_users} lobby users')
+    if args.logins % 2:
+        parser.error('members log in as pairs of opponents, the number of logins must be even')
+
+    logging.getLogger('qr').setLevel(logging.WARNING)
+    asyncio.run(run_replay(ReplayOptions(
+        lobby_users=args.lobby_users,
+        lobby_messages=args.lobby_messages,
+        game_pairs=args.game_pairs,
+        turns=args.turns,
+        interval=args.interval,
+        logins=args.logins,
+        lobby_rooms=args.lobby_rooms)))
+
+
+if __name__ == '__main__':
+    main()
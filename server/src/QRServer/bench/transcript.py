@@ -0,0 +1,56 @@
+import random
+
+_handshake = [
+    b'<QR_G>',
+    b'<L>~PlayerA~1234~PlayerB~4321~ff585d509bf09ce1d2ff5d4226b7dacb',
+    b'<S>~<SETTINGS>~<LOADED>~5',
+    b'<S>~<SETTINGS>~<ARENA_SIZE>~large',
+    b'<S>~<SETTINGS>~<SQUADRON_SIZE>~large',
+    b'<S>~<SETTINGS>~<TIMER>~120000',
+    b'<S>~<SETTINGS>~<TOP_BOTTOM>~true',
+    b'<S>~<SETTINGS>~<COLOR>~3~0000FF',
+    b'<S>~<SETTINGS>~<READY_ON>~10~2~3~0000FF',
+]
+
+_powers = ['PLATEAU', 'HORIZONTAL_TRENCH', 'RECRUIT', 'DESTROY', 'ANGLE_MOVEMENT', 'SWAP', 'KAMIKAZE']
+
+
+def game_transcript(turns: int = 200, seed: int = 0) -> list[bytes]:
+    """
+    Generates frames of a match as sent by a single client, following
+    the shape of recorded traffic: a settings handshake followed by moves,
+    dominated by piece drags and grid coordinates.
+
+    Returns:
+        a list of frames (without the NUL terminator)
+    """
+    rnd = random.Random(seed)
+    frames = list(_handshake)
+    for turn in range(turns):
+        piece = rnd.randrange(40)
+        frames.append(b'<S>~<GRAB_PIECE>~%d' % piece)
+        for step in range(rnd.randrange(2, 6)):
+            frames.append(b'<S>~<NEW_GRID_CORD>~%d~%d~%d~%d' % (
+                piece, rnd.randrange(10), rnd.randrange(10), step))
+        frames.append(b'<S>~<RELEASE_PIECE>~%d' % piece)
+
+        if rnd.random() < 0.2:
+            frames.append(b'<S>~<JUMP_ON_PIECE_ANIMATION>~%d~%d' % (piece, rnd.randrange(40)))
+            frames.append(b'<S>~<REMOVE_PLAYER>~%d' % rnd.randrange(40))
+        if rnd.random() < 0.15:
+            frames.append(b'<S>~<GET_POWER_SQUARE>~%d~%d' % (rnd.randrange(100), piece))
+        if rnd.random() < 0.1:
+            frames.append(b'<S>~<USE_POWER>~%s~%d' % (rnd.choice(_powers).encode('ascii'), piece))
+            frames.append(b'<S>~<RECURSIVE_DONE>~%d' % piece)
+        if rnd.random() < 0.05:
+            frames.append(b'<S>~<CHAT>~PlayerA: gg')
+        if turn % 10 == 0:
+            frames.append(b'<S>~<ASSIGN_NEXT_POWER_COUNT>~%d' % rnd.randrange(1, 5))
+            frames.append(b'<S>~<ASSIGN_POWER_SQUARE>~%d~%d' % (rnd.randrange(30), rnd.randrange(100)))
+            frames.append(b'<SERVER>~<PING>')
+
+        frames.append(b'<S>~<SWITCH_PLAYER>~%d' % (turn % 2))
+
+    frames.append(b'<SERVER>~<STATS>~12~0~%d~large (default)~large (default)' % turns)
+    frames.append(b'<DISCONNECTED>')
+    return frames
@@ -1,11 +1,15 @@
 import abc
 import logging
-from asyncio import CancelledError, StreamWriter, StreamReader, IncompleteReadError, LimitOverrunError
+import time
+import asyncio
+from asyncio import CancelledError, StreamWriter, StreamReader
 from datetime import datetime, timezone
 from typing import Any, Callable, TypeVar, Type, AsyncIterable, Coroutine
 
 from QRServer.common import messages, utils
+from QRServer.common.frames import read_frames, FrameTooLargeError, FrameWriter, SlowConsumerError
 from QRServer.common.messages import ResponseMessage, RequestMessage, Message
+from QRServer.common.stats import message_stats
 from QRServer.config import Config
 from QRServer.db.connector import DbConnector
 from QRServer.db.models import DbUser
@@ -14,6 +18,9 @@ log = logging.getLogger('qr.client_handler')
 
 RMT = TypeVar('RMT', bound=RequestMessage)
 
+# Passed to the handlers when the connection is closed, as if the client had sent it
+_disconnected_data = b'<DISCONNECTED>'
+
 
 class ClientHandler(abc.ABC):
     connected_at: datetime
@@ -21,8 +28,10 @@ class ClientHandler(abc.ABC):
     connector: DbConnector
     reader: StreamReader
     writer: StreamWriter
+    frame_writer: FrameWriter
     handlers: dict[bytes, list[Callable[[list[bytes]], Coroutine]]]
     message_handlers: dict[type, list[Callable[[Any], Coroutine]]]
+    raw_handlers: dict[type, Callable[[bytes], Coroutine]]
     _username: str | None
 
     def __init__(self, config, connector, reader: StreamReader, writer: StreamWriter):
@@ -31,8 +40,10 @@ class ClientHandler(abc.ABC):
         self.connector = connector
         self.handlers = {}
         self.message_handlers = {}
+        self.raw_handlers = {}
         self.reader = reader
         self.writer = writer
+        self.frame_writer = FrameWriter(writer, config.max_queued_bytes.get())
         self._username = None
 
     @property
@@ -40,23 +51,16 @@ class ClientHandler(abc.ABC):
         return self._username
 
     async def _socket_read(self) -> AsyncIterable[bytes]:
-        while True:
-            try:
-                data = await self.reader.readuntil(b'\x00')
-            except (ConnectionError, CancelledError, IncompleteReadError):
-                data = None
-            except LimitOverrunError:
-                log.exception("Limit overrun error")
-                data = None
-
-            if not data:
-                log.debug(f'No more data to read from {self.username}, finishing')
-                yield b'<DISCONNECTED>'
-                return
-            elif data[-1] == 0:
-                data_elements = data.split(b'\x00')[:-1]
-                for i in data_elements:
-                    yield i
+        try:
+            async for data in read_frames(self.reader, self.config.max_frame_size.get()):
+                yield data
+        except (ConnectionError, CancelledError):
+            pass
+        except FrameTooLargeError:
+            log.exception(f'Frame too large received from {self.username}')
+
+        log.debug(f'No more data to read from {self.username}, finishing')
+        yield _disconnected_data
 
     def register_handler(self, prefix: bytes, handler):
         """Deprecated, do not use"""
@@ -71,23 +75,44 @@ class ClientHandler(abc.ABC):
         else:
             self.message_handlers[mtype] = [handler]
 
+    def register_raw_handler(self, mtype: Type[Message], handler: Callable[[bytes], Coroutine]):
+        """
+        Registers a handler which receives frames of the given type as raw bytes.
+        Such frames are only classified by their prefix and argc, they are neither
+        decoded nor validated. Frames containing non-ASCII bytes are still parsed
+        and passed to the message handlers instead.
+        """
+        self.raw_handlers[mtype] = handler
+
     async def run(self):
+        frame_writer_task = asyncio.create_task(self.frame_writer.run())
         try:
             await self._run()
         finally:
+            frame_writer_task.cancel()
             self.writer.close()
 
     async def _run(self):
         async for data in self._socket_read():
-            values = data.split(messages.delim.encode('ascii'))
-            prefix = values[0]
+            message = None
+            mtype = None
+            started_at = time.perf_counter()
+            try:
+                if self.raw_handlers and data.isascii():
+                    mtype = messages.get_message_type_from_data(data)
+                    raw_handler = self.raw_handlers.get(mtype)
+                    if raw_handler is not None:
+                        await raw_handler(data)
+                        continue
 
-            message = Message.from_data(data)
+                values = data.split(messages.delim_bytes)
+                prefix = values[0]
+
+                message = Message.from_data(data)
+                mtype = type(message) if message is not None else None
 
-            try:
                 if message is not None:
                     log.debug(f'Handling: {message} from {self.username}')
-                    mtype = type(message)
                     if mtype in self.message_handlers:
                         for handler in self.message_handlers[mtype]:
                             await handler(message)
@@ -110,21 +135,31 @@ class ClientHandler(abc.ABC):
                     log.exception(f'Unhandled send message exception to {e.username} in {self.username}\'s handler')
                 return
             except Exception:
-                log.exception(f'Error when processing message: {message}')
+                log.exception(f'Error when processing message: {message or data!r}')
                 return
+            finally:
+                # The disconnect is not a message the client has sent
+                if data is not _disconnected_data:
+                    message_stats.record_received(mtype, len(data), time.perf_counter() - started_at)
 
     async def send(self, data: bytes):
         """Deprecated, do not use"""
         log.warning(f'Using deprecated method to send {data!r}')
         log.debug(f'Sending {data!r} to {self.username}')
-        self.writer.write(data)
-        await self.writer.drain()
+        await self.send_data(data)
 
     async def send_msg(self, message: ResponseMessage):
         log.debug(f'Sending {message} to {self.username}')
+        await self.send_data(message.to_data())
+
+    async def send_data(self, data: bytes):
+        """Sends an already encoded, NUL-terminated frame"""
         try:
-            self.writer.write(message.to_data())
-            await self.writer.drain()
+            await self.frame_writer.send(data)
+            message_stats.record_sent(len(data))
+        except SlowConsumerError as e:
+            log.warning(f'Disconnecting slow client {self.username}: {e}')
+            raise SendMessageException(self.username) from e
         except ConnectionError as e:
             raise SendMessageException(self.username) from e
 
@@ -0,0 +1,160 @@
+import asyncio
+from asyncio import Future, StreamReader, StreamWriter
+from typing import AsyncIterator
+
+_chunk_size = 64 * 1024
+
+
+class FrameTooLargeError(Exception):
+    pass
+
+
+class SlowConsumerError(ConnectionError):
+    pass
+
+
+async def read_frames(reader: StreamReader, max_frame_size: int) -> AsyncIterator[bytes]:
+    """
+    Reads NUL-terminated frames from the stream. Everything that is available
+    is read at once, and all complete frames in the buffer are yielded
+    without waiting on the stream in between.
+
+    Frames are yielded without the NUL terminator. Incomplete data left
+    when the stream ends is discarded.
+
+    Raises:
+        FrameTooLargeError: when a frame exceeds max_frame_size bytes
+        ConnectionError: when the underlying connection fails
+    """
+    buffer = bytearray()
+    while True:
+        chunk = await reader.read(_chunk_size)
+        if not chunk:
+            return
+
+        scan_from = len(buffer)
+        buffer += chunk
+
+        start = 0
+        end = buffer.find(0, scan_from)
+        if end != -1:
+            view = memoryview(buffer)
+            try:
+                while end != -1:
+                    if end - start > max_frame_size:
+                        raise FrameTooLargeError(f'Frame of {end - start} bytes exceeds {max_frame_size} bytes')
+                    yield bytes(view[start:end])
+                    start = end + 1
+                    end = buffer.find(0, start)
+            finally:
+                view.release()
+            del buffer[:start]
+
+        if len(buffer) > max_frame_size:
+            raise FrameTooLargeError(f'Incomplete frame of {len(buffer)} bytes exceeds {max_frame_size} bytes')
+
+
+class FrameWriter:
+    """
+    Queues outgoing frames and writes them from a single task, so that frames
+    sent while the previous batch is being drained are joined into one write
+    followed by one drain.
+
+    The queue is bounded: when a client does not receive data fast enough and
+    the frames waiting for it exceed max_queued_bytes, it is treated as dead.
+    """
+    _writer: StreamWriter
+    _max_queued_bytes: int
+    _queue: list[bytes]
+    _queued_bytes: int
+    _queue_flushed: Future | None
+    _batch_flushed: Future | None
+    _queue_ready: asyncio.Event
+    _error: ConnectionError | None
+
+    def __init__(self, writer: StreamWriter, max_queued_bytes: int):
+        self._writer = writer
+        self._max_queued_bytes = max_queued_bytes
+        self._queue = []
+        self._queued_bytes = 0
+        self._queue_flushed = None
+        self._batch_flushed = None
+        self._queue_ready = asyncio.Event()
+        self._error = None
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._queued_bytes + self._writer.transport.get_write_buffer_size()
+
+    async def send(self, data: bytes):
+        """
+        Queues the frame and waits until the batch containing it is written and drained.
+
+        Raises:
+            SlowConsumerError: when the frames waiting for the client exceed the limit
+            ConnectionError: when the connection is closed or writing fails
+        """
+        if self._error is not None:
+            raise self._error
+
+        if self.pending_bytes + len(data) > self._max_queued_bytes:
+            error = SlowConsumerError(f'More than {self._max_queued_bytes} bytes waiting to be sent')
+            self.close(error)
+            raise error
+
+        if self._queue_flushed is None:
+            self._queue_flushed = asyncio.get_running_loop().create_future()
+        flushed = self._queue_flushed
+        self._queue.append(data)
+        self._queued_bytes += len(data)
+        self._queue_ready.set()
+        await asyncio.shield(flushed)
+
+    async def run(self):
+        try:
+            while True:
+                await self._queue_ready.wait()
+                self._queue_ready.clear()
+
+                batch, self._batch_flushed = self._queue, self._queue_flushed
+                self._queue, self._queue_flushed = [], None
+                self._queued_bytes = 0
+                if self._batch_flushed is None:
+                    continue
+
+                self._writer.write(b''.join(batch))
+                await self._writer.drain()
+                _set_result(self._batch_flushed)
+                self._batch_flushed = None
+        except ConnectionError as e:
+            self._fail(e)
+        finally:
+            self._fail(ConnectionResetError('Connection closed'))
+
+    def close(self, error: ConnectionError):
+        """Rejects queued and future frames with the given error, and closes the connection."""
+        self._fail(error)
+        self._writer.close()
+
+    def _fail(self, error: ConnectionError):
+        # The connection is not closed here, the failure is reported to the
+        # senders, and it is up to them to remove the client.
+        if self._error is None:
+            self._error = error
+        for flushed in (self._batch_flushed, self._queue_flushed):
+            if flushed is not None:
+                _set_exception(flushed, self._error)
+        self._queue, self._queue_flushed, self._batch_flushed = [], None, None
+        self._queued_bytes = 0
+
+
+def _set_result(future: Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _set_exception(future: Future, error: BaseException):
+    if not future.done():
+        future.set_exception(error)
+        # Mark the exception as retrieved, senders might have been cancelled in the meantime
+        future.exception()
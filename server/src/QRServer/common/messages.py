@@ -7,9 +7,12 @@ from QRServer.common import powers
 from QRServer.common.classes import GameResultHistory, MatchStats, RankingEntry, LobbyPlayer
 
 delim = '~'
+delim_bytes = delim.encode('ascii')
 
 
 class Message:
+    __slots__ = ('args',)
+
     message_type_id: int
     args: list[str]
     prefix: Sequence[str | None] | None = None
@@ -31,6 +34,25 @@ class Message:
         if not _valid(args, prefix, argc):
             raise ValueError(f"Invalid args for {self.__class__}: {args}")
 
+        self._validate_args()
+
+    def _validate_args(self) -> None:
+        """
+        Validates the values of the arguments, raises ValueError when they are invalid.
+        Arguments are converted lazily by the getters, so only the checks
+        deciding whether the message is valid at all belong here.
+        """
+        pass
+
+    @classmethod
+    def _from_parsed(cls, args: list[str]):
+        # Args produced by the parser are strings which already matched
+        # the prefix and argc of the class, only the values are validated.
+        message = cls.__new__(cls)
+        message.args = args
+        message._validate_args()
+        return message
+
     def to_data(self) -> bytes:
         return delim.join(self.args).encode('ascii', 'replace') + b'\x00'
 
@@ -63,10 +85,12 @@ class Message:
 
 
 class RequestMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class DisconnectRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 0
     prefix: list[str] = ['<DISCONNECTED>']
     argc = [1]
@@ -77,6 +101,8 @@ class DisconnectRequest(RequestMessage):
 
 
 class PolicyFileRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 1
     prefix: list[str] = ['<policy-file-request/>']
     argc = [1]
@@ -87,6 +113,8 @@ class PolicyFileRequest(RequestMessage):
 
 
 class HelloLobbyRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 2
     prefix: list[str] = ['<QR_L>']
     argc = [1]
@@ -100,6 +128,8 @@ class HelloLobbyRequest(RequestMessage):
 
 
 class JoinLobbyRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 3
     prefix: list[str] = ['<L>']
     argc = [3]
@@ -116,6 +146,8 @@ class JoinLobbyRequest(RequestMessage):
 
 
 class HelloGameRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 4
     prefix: list[str] = ['<QR_G>']
     argc = [1]
@@ -126,6 +158,8 @@ class HelloGameRequest(RequestMessage):
 
 
 class JoinGameRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 5
     prefix: list[str] = ['<L>']
     argc = [6]
@@ -151,6 +185,8 @@ class JoinGameRequest(RequestMessage):
 
 
 class ServerRecentRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 6
     prefix: list[str] = ['<SERVER>', '<RECENT>']
     argc = [2]
@@ -161,27 +197,29 @@ class ServerRecentRequest(RequestMessage):
 
 
 class ServerRankingRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 7
     prefix: list[str] = ['<SERVER>', '<RANKING>']
     argc = [4]
 
-    def __init__(self, args: list[str]) -> None:
-        super().__init__(args)
-        self._year = int(self.args[2])
-        self._month = int(self.args[3])
+    def _validate_args(self) -> None:
+        _check_int(self.args[2], self.args[3])
 
     @classmethod
     def new(cls, year: int, month: int):
         return cls([*cls.prefix, str(year), str(month)])
 
     def get_year(self) -> int:
-        return self._year
+        return int(self.args[2])
 
     def get_month(self) -> int:
-        return self._month
+        return int(self.args[3])
 
 
 class ServerAliveRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 8
     prefix: list[str] = ['<SERVER>', '<ALIVE?>']
     argc = [2]
@@ -192,6 +230,8 @@ class ServerAliveRequest(RequestMessage):
 
 
 class ServerPingRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 9
     prefix: list[str] = ['<SERVER>', '<PING>']
     argc = [2]
@@ -202,6 +242,8 @@ class ServerPingRequest(RequestMessage):
 
 
 class SetCommentRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 10
     prefix: list[str] = ['<SERVER>', '<COMMENT>']
     argc = [4]
@@ -218,6 +260,8 @@ class SetCommentRequest(RequestMessage):
 
 
 class AddStatsRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 11
     prefix: list[str] = ['<SERVER>', '<STATS>']
     argc = [7]
@@ -225,13 +269,8 @@ class AddStatsRequest(RequestMessage):
     grid_sizes = ['small', 'medium', 'large (default)', 'maximum']
     squadron_sizes = ['small', 'medium', 'large (default)', 'maximum']
 
-    def __init__(self, args: list[str]) -> None:
-        super().__init__(args)
-        self._owner_piece_count = int(self.args[2])
-        self._opponent_piece_count = int(self.args[3])
-        self._cycle_counter = int(self.args[4])
-        self._grid_size = self.args[5]
-        self._squadron_size = self.args[6]
+    def _validate_args(self) -> None:
+        _check_int(self.args[2], self.args[3], self.args[4])
 
     @classmethod
     def new(cls, owner_piece_count: int, opponent_piece_count, cycle_counter, grid_size, squadron_size):
@@ -241,31 +280,33 @@ class AddStatsRequest(RequestMessage):
             str(cycle_counter), grid_size, squadron_size])
 
     def get_owner_piece_count(self) -> int:
-        return self._owner_piece_count
+        return int(self.args[2])
 
     def get_opponent_piece_count(self) -> int:
-        return self._opponent_piece_count
+        return int(self.args[3])
 
     def get_cycle_counter(self) -> int:
-        return self._cycle_counter
+        return int(self.args[4])
 
     def get_grid_size(self) -> str:
-        return self._grid_size
+        return self.args[5]
 
     def get_squadron_size(self) -> str:
-        return self._squadron_size
+        return self.args[6]
 
     def to_stats(self) -> MatchStats:
         return MatchStats(
-            own_piece_count=self._owner_piece_count,
-            opponent_piece_count=self._opponent_piece_count,
-            cycle_counter=self._cycle_counter,
-            grid_size=self._grid_size,
-            squadron_size=self._squadron_size
+            own_piece_count=self.get_owner_piece_count(),
+            opponent_piece_count=self.get_opponent_piece_count(),
+            cycle_counter=self.get_cycle_counter(),
+            grid_size=self.get_grid_size(),
+            squadron_size=self.get_squadron_size()
         )
 
 
 class VoidScoreRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 12
     prefix: list[str] = ['<SERVER>', '<VOID>']
     argc = [2]
@@ -276,37 +317,33 @@ class VoidScoreRequest(RequestMessage):
 
 
 class NameTakenRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 13
     prefix: list[str] = ['<SERVER>', '<NAME_TAKEN?>']
     argc = [3]
 
-    def __init__(self, args: list[str]) -> None:
-        super().__init__(args)
-        self._name = self.args[2]
-
     @classmethod
     def new(cls, name: str):
         return cls([*cls.prefix, name])
 
     def get_name_to_check(self) -> str:
-        return self._name
+        return self.args[2]
 
 
 class ChangePasswordRequest(RequestMessage):
+    __slots__ = ()
+
     message_type_id = 14
     prefix: list[str] = ['<SERVER>', '<CHPW>']
     argc = [3]
 
-    def __init__(self, args: list[str]) -> None:
-        super().__init__(args)
-        self._new_password = self.args[2]
-
     @classmethod
     def new(cls, new_password: str):
         return cls([*cls.prefix, new_password])
 
     def get_new_password(self) -> str | None:
-        return self._new_password or None
+        return self.args[2] or None
 
 
 ################################################################################
@@ -314,20 +351,44 @@ class ChangePasswordRequest(RequestMessage):
 ################################################################################
 
 class ResponseMessage(Message):
-    pass
+    __slots__ = ()
 
 
-class CrossDomainPolicyAllowAllResponse(ResponseMessage):
-    message_type_id = 15
-    prefix: list[str] = ['<cross-domain-policy><allow-access-from domain="*" to-ports="*" /></cross-domain-policy>']
-    argc = [1]
+class ConstantResponseMessage(ResponseMessage):
+    """
+    A response without any arguments. Its only instance and its encoding
+    are created once, when the module is loaded, so they must not be modified.
+    """
+    __slots__ = ()
+
+    prefix: list[str]
+    data: bytes
+    _instance: 'ConstantResponseMessage'
+
+    @classmethod
+    def _freeze(cls):
+        cls._instance = cls(list(cls.prefix))
+        cls.data = Message.to_data(cls._instance)
 
     @classmethod
     def new(cls):
-        return cls(cls.prefix)
+        return cls._instance
+
+    def to_data(self) -> bytes:
+        return self.data
+
+
+class CrossDomainPolicyAllowAllResponse(ConstantResponseMessage):
+    __slots__ = ()
+
+    message_type_id = 15
+    prefix: list[str] = ['<cross-domain-policy><allow-access-from domain="*" to-ports="*" /></cross-domain-policy>']
+    argc = [1]
 
 
 class PlayerCountResponse(ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 16
     prefix: list[str] = ['<S>', '<SERVER>', '<PLAYERS_COUNT>']
     argc = [4]
@@ -338,6 +399,8 @@ class PlayerCountResponse(ResponseMessage):
 
 
 class BroadcastCommentResponse(ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 17
     prefix: list[str] = ['<B>', '<COMMENT>']
     argc = [4]
@@ -347,17 +410,17 @@ class BroadcastCommentResponse(ResponseMessage):
         return cls([*cls.prefix, str(who), comment])
 
 
-class OldSwfResponse(ResponseMessage):
+class OldSwfResponse(ConstantResponseMessage):
+    __slots__ = ()
+
     message_type_id = 18
     prefix: list[str] = ['<S>', '<SERVER>', '<OLD_SWF>']
     argc = [3]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
-
 
 class NameTakenResponse(ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 19
     prefix: list[str] = ['<S>', '<SERVER>', '<NAME_TAKEN>']
     argc = [4]
@@ -367,37 +430,33 @@ class NameTakenResponse(ResponseMessage):
         return cls([*cls.prefix, '<YES>' if taken else '<NO>'])
 
 
-class ServerAliveResponse(ResponseMessage):
+class ServerAliveResponse(ConstantResponseMessage):
+    __slots__ = ()
+
     message_type_id = 20
     prefix: list[str] = ['<S>', '<SERVER>', '<ALIVE>']
     argc = [3]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
 
+class LobbyDuplicateResponse(ConstantResponseMessage):
+    __slots__ = ()
 
-class LobbyDuplicateResponse(ResponseMessage):
     message_type_id = 21
     prefix: list[str] = ['<L>', '<DUPLICATE>']
     argc = [2]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
 
+class LobbyBadMemberResponse(ConstantResponseMessage):
+    __slots__ = ()
 
-class LobbyBadMemberResponse(ResponseMessage):
     message_type_id = 22
     prefix: list[str] = ['<L>', '<BAD_MEMBER>']
     argc = [2]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
-
 
 class LastLoggedResponse(ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 23
     prefix: list[str] = ['<S>', '<SERVER>', '<LAST_LOGGED>']
     argc = [6]
@@ -415,6 +474,8 @@ class LastLoggedResponse(ResponseMessage):
 
 
 class LastPlayedResponse(ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 24
     prefix: list[str] = ['<S>', '<SERVER>', '<LAST_PLAYED>']
     argc = [18]
@@ -449,6 +510,8 @@ class LastPlayedResponse(ResponseMessage):
 
 
 class ServerRankingThisMonthResponse(ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 25
     prefix: list[str] = ['<S>', '<SERVER>', '<RANKING(thisMonth)>']
     argc = [-1]
@@ -472,16 +535,19 @@ class ServerRankingThisMonthResponse(ResponseMessage):
 
 
 class LobbyStateResponse(ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 26
     prefix: list[str] = ['<L>']
     argc = [170]
+    _empty_player_args = ['<EMPTY>', '', '0', *(['0'] * 10)]
 
     @classmethod
-    def new(cls, players: list[LobbyPlayer]):
+    def new(cls, players: Sequence[LobbyPlayer | None]):
         return cls([*cls.prefix, *cls.__serialize_players(players)])
 
     @classmethod
-    def __serialize_players(cls, players: list[LobbyPlayer]) -> list[str]:
+    def __serialize_players(cls, players: Sequence[LobbyPlayer | None]) -> list[str]:
         to_serialize: list[LobbyPlayer | None] = list(players[0:13])
         while len(to_serialize) < 13:
             to_serialize.append(None)
@@ -490,8 +556,7 @@ class LobbyStateResponse(ResponseMessage):
     @classmethod
     def __serialize_player(cls, player: LobbyPlayer | None) -> list[str]:
         if player is None:
-            player = LobbyPlayer()
-            player.username = '<EMPTY>'
+            return cls._empty_player_args
         return [
             player.username,
             player.comment,
@@ -500,68 +565,58 @@ class LobbyStateResponse(ResponseMessage):
         ]
 
 
-class OpponentDeadResponse(ResponseMessage):
+class OpponentDeadResponse(ConstantResponseMessage):
+    __slots__ = ()
+
     message_type_id = 27
     prefix: list[str] = ['<S>', '<SERVER>', '<OPPDEAD>']
     argc = [3]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
 
+class VoidScoreResponse(ConstantResponseMessage):
+    __slots__ = ()
 
-class VoidScoreResponse(ResponseMessage):
     message_type_id = 28
     prefix: list[str] = ['<S>', '<SERVER>', '<VOID>']
     argc = [3]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
 
+class NameTakenResponseNo(ConstantResponseMessage):
+    __slots__ = ()
 
-class NameTakenResponseNo(ResponseMessage):
     message_type_id = 29
     prefix: list[str] = ['<S>', '<SERVER>', '<NAME_TAKEN>', '<NO>']
     argc = [4]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
 
+class NameTakenResponseYes(ConstantResponseMessage):
+    __slots__ = ()
 
-class NameTakenResponseYes(ResponseMessage):
     message_type_id = 30
     prefix: list[str] = ['<S>', '<SERVER>', '<NAME_TAKEN>', '<YES>']
     argc = [4]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
 
+class ChangePasswordResponseOk(ConstantResponseMessage):
+    __slots__ = ()
 
-class ChangePasswordResponseOk(ResponseMessage):
     message_type_id = 31
     prefix: list[str] = ['<S>', '<SERVER>', '<CHPW>', '<OK>']
     argc = [4]
 
-    @classmethod
-    def new(cls):
-        return cls(cls.prefix)
-
 
 ################################################################################
 # GENERIC MESSAGES
 ################################################################################
 
 class UsePowerMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 32
     prefix: list[str] = ['<S>', '<USE_POWER>']
     argc = [4, 5]
 
-    def __init__(self, args) -> None:
-        super().__init__(args)
-
+    def _validate_args(self) -> None:
         if not powers.is_valid(self.get_power_name()):
             raise ValueError('Invalid power: {power_name}')
 
@@ -583,6 +638,8 @@ class UsePowerMessage(RequestMessage, ResponseMessage):
 
 
 class GameChatMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 33
     prefix: list[str] = ['<S>', '<CHAT>']
     argc = [3]
@@ -596,6 +653,8 @@ class GameChatMessage(RequestMessage, ResponseMessage):
 
 
 class LobbyChatMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 34
     prefix: list[str] = ['<B>', '<CHAT>']
     argc = [4]
@@ -618,6 +677,8 @@ class LobbyChatMessage(RequestMessage, ResponseMessage):
 
 
 class GrabPieceMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 35
     prefix: list[str] = ['<S>', '<GRAB_PIECE>']
     argc = [3]
@@ -631,6 +692,8 @@ class GrabPieceMessage(RequestMessage, ResponseMessage):
 
 
 class ReleasePieceMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 36
     prefix: list[str] = ['<S>', '<RELEASE_PIECE>']
     argc = [3]
@@ -644,6 +707,8 @@ class ReleasePieceMessage(RequestMessage, ResponseMessage):
 
 
 class SwitchPlayerMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 37
     prefix: list[str] = ['<S>', '<SWITCH_PLAYER>']
     argc = [3]
@@ -657,6 +722,8 @@ class SwitchPlayerMessage(RequestMessage, ResponseMessage):
 
 
 class RecursiveDoneMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 38
     prefix: list[str] = ['<S>', '<RECURSIVE_DONE>']
     argc = [3]
@@ -670,6 +737,8 @@ class RecursiveDoneMessage(RequestMessage, ResponseMessage):
 
 
 class SwitcherooMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 39
     prefix: list[str] = ['<S>', '<SWITCHEROO>']
     argc = [6]
@@ -687,6 +756,8 @@ class SwitcherooMessage(RequestMessage, ResponseMessage):
 
 
 class RemoveOneWayWallMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 40
     prefix: list[str] = ['<S>', '<REMOVE_ONEWAY_WALL>']
     argc = [4]
@@ -704,6 +775,8 @@ class RemoveOneWayWallMessage(RequestMessage, ResponseMessage):
 
 
 class BankruptActionMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 41
     prefix: list[str] = ['<S>', '<BR_ANIMATION>']
     argc = [3]
@@ -721,6 +794,8 @@ class BankruptActionMessage(RequestMessage, ResponseMessage):
 
 
 class RemovePlayerMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 42
     prefix: list[str] = ['<S>', '<REMOVE_PLAYER>']
     argc = [3]
@@ -734,6 +809,8 @@ class RemovePlayerMessage(RequestMessage, ResponseMessage):
 
 
 class PowerNoEffectMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 43
     prefix: list[str] = ['<S>', '<NO_EFFECT_OPP>']
     argc = [3]
@@ -747,6 +824,8 @@ class PowerNoEffectMessage(RequestMessage, ResponseMessage):
 
 
 class NukeMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 44
     prefix: list[str] = ['<S>', '<NUKE>']
     argc = [2]
@@ -757,6 +836,8 @@ class NukeMessage(RequestMessage, ResponseMessage):
 
 
 class JumpOnPieceMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 45
     prefix: list[str] = ['<S>', '<JUMP_ON_PIECE_ANIMATION>']
     argc = [4]
@@ -773,6 +854,8 @@ class JumpOnPieceMessage(RequestMessage, ResponseMessage):
 
 
 class GetPowerSquareMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 46
     prefix: list[str] = ['<S>', '<GET_POWER_SQUARE>']
     argc = [4]
@@ -789,6 +872,8 @@ class GetPowerSquareMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsLoadedMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 47
     prefix: list[str] = ['<S>', '<SETTINGS>', '<LOADED>']
     argc = [4]
@@ -802,6 +887,8 @@ class SettingsLoadedMessage(RequestMessage, ResponseMessage):
 
 
 class AssignPowerSquareMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 48
     prefix: list[str] = ['<S>', '<ASSIGN_POWER_SQUARE>']
     argc = [4]
@@ -818,6 +905,8 @@ class AssignPowerSquareMessage(RequestMessage, ResponseMessage):
 
 
 class AssignNextPowerCountMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 49
     prefix: list[str] = ['<S>', '<ASSIGN_NEXT_POWER_COUNT>']
     argc = [3]
@@ -831,6 +920,8 @@ class AssignNextPowerCountMessage(RequestMessage, ResponseMessage):
 
 
 class NewGridCoordMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 50
     prefix: list[str] = ['<S>', '<NEW_GRID_CORD>']
     argc = [6]
@@ -853,6 +944,8 @@ class NewGridCoordMessage(RequestMessage, ResponseMessage):
 
 
 class ResignMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 51
     prefix: list[str] = ['<S>', '<SETTINGS>', '<RESIGN>']
     argc = [3]
@@ -863,6 +956,8 @@ class ResignMessage(RequestMessage, ResponseMessage):
 
 
 class ChallengeMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 52
     prefix: tuple[str, None, None, str] = ('<S>', None, None, '<SHALLWEPLAYAGAME?>')
     argc = [4]
@@ -879,6 +974,8 @@ class ChallengeMessage(RequestMessage, ResponseMessage):
 
 
 class ChallengeAuthMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 53
     prefix: tuple[str, None, None, str] = ('<S>', None, None, '<AUTHENTICATION>')
     argc = [5]
@@ -898,6 +995,8 @@ class ChallengeAuthMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsReadyOffMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 54
     prefix: list[str] = ['<S>', '<SETTINGS>', '<READY_OFF>']
     argc = [3]
@@ -908,15 +1007,15 @@ class SettingsReadyOffMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsArenaSizeMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 55
     prefix: list[str] = ['<S>', '<SETTINGS>', '<ARENA_SIZE>']
     argc = [4]
 
     valid_sizes = ['small', 'medium', '9x9', 'large', 'extraLarge']
 
-    def __init__(self, args) -> None:
-        super().__init__(args)
-
+    def _validate_args(self) -> None:
         if self.get_size() not in self.valid_sizes:
             raise ValueError(f'Invalid size: {self.get_size()}')
 
@@ -929,15 +1028,15 @@ class SettingsArenaSizeMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsSquadronSizeMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 56
     prefix: list[str] = ['<S>', '<SETTINGS>', '<SQUADRON_SIZE>']
     argc = [4]
 
     valid_sizes = ['small', 'medium', 'large', 'extraLarge']
 
-    def __init__(self, args) -> None:
-        super().__init__(args)
-
+    def _validate_args(self) -> None:
         if self.get_size() not in self.valid_sizes:
             raise ValueError(f'Invalid size: {self.get_size()}')
 
@@ -950,15 +1049,15 @@ class SettingsSquadronSizeMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsTimerMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 57
     prefix: list[str] = ['<S>', '<SETTINGS>', '<TIMER>']
     argc = [4]
 
     valid_times = [240000, 120000, 60000, 30000, 15000, 500000000]
 
-    def __init__(self, args) -> None:
-        super().__init__(args)
-
+    def _validate_args(self) -> None:
         if self.get_time() not in self.valid_times:
             raise ValueError(f'Invalid time: {self.get_time()}')
 
@@ -971,6 +1070,8 @@ class SettingsTimerMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsTopBottomMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 58
     prefix: list[str] = ['<S>', '<SETTINGS>', '<TOP_BOTTOM>']
     argc = [4]
@@ -984,6 +1085,8 @@ class SettingsTopBottomMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsColorMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 59
     prefix: list[str] = ['<S>', '<SETTINGS>', '<COLOR>']
     argc = [5]
@@ -1000,6 +1103,8 @@ class SettingsColorMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsReadyOnMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 60
     prefix: list[str] = ['<S>', '<SETTINGS>', '<READY_ON>']
     argc = [7]
@@ -1022,6 +1127,8 @@ class SettingsReadyOnMessage(RequestMessage, ResponseMessage):
 
 
 class SettingsReadyOnAgainMessage(RequestMessage, ResponseMessage):
+    __slots__ = ()
+
     message_type_id = 61
     prefix: list[str] = ['<S>', '<SETTINGS>', '<READY_ON>']
     argc = [3]
@@ -1052,19 +1159,75 @@ __message_classes: list[Type[Message]] = list(map(lambda member: member[1], __me
 __message_classes_mapping: dict[int, Type[Message]] = {msg.message_type_id: msg for msg in __message_classes}
 
 
+class _DispatchNode:
+    """
+    A node of the prefix trie used to classify messages.
+
+    Children are keyed by prefix tokens, wildcard (``None``) prefix tokens
+    are represented by a separate child. Classes whose prefix ends at this
+    node are stored by their argc along with their position in
+    ``__message_classes``, so that ambiguous messages resolve to the same
+    class as with a linear scan.
+    """
+    __slots__ = ('children', 'wildcard', 'terminals', 'variadic')
+
+    children: dict[str | bytes, '_DispatchNode']
+    wildcard: '_DispatchNode | None'
+    terminals: dict[int, tuple[int, Type[Message]]]
+    variadic: tuple[int, Type[Message]] | None
+
+    def __init__(self) -> None:
+        self.children = {}
+        self.wildcard = None
+        self.terminals = {}
+        self.variadic = None
+
+
+def _build_dispatch_index(classes: list[Type[Message]], encoded: bool = False) -> _DispatchNode:
+    root = _DispatchNode()
+    for order, clazz in enumerate(classes):
+        node = root
+        for token in clazz.prefix or []:
+            if token is None:
+                if node.wildcard is None:
+                    node.wildcard = _DispatchNode()
+                node = node.wildcard
+            else:
+                key = token.encode('ascii') if encoded else token
+                node = node.children.setdefault(key, _DispatchNode())
+
+        for argc in clazz.argc or []:
+            if argc == -1:
+                if node.variadic is None:
+                    node.variadic = (order, clazz)
+            else:
+                node.terminals.setdefault(argc, (order, clazz))
+    return root
+
+
+__message_dispatch_index: _DispatchNode = _build_dispatch_index(__message_classes)
+__message_dispatch_index_encoded: _DispatchNode = _build_dispatch_index(__message_classes, encoded=True)
+
+
 def _parse_data(data: str) -> Message | None:
     return _parse_args(data.split(delim))
 
 
 def _parse_args(args: list[str]) -> Message | None:
-    for clazz in __message_classes:
-        if _valid(args, clazz.prefix, clazz.argc):
-            try:
-                return clazz.from_args(args)
-            except ValueError:
-                return None
+    clazz = get_message_type_from_args(args)
+    if clazz is None:
+        return None
 
-    return None
+    try:
+        return clazz._from_parsed(args)
+    except ValueError:
+        return None
+
+
+def _check_int(*values: str) -> None:
+    # Only checks whether the values are numbers, they are converted by the getters when needed
+    for value in values:
+        int(value)
 
 
 def _valid(args: list[str], prefix: Sequence[str | None] | None, argc: list[int] | None) -> bool:
@@ -1083,3 +1246,55 @@ def _valid(args: list[str], prefix: Sequence[str | None] | None, argc: list[int]
 
 def get_message_type_from_id(message_type_id: int) -> Type[Message] | None:
     return __message_classes_mapping.get(message_type_id)
+
+
+def get_message_type_from_args(args: list[str]) -> Type[Message] | None:
+    """
+    Classifies the message by walking the prefix trie, the cost depends only
+    on the length of the matched prefix and not on the number of message classes.
+
+    Returns:
+        the message class matching the given args, or None if there is none
+    """
+    return _lookup_message_type(__message_dispatch_index, args)
+
+
+def get_message_type_from_data(data: bytes) -> Type[Message] | None:
+    """
+    Classifies a raw frame (without the NUL terminator) without decoding it.
+    Only the prefix and argc are checked, the message itself is not validated.
+
+    Returns:
+        the message class matching the given frame, or None if there is none
+    """
+    return _lookup_message_type(__message_dispatch_index_encoded, data.split(delim_bytes))
+
+
+def _lookup_message_type(index: _DispatchNode, args: Sequence[str | bytes]) -> Type[Message] | None:
+    argc = len(args)
+    best: tuple[int, Type[Message]] | None = None
+    nodes: list[tuple[_DispatchNode, int]] = [(index, 0)]
+    while nodes:
+        node: _DispatchNode | None
+        node, depth = nodes.pop()
+        while node is not None:
+            candidate = node.terminals.get(argc)
+            if candidate is not None and (best is None or candidate[0] < best[0]):
+                best = candidate
+            candidate = node.variadic
+            if candidate is not None and (best is None or candidate[0] < best[0]):
+                best = candidate
+
+            if depth >= argc:
+                break
+            if node.wildcard is not None:
+                nodes.append((node.wildcard, depth + 1))
+            node = node.children.get(args[depth])
+            depth += 1
+
+    return best[1] if best is not None else None
+
+
+for __constant_class in __message_classes:
+    if issubclass(__constant_class, ConstantResponseMessage):
+        __constant_class._freeze()
@@ -0,0 +1,118 @@
+import bisect
+
+latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+handling_latency_buckets = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.1, 1.0)
+
+
+class Histogram:
+    """
+    Counts observed values in buckets with fixed upper bounds, the last
+    bucket collects everything above the largest bound.
+    """
+    bounds: tuple[float, ...]
+    counts: list[int]
+    count: int
+    sum: float
+
+    def __init__(self, bounds: tuple[float, ...] = latency_buckets):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list[tuple[str, int]]:
+        """
+        Returns:
+            a list of (upper bound, number of values less than or equal to it) pairs, \
+            ending with the '+Inf' bound
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else str(bound), total))
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(self.cumulative_counts()),
+        }
+
+
+class MessageStats:
+    """
+    Statistics of the messages handled by all clients of the process.
+
+    The handling latency is the wall-clock time from reading a message until its handlers return.
+    It includes waiting for sends, password hashing and database queries, and the other tasks
+    running meanwhile, so it is not the CPU cost of the handlers.
+    """
+    received_count: dict[str, int]
+    received_bytes: dict[str, int]
+    handling_latency: dict[str, Histogram]
+    sent_count: int
+    sent_bytes: int
+
+    def __init__(self):
+        self.received_count = {}
+        self.received_bytes = {}
+        self.handling_latency = {}
+        self.sent_count = 0
+        self.sent_bytes = 0
+
+    def record_received(self, mtype: type | None, size: int, latency: float):
+        name = mtype.__name__ if mtype is not None else 'unknown'
+        histogram = self.handling_latency.get(name)
+        if histogram is None:
+            histogram = self.handling_latency[name] = Histogram(handling_latency_buckets)
+            self.received_count[name] = 0
+            self.received_bytes[name] = 0
+        self.received_count[name] += 1
+        self.received_bytes[name] += size
+        histogram.observe(latency)
+
+    def record_sent(self, size: int):
+        self.sent_count += 1
+        self.sent_bytes += size
+
+    def to_prometheus(self) -> list[str]:
+        lines = [
+            '# TYPE qr_messages_received_total counter',
+            *(f'qr_messages_received_total{{type="{name}"}} {count}'
+              for name, count in sorted(self.received_count.items())),
+            '# TYPE qr_received_bytes_total counter',
+            *(f'qr_received_bytes_total{{type="{name}"}} {size}'
+              for name, size in sorted(self.received_bytes.items())),
+            '# TYPE qr_messages_sent_total counter',
+            f'qr_messages_sent_total {self.sent_count}',
+            '# TYPE qr_sent_bytes_total counter',
+            f'qr_sent_bytes_total {self.sent_bytes}',
+            '# TYPE qr_message_handling_latency_seconds histogram',
+        ]
+        for name, histogram in sorted(self.handling_latency.items()):
+            lines += prometheus_histogram('qr_message_handling_latency_seconds', histogram, f'type="{name}"')
+        return lines
+
+
+message_stats = MessageStats()
+
+
+def prometheus_histogram(name: str, histogram: Histogram, labels: str = '') -> list[str]:
+    """
+    Returns:
+        lines of the histogram samples in the Prometheus text format, without the TYPE line
+    """
+    prefix = f'{labels},' if labels else ''
+    suffix = f'{{{labels}}}' if labels else ''
+    return [
+        *(f'{name}_bucket{{{prefix}le="{bound}"}} {count}' for bound, count in histogram.cumulative_counts()),
+        f'{name}_sum{suffix} {histogram.sum}',
+        f'{name}_count{suffix} {histogram.count}',
+    ]
@@ -0,0 +1,73 @@
+import math
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+
+
+class TimerWheel(Generic[K]):
+    """
+    Deadlines grouped into slots of tick seconds, so that all entries which are
+    due are collected at once, instead of keeping a timer for each of them.
+
+    Deadlines further than a full turn of the wheel stay in their slot until
+    the turn in which they are due. Time is whatever clock the owner passes,
+    usually the event loop time.
+    """
+    tick: float
+    _slots: list[dict[K, float]]
+    _slot_idxs: dict[K, int]
+    _current_tick: int
+
+    def __init__(self, tick: float, slot_count: int, now: float):
+        self.tick = tick
+        self._slots = [{} for _ in range(slot_count)]
+        self._slot_idxs = {}
+        self._current_tick = int(now // tick)
+
+    def __len__(self) -> int:
+        return len(self._slot_idxs)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._slot_idxs
+
+    def schedule(self, key: K, deadline: float):
+        """Schedules the key, replacing its previous deadline"""
+        self.cancel(key)
+        # The slot is visited once the deadline has passed,
+        # deadlines in the past expire on the next advance
+        tick = max(math.ceil(deadline / self.tick), self._current_tick + 1)
+        slot_idx = tick % len(self._slots)
+        self._slots[slot_idx][key] = deadline
+        self._slot_idxs[key] = slot_idx
+
+    def cancel(self, key: K) -> bool:
+        """
+        Returns:
+            whether the key was scheduled
+        """
+        slot_idx = self._slot_idxs.pop(key, None)
+        if slot_idx is None:
+            return False
+        del self._slots[slot_idx][key]
+        return True
+
+    def advance(self, now: float) -> list[K]:
+        """
+        Moves the wheel to the given time.
+
+        Returns:
+            the keys which are due, they are no longer scheduled
+        """
+        target_tick = int(now // self.tick)
+        # After a full turn every slot has been visited
+        tick_count = min(target_tick - self._current_tick, len(self._slots))
+        expired = []
+        for tick in range(self._current_tick + 1, self._current_tick + tick_count + 1):
+            slot = self._slots[tick % len(self._slots)]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self._slot_idxs[key]
+            expired.extend(due)
+        self._current_tick = max(self._current_tick, target_tick)
+        return expired
@@ -67,6 +67,12 @@ class Config:
             description='directory to store data',
             default_value='data',
             onchange=config_handlers.create_data_dir)
+        self.data_read_connections = ConfigKey(
+            config=self,
+            name='data.read_connections',
+            cli_args=[],
+            description='number of read-only database connections, reads use the write connection when 0',
+            default_value=4)
 
         self.log_long = ConfigKey(
             config=self,
@@ -88,6 +94,18 @@ class Config:
             cli_args=[],
             description='enable periodic state logging and set the delay in seconds (set to 0 to disable)',
             default_value=5 * 60)
+        self.max_frame_size = ConfigKey(
+            config=self,
+            name='connection.max_frame_size',
+            cli_args=[],
+            description='maximum size in bytes of a single message received from a client',
+            default_value=64 * 1024)
+        self.max_queued_bytes = ConfigKey(
+            config=self,
+            name='connection.max_queued_bytes',
+            cli_args=[],
+            description='maximum size in bytes of data waiting to be sent to a client before it is disconnected',
+            default_value=256 * 1024)
         self.auth_disable = ConfigKey(
             config=self,
             name='auth.disable',
@@ -100,6 +118,24 @@ class Config:
             cli_args=['--auto-register'],
             description='automatically register a user upon first login attempt',
             default_value=False)
+        self.password_hash_workers = ConfigKey(
+            config=self,
+            name='auth.password_hash_workers',
+            cli_args=[],
+            description='maximum number of passwords hashed or verified at once',
+            default_value=4)
+        self.credential_cache_ttl = ConfigKey(
+            config=self,
+            name='auth.credential_cache_ttl',
+            cli_args=[],
+            description='time in seconds for which verified credentials are remembered, 0 disables the cache',
+            default_value=300)
+        self.credential_cache_size = ConfigKey(
+            config=self,
+            name='auth.credential_cache_size',
+            cli_args=[],
+            description='maximum number of users whose verified credentials are remembered',
+            default_value=1024)
         self.leaderboards_ranked_only = ConfigKey(
             config=self,
             name='leaderboards.ranked_only',
@@ -118,6 +154,31 @@ class Config:
             cli_args=[],
             description='welcome message sent after joining the lobby',
             default_value='')
+        self.lobby_max_rooms = ConfigKey(
+            config=self,
+            name='lobby.max_rooms',
+            cli_args=[],
+            description='how many lobby rooms of 13 players are opened before the oldest player is kicked',
+            default_value=1)
+        self.game_workers = ConfigKey(
+            config=self,
+            name='game.workers',
+            cli_args=[],
+            description='how many processes relay games, 0 relays them in the main process',
+            default_value=0)
+        self.game_opponent_timeout_sec = ConfigKey(
+            config=self,
+            name='game.opponent_timeout_sec',
+            cli_args=[],
+            description='how long a player waits for the opponent to join the game before being disconnected, '
+                        '0 waits until the player leaves',
+            default_value=60)
+        self.game_max_pending_forward_bytes = ConfigKey(
+            config=self,
+            name='game.max_pending_forward_bytes',
+            cli_args=[],
+            description='maximum size in bytes of messages kept for the opponent until they join the game',
+            default_value=16 * 1024)
         self.origin = ConfigKey(
             config=self,
             name='origin',
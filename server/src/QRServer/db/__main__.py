@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+import logging
+
+from QRServer import config_handlers
+from QRServer.config import Config
+from QRServer.db.connector import create_connector
+
+log = logging.getLogger('qr.db')
+
+
+async def rebuild_rankings(config: Config):
+    connector = await create_connector(config)
+    try:
+        months = await connector.rebuild_rankings()
+    finally:
+        await connector.close()
+    log.info(f'Rebuilt rankings of {months} months')
+
+
+async def main():
+    config = Config()
+    config_handlers.refresh_logger_configuration(config)
+    parser = argparse.ArgumentParser(description='Database maintenance, run while the server is stopped')
+    parser.add_argument('command', choices=['rebuild-rankings'],
+                        help='rebuild-rankings: recompute the monthly statistics and rankings from all match results')
+    config.setup_argparse(parser)
+    args = parser.parse_args()
+    config.load_from_args(args)
+
+    if args.command == 'rebuild-rankings':
+        await rebuild_rankings(config)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,9 +1,13 @@
-from asyncio import Lock
+import asyncio
+from asyncio import Lock, Queue
 import contextlib
 import logging
 import os
+import pathlib
+import sqlite3
 import uuid
 from datetime import datetime, timezone
+from typing import Callable, TypeVar
 
 from QRServer.config import Config
 import aiosqlite
@@ -11,28 +15,74 @@ import aiosqlite
 from QRServer.common.classes import GameResultHistory, RankingEntry
 from QRServer.common import utils
 from QRServer.db import migrations
+from QRServer.db.common import UpdateCollisionError, retry_on_update_collision
 from QRServer.db.models import DbUser, DbMatchReport, TournamentDuel, TournamentMatch, TournamentParticipant, \
     Tournament, UserRating
-from QRServer.db.password import password_verify, password_hash
+from QRServer.db.password import CredentialCache, PasswordHasher
 
 log = logging.getLogger('qr.dbconnector')
 
+T = TypeVar('T')
+
+# Queries are kept as constants, so that the same statement text is used every time
+# and SQLite reuses the statement prepared and cached on the connection
+_USER_COLUMNS = (
+    "u.id, u.username, u.password, u.created_at, u.discord_user_id,"
+    " b.banned_at, b.ban_reason")
+_SELECT_USER = (
+    "select " + _USER_COLUMNS +
+    " from users u"
+    " left join bans b on u.id = b.user_id")
+_SELECT_USER_BY_ID = _SELECT_USER + " where u.id = ?"
+_SELECT_USER_BY_USERNAME = _SELECT_USER + " where u.username = ?"
+_SELECT_USERS_BY_DISCORD_ID = _SELECT_USER + " where u.discord_user_id = ?"
+
+_MATCH_REPORT_COLUMNS = (
+    "m.id, r.winner_id, r.loser_id, r.winner_pieces_left,"
+    " r.loser_pieces_left, r.move_counter, r.grid_size,"
+    " r.squadron_size, m.started_at, r.finished_at, m.is_ranked,"
+    " r.is_void")
+
+_SELECT_MATCH_RESULT = (
+    "select"
+    " u1.username,"
+    " u2.username,"
+    " r.winner_pieces_left,"
+    " r.loser_pieces_left,"
+    " m.started_at,"
+    " r.finished_at,"
+    " r.move_counter"
+    " from matches m"
+    " left join match_results r on m.id = r.match_id"
+    " left join users u1 on r.winner_id = u1.id"
+    " left join users u2 on r.loser_id = u2.id")
+
 
 class DbConnector:
     conn: aiosqlite.Connection
+    _read_conns: list[aiosqlite.Connection]
+    _read_pool: Queue[aiosqlite.Connection]
+    _write_task: asyncio.Task | None
 
     def __init__(self, file, config: Config):
         self.file = file
         self.config = config
         self._db_write_lock = Lock()  # A way to enforce that only one transaction is active at a time
+        self._write_task = None  # The task in a write transaction
+        self._read_conns = []
+        self._read_pool = Queue()
+        self._password_hasher = PasswordHasher(config.password_hash_workers.get())
+        self._credential_cache = CredentialCache(config.credential_cache_ttl.get(), config.credential_cache_size.get())
 
     @contextlib.asynccontextmanager
     async def _transaction(self, mode: str = "r"):
         if mode == "r":
-            yield await self.conn.cursor()
+            async with self._read_connection() as conn:
+                yield await conn.cursor()
         else:
             async with self._db_write_lock:
                 await self.conn.execute("BEGIN")
+                self._write_task = asyncio.current_task()
                 try:
                     yield await self.conn.cursor()
                 except BaseException:
@@ -40,94 +90,73 @@ class DbConnector:
                     raise
                 else:
                     await self.conn.execute("COMMIT")
+                finally:
+                    self._write_task = None
+
+    @contextlib.asynccontextmanager
+    async def _read_connection(self):
+        # Reads made during a write transaction have to see its changes
+        if not self._read_conns or self._write_task is asyncio.current_task():
+            yield self.conn
+            return
+
+        read_conn = await self._read_pool.get()
+        try:
+            yield read_conn
+        finally:
+            self._read_pool.put_nowait(read_conn)
+
+    async def _fetch_one(self, sql: str, parameters: tuple, mapper: Callable[[sqlite3.Row], T]) -> T | None:
+        rows = await self._fetch_all(sql, parameters, mapper)
+        return rows[0] if rows else None
+
+    async def _fetch_all(self, sql: str, parameters: tuple, mapper: Callable[[sqlite3.Row], T]) -> list[T]:
+        # Executing and fetching in one call to the connection's thread, instead of one call per step
+        async with self._read_connection() as conn:
+            rows = await conn.execute_fetchall(sql, parameters)
+        return [mapper(row) for row in rows]
 
     async def connect(self):
         self.conn = await aiosqlite.connect(self.file, autocommit=True)
+        if self._is_file_database():
+            # Readers do not block the writer in WAL mode, nor the writer blocks readers
+            await self.conn.execute("pragma journal_mode = wal")
+            await self.conn.execute("pragma synchronous = normal")
         async with self._transaction("w") as c:
             await migrations.setup_metadata(c)
 
         await migrations.execute_migrations(self._transaction, self.config)
 
+        if self._is_file_database():
+            uri = f'{pathlib.Path(self.file).absolute().as_uri()}?mode=ro'
+            for _ in range(self.config.data_read_connections.get()):
+                read_conn = await aiosqlite.connect(uri, uri=True, autocommit=True)
+                self._read_conns.append(read_conn)
+                self._read_pool.put_nowait(read_conn)
+
+    def _is_file_database(self) -> bool:
+        # Every connection to an in-memory database opens a separate database
+        return self.file != ':memory:' and not str(self.file).startswith('file:')
+
     async def close(self):
+        for read_conn in self._read_conns:
+            await read_conn.close()
+        self._read_conns = []
         await self.conn.close()
+        self._password_hasher.close()
 
     async def get_user(self, user_id: str) -> DbUser | None:
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select id, username, password, created_at, discord_user_id,"
-                " banned_at, ban_reason"
-                " from users u"
-                " left join bans b on u.id = b.user_id where u.id = ?", (
-                    user_id,
-                ))
-            row = await c.fetchone()
-            if row is None:
-                return None
-
-            return DbUser(
-                user_id=row[0],
-                username=row[1],
-                password=row[2],
-                created_at=row[3],
-                discord_user_id=row[4],
-                banned_at=timestamp_to_datetime(row[5]),
-                ban_reason=row[6],
-            )
+        return await self._fetch_one(_SELECT_USER_BY_ID, (user_id,), _user_from_row)
 
     async def get_user_by_username(self, username) -> DbUser | None:
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select id, username, password, created_at, discord_user_id,"
-                " banned_at, ban_reason"
-                " from users u"
-                " left join bans b on u.id = b.user_id"
-                " where username = ?", (
-                    username,
-                ))
-            row = await c.fetchone()
-            if row is None:
-                return None
-            return DbUser(
-                user_id=row[0],
-                username=row[1],
-                password=row[2],
-                created_at=row[3],
-                discord_user_id=row[4],
-                banned_at=timestamp_to_datetime(row[5]),
-                ban_reason=row[6],
-            )
+        return await self._fetch_one(_SELECT_USER_BY_USERNAME, (username,), _user_from_row)
 
     async def get_users_by_discord_id(self, discord_user_id: str) -> list[DbUser]:
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select id, username, password, created_at, discord_user_id,"
-                " banned_at, ban_reason"
-                " from users u"
-                " left join bans b on u.id = b.user_id"
-                " where discord_user_id = ?", (
-                    discord_user_id,
-                ))
-            rows = await c.fetchall()
-            if rows is None:
-                return []
-            result = []
-
-            for row in rows:
-                result.append(
-                    DbUser(
-                        user_id=row[0],
-                        username=row[1],
-                        password=row[2],
-                        created_at=row[3],
-                        discord_user_id=row[4],
-                        banned_at=timestamp_to_datetime(row[5]),
-                        ban_reason=row[6],
-                    )
-                )
-            return result
+        return await self._fetch_all(_SELECT_USERS_BY_DISCORD_ID, (discord_user_id,), _user_from_row)
 
     async def create_member(self, username: str, password: bytes, discord_user_id: str | None = None) -> str:
         id_ = str(uuid.uuid4())
+        hashed_password = await self._password_hasher.hash(password) if password else None
         async with self._transaction("w") as c:
             await c.execute(
                 "insert into users("
@@ -135,7 +164,7 @@ class DbConnector:
                 ") values (?, ?, ?, ?, ?)", (
                     id_,
                     username,
-                    password_hash(password) if password else None,
+                    hashed_password,
                     datetime.now(timezone.utc).timestamp(),
                     discord_user_id,
                 ))
@@ -143,7 +172,10 @@ class DbConnector:
 
     async def authenticate_user(self, username: str, password: bytes | None, auto_create=False,
                                 verify_password=True) -> DbUser | None:
-        if auto_create:
+        db_user = await self.get_user_by_username(username)
+        if db_user is None and auto_create:
+            # Hashing is slow, the password is hashed only when the user has to be created
+            hashed_password = await self._password_hasher.hash(password) if password else None
             async with self._transaction("w") as c:
                 await c.execute(
                     "insert or ignore into users("
@@ -151,58 +183,74 @@ class DbConnector:
                     ") values (?, ?, ?, ?, ?)", (
                         str(uuid.uuid4()),
                         username,
-                        password_hash(password) if password else None,
+                        hashed_password,
                         datetime.now(timezone.utc).timestamp(),
                         None
                     )
                 )
+            # Another connection might have created the user in the meantime, then the insert was ignored
+            db_user = await self.get_user_by_username(username)
 
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select id, username, password, created_at, discord_user_id,"
-                " banned_at, ban_reason"
-                " from users u"
-                " left join bans b on u.id = b.user_id"
-                " where username = ?",
-                (username,))
+        if db_user is None:
+            return None
 
-            row = await c.fetchone()
-            if row is None:
-                return None
+        if not db_user.is_guest and verify_password and not await self._verify_password(db_user, password):
+            return None
 
-            db_user = DbUser(
-                user_id=row[0],
-                username=row[1],
-                password=row[2],
-                created_at=row[3],
-                discord_user_id=row[4],
-                banned_at=timestamp_to_datetime(row[5]),
-                ban_reason=row[6],
-            )
+        return db_user
 
-            if not db_user.is_guest and verify_password and not password_verify(password, db_user.password):
-                return None
+    async def _verify_password(self, db_user: DbUser, password: bytes | None) -> bool:
+        if not password or not db_user.password:
+            return False
+        if self._credential_cache.contains(db_user.user_id, password, db_user.password):
+            return True
 
-            return db_user
+        if not await self._password_hasher.verify(password, db_user.password):
+            return False
+        self._credential_cache.add(db_user.user_id, password, db_user.password)
+        return True
 
     async def change_user_password(self, user_id: str, password: bytes | None):
+        hashed_password = await self._password_hasher.hash(password) if password else None
         async with self._transaction("w") as c:
             await c.execute(
                 "update users set password = ? where id = ?", (
-                    password_hash(password) if password else None,
+                    hashed_password,
                     user_id
                 ))
+        self._credential_cache.invalidate(user_id)
 
     async def claim_member(self, user_id: str, password: bytes | None, discord_user_id: str):
+        hashed_password = await self._password_hasher.hash(password) if password else None
         async with self._transaction("w") as c:
             await c.execute(
                 "update users set password = ?, discord_user_id = ? where id = ? and password is null", (
-                    password_hash(password) if password else None,
+                    hashed_password,
                     discord_user_id,
                     user_id,
                 ))
+        self._credential_cache.invalidate(user_id)
 
+    @retry_on_update_collision()
     async def add_match_result(self, match_result: DbMatchReport):
+        """
+        Records the match with the statistics, ratings and ranking of the month in one transaction,
+        so that the match is recorded either completely or not at all.
+
+        Raises:
+            UpdateCollisionError: when the ratings keep being changed by other matches
+        """
+        ranked_only = self.config.leaderboards_ranked_only.get()
+        include_void = self.config.leaderboards_include_void.get()
+        counts_for_ranking = \
+            (match_result.is_ranked or not ranked_only) and (not match_result.is_void or include_void)
+
+        year, month = match_result.finished_at.year, match_result.finished_at.month
+        rating_updates = []
+        if counts_for_ranking:
+            rating_updates = await self._compute_users_rating(
+                match_result.winner_id, match_result.loser_id, month, year)
+
         async with self._transaction("w") as c:
             user_1, user_2 = sorted((match_result.winner_id, match_result.loser_id))
 
@@ -251,114 +299,96 @@ class DbConnector:
                     match_result.is_void,
                 ))
 
-            start_date, end_date = utils.make_month_dates(
-                month=match_result.finished_at.month, year=match_result.finished_at.year)
-
-            ranked_only = self.config.leaderboards_ranked_only.get()
-            include_void = self.config.leaderboards_include_void.get()
+            if counts_for_ranking:
+                await c.executemany(
+                    "insert into user_monthly_stats ("
+                    "  user_id,"
+                    "  year,"
+                    "  month,"
+                    "  wins,"
+                    "  total_games"
+                    ") values ("
+                    "?, ?, ?, ?, 1"
+                    ") on conflict(year, month, user_id) do update set"
+                    " wins = wins + excluded.wins,"
+                    " total_games = total_games + 1", (
+                        (match_result.winner_id, year, month, 1),
+                        (match_result.loser_id, year, month, 0),
+                    ))
 
-        if (match_result.is_ranked or not ranked_only) and (not match_result.is_void or include_void):
-            await self._update_users_rating(
-                match_result.winner_id, match_result.loser_id,
-                match_result.finished_at.month, match_result.finished_at.year)
+                await self._write_users_rating(c, rating_updates)
+                await self._update_ranking(c, year=year, month=month)
 
-        new_ranking = await self._generate_ranking(
-            start_date, end_date)
+    async def enqueue_match_result(self, match_result: DbMatchReport):
+        """Stores the match result until it is recorded with add_match_result"""
+        async with self._transaction("w") as c:
+            await c.execute(
+                "insert into pending_match_results ("
+                "  match_id,"
+                "  winner_id,"
+                "  loser_id,"
+                "  winner_pieces_left,"
+                "  loser_pieces_left,"
+                "  move_counter,"
+                "  grid_size,"
+                "  squadron_size,"
+                "  started_at,"
+                "  finished_at,"
+                "  is_ranked,"
+                "  is_void"
+                ") values ("
+                "?, ?, ?, ?, ?, ?,"
+                "?, ?, ?, ?, ?, ?"
+                ")", (
+                    match_result.match_id,
+                    match_result.winner_id,
+                    match_result.loser_id,
+                    match_result.winner_pieces_left,
+                    match_result.loser_pieces_left,
+                    match_result.move_counter,
+                    match_result.grid_size,
+                    match_result.squadron_size,
+                    match_result.started_at.timestamp(),
+                    match_result.finished_at.timestamp(),
+                    match_result.is_ranked,
+                    match_result.is_void,
+                ))
 
-        await self._update_ranking(new_ranking, year=start_date.year, month=start_date.month)
+    async def get_pending_match_results(self) -> list[tuple[int, DbMatchReport]]:
+        """
+        Returns:
+            list: (pending id, match result) pairs in the order they were enqueued
+        """
+        return await self._fetch_all(
+            "select match_id, winner_id, loser_id, winner_pieces_left,"
+            " loser_pieces_left, move_counter, grid_size,"
+            " squadron_size, started_at, finished_at, is_ranked,"
+            " is_void, id"
+            " from pending_match_results"
+            " order by id", (), lambda row: (row[12], _match_report_from_row(row)))
+
+    async def remove_pending_match_result(self, pending_id: int):
+        async with self._transaction("w") as c:
+            await c.execute("delete from pending_match_results where id = ?", (pending_id,))
 
     async def get_match(self, match_id: str) -> DbMatchReport | None:
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select id, winner_id, loser_id, winner_pieces_left,"
-                " loser_pieces_left, move_counter, grid_size,"
-                " squadron_size, m.started_at, finished_at, m.is_ranked,"
-                " is_void"
-                " from matches m"
-                " left join match_results r on m.id = r.match_id"
-                " where id = ?", (
-                    match_id,
-                ))
-            row = await c.fetchone()
-            if row is None:
-                return None
-            return DbMatchReport(
-                match_id=row[0],
-                winner_id=row[1],
-                loser_id=row[2],
-                winner_pieces_left=row[3],
-                loser_pieces_left=row[4],
-                move_counter=row[5],
-                grid_size=row[6],
-                squadron_size=row[7],
-                started_at=datetime.fromtimestamp(row[8], tz=timezone.utc),
-                finished_at=datetime.fromtimestamp(row[9], tz=timezone.utc),
-                is_ranked=bool(row[10]),
-                is_void=bool(row[11]),
-            )
+        return await self._fetch_one(
+            "select " + _MATCH_REPORT_COLUMNS +
+            " from matches m"
+            " left join match_results r on m.id = r.match_id"
+            " where m.id = ?", (match_id,), _match_report_from_row)
 
     async def get_match_result(self, match_id: str) -> GameResultHistory | None:
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select"
-                " u1.username,"
-                " u2.username,"
-                " r.winner_pieces_left,"
-                " r.loser_pieces_left,"
-                " m.started_at,"
-                " r.finished_at,"
-                " r.move_counter"
-                " from matches m"
-                " left join match_results r on m.id = r.match_id"
-                " left join users u1 on r.winner_id = u1.id"
-                " left join users u2 on r.loser_id = u2.id"
-                " where m.id = ?", (match_id,))
-
-            row = await c.fetchone()
-            if row is None:
-                return None
-            return GameResultHistory(
-                player_won=row[0],
-                player_lost=row[1],
-                won_score=row[2],
-                lost_score=row[3],
-                start=datetime.fromtimestamp(row[4], tz=timezone.utc),
-                finish=datetime.fromtimestamp(row[5], tz=timezone.utc),
-                moves=row[6],
-            )
+        return await self._fetch_one(
+            _SELECT_MATCH_RESULT + " where m.id = ?", (match_id,), _match_result_from_row)
 
     async def get_recent_matches(self, count=15) -> list[GameResultHistory]:
-        async with self._transaction("r") as c:
-            # Gets all recent matches, minus void ones
-            await c.execute("select"
-                            " u1.username,"
-                            " u2.username,"
-                            " r.winner_pieces_left,"
-                            " r.loser_pieces_left,"
-                            " m.started_at,"
-                            " r.finished_at,"
-                            " r.move_counter"
-                            " from matches m"
-                            " left join match_results r on m.id = r.match_id"
-                            " left join users u1 on r.winner_id = u1.id"
-                            " left join users u2 on r.loser_id = u2.id"
-                            " where r.is_void = 0"
-                            " order by r.finished_at desc"
-                            " limit ?", (count,))
-
-            recent_matches = []
-            rows = await c.fetchall()
-            for row in rows:
-                recent_matches.append(GameResultHistory(
-                    player_won=row[0],
-                    player_lost=row[1],
-                    won_score=row[2],
-                    lost_score=row[3],
-                    start=datetime.fromtimestamp(row[4], tz=timezone.utc),
-                    finish=datetime.fromtimestamp(row[5], tz=timezone.utc),
-                    moves=row[6],
-                ))
-            return recent_matches
+        # Gets all recent matches, minus void ones
+        return await self._fetch_all(
+            _SELECT_MATCH_RESULT +
+            " where r.is_void = 0"
+            " order by r.finished_at desc"
+            " limit ?", (count,), _match_result_from_row)
 
     async def get_ranking(self, start_date: datetime, end_date: datetime, ranked_only=True,
                           include_void=False) -> list[RankingEntry]:
@@ -396,115 +426,158 @@ class DbConnector:
                 ))
             return ranking_entries
 
-    async def _update_ranking(self, ranking_entries: list[RankingEntry], year: int, month: int) -> None:
-        async with self._transaction("w") as c:
-            for position, entry in enumerate(ranking_entries):
-                await c.execute(
-                    "insert or replace into rankings ("
-                    "  year,"
-                    "  month,"
-                    "  position,"
-                    "  user_id,"
-                    "  wins,"
-                    "  total_games"
-                    ") values ("
-                    "?, ?, ?, ?, ?, ?"
-                    ")", (
-                        year,
-                        month,
-                        position+1,
-                        entry.user_id,
-                        entry.wins,
-                        entry.games,
-                    ))
+    async def _update_ranking(self, c, year: int, month: int) -> None:
+        """
+        Computes ranking positions of the month from the monthly statistics
+        maintained by add_match_result, and the users' ratings. Positions
+        beyond the new ranking are removed.
+        """
+        await c.execute(
+            "insert or replace into rankings ("
+            "  year,"
+            "  month,"
+            "  position,"
+            "  user_id,"
+            "  wins,"
+            "  total_games"
+            ") select"
+            " s.year,"
+            " s.month,"
+            " row_number() over ("
+            "  order by r.rating desc, s.total_games desc, s.wins desc, s.user_id desc"
+            " ),"
+            " s.user_id,"
+            " s.wins,"
+            " s.total_games"
+            " from user_monthly_stats s"
+            " inner join user_ratings r on r.user_id = s.user_id and r.year = s.year and r.month = s.month"
+            " where s.year = ?"
+            " and s.month = ?"
+            " order by r.rating desc, s.total_games desc, s.wins desc, s.user_id desc"
+            " limit 100", (
+                year,
+                month,
+            )
+        )
+        await c.execute(
+            "delete from rankings"
+            " where year = ?"
+            " and month = ?"
+            " and position > ?", (
+                year,
+                month,
+                c.rowcount,
+            )
+        )
+
+    async def rebuild_rankings(self) -> int:
+        """
+        Recomputes the monthly statistics from all match results and then
+        the rankings of every month, e.g. after the leaderboards
+        configuration has changed, or after match results were imported.
+        Ratings are kept as they are.
 
-    async def _generate_ranking(self, start_date: datetime, end_date: datetime) -> list[RankingEntry]:
+        Returns:
+            int: Number of months ranked
+        """
         ranked_only = self.config.leaderboards_ranked_only.get()
         include_void = self.config.leaderboards_include_void.get()
 
-        async with self._transaction("r") as c:
-            # Gets matches sort
+        async with self._transaction("w") as c:
+            await c.execute("delete from user_monthly_stats")
             await c.execute(
-                "select"
-                " u.username,"
-                " u.id,"
-                " sum(mr.winner_id = u.id) as total_wins,"
-                " count(*) as total_games"
-                " from users u"
-                " inner join match_results mr on (u.id = mr.winner_id or u.id = mr.loser_id)"
-                " inner join matches m on m.id = mr.match_id"
-                " inner join user_ratings r on (u.id = r.user_id) and r.month = ? and r.year = ?"
-                " where mr.finished_at >= ?"
-                " and mr.finished_at < ?"
-                " and (case when ? = 1 then m.is_ranked = 1 else 1=1 end)"
-                " and (case when ? = 0 then mr.is_void = 0 else 1=1 end)"
-                " group by u.username"
-                " order by rating desc, total_games desc, total_wins desc, u.id desc"
-                " limit 100", (
-                    start_date.month,
-                    start_date.year,
-                    start_date.timestamp(),
-                    end_date.timestamp(),
+                "insert into user_monthly_stats ("
+                "  user_id,"
+                "  year,"
+                "  month,"
+                "  wins,"
+                "  total_games"
+                ") select"
+                " user_id,"
+                " cast(strftime('%Y', finished_at, 'unixepoch') as integer) as year,"
+                " cast(strftime('%m', finished_at, 'unixepoch') as integer) as month,"
+                " sum(won),"
+                " count(*)"
+                " from ("
+                "  select mr.winner_id as user_id, mr.finished_at, 1 as won"
+                "  from match_results mr"
+                "  inner join matches m on m.id = mr.match_id"
+                "  where (case when ? = 1 then m.is_ranked = 1 else 1=1 end)"
+                "  and (case when ? = 0 then mr.is_void = 0 else 1=1 end)"
+                "  union all"
+                "  select mr.loser_id as user_id, mr.finished_at, 0 as won"
+                "  from match_results mr"
+                "  inner join matches m on m.id = mr.match_id"
+                "  where (case when ? = 1 then m.is_ranked = 1 else 1=1 end)"
+                "  and (case when ? = 0 then mr.is_void = 0 else 1=1 end)"
+                " )"
+                " group by user_id, year, month", (
                     1 if ranked_only else 0,
-                    1 if include_void else 0
-                )
+                    1 if include_void else 0,
+                ) * 2
             )
 
-            ranking_entries = []
-            rows = await c.fetchall()
-            for row in rows:
-                ranking_entries.append(RankingEntry(
-                    username=row[0],
-                    user_id=row[1],
-                    wins=row[2],
-                    games=row[3],
-                ))
-            return ranking_entries
+            await c.execute("delete from rankings")
+            await c.execute("select distinct year, month from user_monthly_stats")
+            months = await c.fetchall()
+            for year, month in months:
+                await self._update_ranking(c, year=year, month=month)
+            return len(months)
 
     async def get_user_rating(self, user_id: str, month: int, year: int) -> UserRating | None:
         async with self._transaction("r") as c:
-            await c.execute(
-                "select"
-                " rating,"
-                " revision"
-                " from user_ratings"
-                " where user_id = ?"
-                " and month = ?"
-                " and year = ?",
-                (user_id, month, year)
-                )
-            row = await c.fetchone()
-            if row:
-                return UserRating(user_id, month, year, rating=row[0], revision=row[1])
-            return None
+            return await self._get_user_rating(c, user_id, month, year)
+
+    async def _get_user_rating(self, c, user_id: str, month: int, year: int) -> UserRating | None:
+        await c.execute(
+            "select"
+            " rating,"
+            " revision"
+            " from user_ratings"
+            " where user_id = ?"
+            " and month = ?"
+            " and year = ?",
+            (user_id, month, year)
+            )
+        row = await c.fetchone()
+        if row:
+            return UserRating(user_id, month, year, rating=row[0], revision=row[1])
+        return None
 
-    async def _update_users_rating(self, winner_id: str, loser_id: str, month: int, year: int, on_before_update=None):
-        async with self._transaction("w") as c:
-            winner = await self.get_user_rating(winner_id, month, year)
-            winner_exists = True
-            if winner is None:
-                winner_exists = False
-                winner = UserRating(winner_id, month, year)
+    async def _compute_users_rating(self, winner_id: str, loser_id: str, month: int,
+                                    year: int) -> list[tuple[UserRating, float, bool]]:
+        """
+        The ratings are read and the new ones computed without holding the write lock,
+        the writes fail with UpdateCollisionError when another match changed them in the meantime.
+
+        Returns:
+            the current rating, the new rating, and whether the rating exists, of the winner and the loser
+        """
+        async with self._transaction("r") as c:
+            winner = await self._get_user_rating(c, winner_id, month, year)
+            loser = await self._get_user_rating(c, loser_id, month, year)
 
-            loser = await self.get_user_rating(loser_id, month, year)
-            loser_exists = True
-            if loser is None:
-                loser_exists = False
-                loser = UserRating(loser_id, month, year)
+        winner_exists = winner is not None
+        if winner is None:
+            winner = UserRating(winner_id, month, year)
 
-            new_winner_rating, new_loser_rating = utils.calculate_new_ratings(winner.rating, loser.rating)
+        loser_exists = loser is not None
+        if loser is None:
+            loser = UserRating(loser_id, month, year)
 
-            if on_before_update:
-                await on_before_update()
+        new_winner_rating, new_loser_rating = utils.calculate_new_ratings(winner.rating, loser.rating)
+        return [(winner, new_winner_rating, winner_exists), (loser, new_loser_rating, loser_exists)]
 
-            await self._update_or_insert_rating(c, winner, new_winner_rating, winner_exists, month, year)
-            await self._update_or_insert_rating(c, loser, new_loser_rating, loser_exists, month, year)
+    async def _write_users_rating(self, c, rating_updates: list[tuple[UserRating, float, bool]]):
+        for rating, new_rating, exists in rating_updates:
+            await self._update_or_insert_rating(c, rating, new_rating, exists, rating.month, rating.year)
 
     async def _update_or_insert_rating(self, c, user: UserRating, new_rating: float, user_exists: bool, month: int,
                                        year: int):
         if not user_exists:
             await c.execute(
-                "insert into user_ratings (user_id, month, year, revision, rating) values (?, ?, ?, ?, ?)", (
+                "insert into user_ratings (user_id, month, year, revision, rating) values (?, ?, ?, ?, ?)"
+                " on conflict do nothing", (
                     user.user_id, month, year, user.revision, new_rating
                 )
             )
@@ -516,6 +589,9 @@ class DbConnector:
                 )
             )
 
+        if c.rowcount == 0:
+            raise UpdateCollisionError(f'Rating of {user.user_id} changed since revision {user.revision}')
+
     async def create_tournament(self, tournament_name: str, created_by_dc_id: str, tournament_msg_dc_id: str,
                                 required_matches_per_duel: int) -> str | None:
         """
@@ -599,39 +675,22 @@ class DbConnector:
             return result
 
     async def list_tournament_users(self, tournament_id: str) -> list[DbUser] | None:
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select users.id, username, password, users.created_at, discord_user_id,"
-                " banned_at, ban_reason"
-                " from tournaments"
-                " left join tournament_participants on tournaments.id = tournament_participants.tournament_id"
-                " left join users on users.id = tournament_participants.user_id"
-                " left join bans on users.id = bans.user_id"
-                " where tournaments.id = ?",
-                (tournament_id,)
-            )
-
-            rows = list(await c.fetchall())
-            if not rows:
-                # Tournament does not exist.
-                return None
+        users = await self._fetch_all(
+            "select " + _USER_COLUMNS +
+            " from tournaments t"
+            " left join tournament_participants p on t.id = p.tournament_id"
+            " left join users u on u.id = p.user_id"
+            " left join bans b on u.id = b.user_id"
+            " where t.id = ?", (tournament_id,), _user_from_row)
+        if not users:
+            # Tournament does not exist.
+            return None
 
-            if rows[0][0] is None:
-                # Tournament does exist but has no participants.
-                return []
+        if users[0].user_id is None:
+            # Tournament does exist but has no participants.
+            return []
 
-            result = []
-            for row in rows:
-                result.append(DbUser(
-                    user_id=row[0],
-                    username=row[1],
-                    password=row[2],
-                    created_at=row[3],
-                    discord_user_id=row[4],
-                    banned_at=timestamp_to_datetime(row[5]),
-                    ban_reason=row[6],
-                ))
-            return result
+        return users
 
     async def start_tournament(self, tournament_id: str) -> bool:
         """
@@ -767,42 +826,12 @@ class DbConnector:
             )
 
     async def get_duel_matches(self, tournament_id: str, duel_idx: int) -> list[DbMatchReport] | None:
-        async with self._transaction("r") as c:
-            await c.execute(
-                "select id, winner_id, loser_id, winner_pieces_left,"
-                " loser_pieces_left, move_counter, grid_size,"
-                " squadron_size, m.started_at, finished_at, m.is_ranked,"
-                " r.is_void"
-                " from matches m"
-                " right join tournament_matches"
-                " on m.id = tournament_matches.match_id"
-                " left join match_results r on m.id = r.match_id"
-                " where tournament_matches.tournament_id = ? and tournament_matches.duel_idx = ?",
-                (
-                    tournament_id,
-                    duel_idx,
-                ))
-            rows = await c.fetchall()
-            if rows is None:
-                return None
-
-            result = []
-            for row in rows:
-                result.append(DbMatchReport(
-                    match_id=row[0],
-                    winner_id=row[1],
-                    loser_id=row[2],
-                    winner_pieces_left=row[3],
-                    loser_pieces_left=row[4],
-                    move_counter=row[5],
-                    grid_size=row[6],
-                    squadron_size=row[7],
-                    started_at=datetime.fromtimestamp(row[8], tz=timezone.utc),
-                    finished_at=datetime.fromtimestamp(row[9], tz=timezone.utc),
-                    is_ranked=bool(row[10]),
-                    is_void=bool(row[11]),
-                ))
-            return result
+        return await self._fetch_all(
+            "select " + _MATCH_REPORT_COLUMNS +
+            " from tournament_matches t"
+            " left join matches m on m.id = t.match_id"
+            " left join match_results r on m.id = r.match_id"
+            " where t.tournament_id = ? and t.duel_idx = ?", (tournament_id, duel_idx), _match_report_from_row)
 
     async def list_tournament_matches(self, tournament_id: str) -> list[TournamentMatch] | None:
         async with self._transaction("r") as c:
@@ -896,6 +925,7 @@ class DbConnector:
             if not bool(c.rowcount):
                 return False
 
+            self._credential_cache.invalidate(user_id)
             await c.execute(
                 "insert into bans_audit_log ("
                 " timestamp, user_id, action, source_discord_id, ban_reason"
@@ -956,3 +986,44 @@ def timestamp_to_datetime(timestamp: int | None) -> datetime | None:
         return datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp else None
     except ValueError:
         return None
+
+
+def _user_from_row(row: sqlite3.Row) -> DbUser:
+    return DbUser(
+        user_id=row[0],
+        username=row[1],
+        password=row[2],
+        created_at=row[3],
+        discord_user_id=row[4],
+        banned_at=timestamp_to_datetime(row[5]),
+        ban_reason=row[6],
+    )
+
+
+def _match_report_from_row(row: sqlite3.Row) -> DbMatchReport:
+    return DbMatchReport(
+        match_id=row[0],
+        winner_id=row[1],
+        loser_id=row[2],
+        winner_pieces_left=row[3],
+        loser_pieces_left=row[4],
+        move_counter=row[5],
+        grid_size=row[6],
+        squadron_size=row[7],
+        started_at=datetime.fromtimestamp(row[8], tz=timezone.utc),
+        finished_at=datetime.fromtimestamp(row[9], tz=timezone.utc),
+        is_ranked=bool(row[10]),
+        is_void=bool(row[11]),
+    )
+
+
+def _match_result_from_row(row: sqlite3.Row) -> GameResultHistory:
+    return GameResultHistory(
+        player_won=row[0],
+        player_lost=row[1],
+        won_score=row[2],
+        lost_score=row[3],
+        start=datetime.fromtimestamp(row[4], tz=timezone.utc),
+        finish=datetime.fromtimestamp(row[5], tz=timezone.utc),
+        moves=row[6],
+    )
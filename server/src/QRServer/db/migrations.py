@@ -32,6 +32,9 @@ async def execute_migrations(transaction, config: Config, max_version=None):
         _migration_upgrade_to_v8,
         _migration_upgrade_to_v9,
         _migration_upgrade_to_v10,
+        _migration_upgrade_to_v11,
+        _migration_upgrade_to_v12,
+        _migration_upgrade_to_v13,
     ]
 
     for i in range(max_version if max_version and max_version <= len(migrations) else len(migrations)):
@@ -171,26 +174,24 @@ async def _migration_upgrade_to_v6(c, config):
                 ))
 
             # end
-            if ranking_entries:
-                for position, entry in enumerate(ranking_entries):
-                    await c.execute(
-                        "insert or replace into rankings ("
-                        "  year,"
-                        "  month,"
-                        "  position,"
-                        "  user_id,"
-                        "  wins,"
-                        "  total_games"
-                        ") values ("
-                        "?, ?, ?, ?, ?, ?"
-                        ")", (
-                            date.year,
-                            date.month,
-                            position+1,
-                            entry.user_id,
-                            entry.wins,
-                            entry.games,
-                        ))
+            await c.executemany(
+                "insert or replace into rankings ("
+                "  year,"
+                "  month,"
+                "  position,"
+                "  user_id,"
+                "  wins,"
+                "  total_games"
+                ") values ("
+                "?, ?, ?, ?, ?, ?"
+                ")", [(
+                    date.year,
+                    date.month,
+                    position+1,
+                    entry.user_id,
+                    entry.wins,
+                    entry.games,
+                ) for position, entry in enumerate(ranking_entries)])
 
     await _set_version(c, 6)
 
@@ -313,3 +314,83 @@ async def _migration_upgrade_to_v10(c, config):
     )
 
     await _set_version(c, 10)
+
+
+async def _migration_upgrade_to_v11(c, config):
+    await c.execute(
+        "create table user_monthly_stats ("
+        " user_id varchar,"
+        " year integer,"
+        " month integer,"
+        " wins integer,"
+        " total_games integer,"
+        " primary key(year, month, user_id),"
+        " foreign key(user_id) references users (id)"
+        ")"
+    )
+
+    ranked_only = config.leaderboards_ranked_only.get()
+    include_void = config.leaderboards_include_void.get()
+
+    # Aggregate existing matches - same as the dbconnector's rebuild at the time of writing
+    await c.execute(
+        "insert into user_monthly_stats ("
+        "  user_id,"
+        "  year,"
+        "  month,"
+        "  wins,"
+        "  total_games"
+        ") select"
+        " user_id,"
+        " cast(strftime('%Y', finished_at, 'unixepoch') as integer) as year,"
+        " cast(strftime('%m', finished_at, 'unixepoch') as integer) as month,"
+        " sum(won),"
+        " count(*)"
+        " from ("
+        "  select mr.winner_id as user_id, mr.finished_at, 1 as won"
+        "  from match_results mr"
+        "  inner join matches m on m.id = mr.match_id"
+        "  where (case when ? = 1 then m.is_ranked = 1 else 1=1 end)"
+        "  and (case when ? = 0 then mr.is_void = 0 else 1=1 end)"
+        "  union all"
+        "  select mr.loser_id as user_id, mr.finished_at, 0 as won"
+        "  from match_results mr"
+        "  inner join matches m on m.id = mr.match_id"
+        "  where (case when ? = 1 then m.is_ranked = 1 else 1=1 end)"
+        "  and (case when ? = 0 then mr.is_void = 0 else 1=1 end)"
+        " )"
+        " group by user_id, year, month", (
+            1 if ranked_only else 0,
+            1 if include_void else 0,
+        ) * 2
+    )
+
+    await _set_version(c, 11)
+
+
+async def _migration_upgrade_to_v12(c, _config):
+    # Lookups by username, ids and (user, year, month) are covered by the primary and unique keys
+    await c.execute("create index users_discord_user_id on users (discord_user_id)")
+    await c.execute("create index match_results_finished_at on match_results (finished_at)")
+    await _set_version(c, 12)
+
+
+async def _migration_upgrade_to_v13(c, _config):
+    await c.execute(
+        "create table pending_match_results ("
+        " id integer primary key autoincrement,"
+        " match_id varchar,"
+        " winner_id varchar,"
+        " loser_id varchar,"
+        " winner_pieces_left integer,"
+        " loser_pieces_left integer,"
+        " move_counter integer,"
+        " grid_size varchar,"
+        " squadron_size varchar,"
+        " started_at integer,"
+        " finished_at integer,"
+        " is_ranked integer,"
+        " is_void integer"
+        ")"
+    )
+    await _set_version(c, 13)
@@ -1,7 +1,11 @@
+import asyncio
 import binascii
 import hashlib
 import hmac
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 _iterations = 100000
 _hash_name = 'sha512'
@@ -31,3 +35,79 @@ def password_verify(provided_password: bytes | None, stored_hash: str | None) ->
         _iterations)
     h_str = binascii.hexlify(h).decode('ascii')
     return hmac.compare_digest(h_str, stored_hash)
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on worker threads, so that the event loop
+    is not blocked. PBKDF2 releases the GIL, so up to `workers` passwords
+    are processed in parallel on separate cores, the rest wait in a queue.
+    """
+    _executor: ThreadPoolExecutor
+
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+
+    async def hash(self, password: bytes) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, password_hash, password)
+
+    async def verify(self, provided_password: bytes | None, stored_hash: str | None) -> bool:
+        if not stored_hash or not provided_password:
+            return False
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, password_verify, provided_password, stored_hash)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class CredentialCache:
+    """
+    Remembers recently verified credentials, so that a player joining the
+    lobby and then a game does not pay for PBKDF2 each time.
+
+    Only a keyed digest of the password and its stored hash is kept, never
+    the password itself. As the stored hash is a part of the digest, a changed
+    password does not match old entries, entries should still be invalidated
+    explicitly whenever the credentials change.
+    """
+    _ttl: float
+    _max_size: int
+    _key: bytes
+    _entries: OrderedDict[str, tuple[bytes, float]]
+
+    def __init__(self, ttl: float, max_size: int):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+
+    def _digest(self, provided_password: bytes, stored_hash: str) -> bytes:
+        return hmac.digest(self._key, stored_hash.encode('ascii') + b'\x00' + provided_password, 'sha256')
+
+    def contains(self, user_id: str, provided_password: bytes, stored_hash: str) -> bool:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False
+
+        digest, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return False
+        if not hmac.compare_digest(digest, self._digest(provided_password, stored_hash)):
+            return False
+        self._entries.move_to_end(user_id)
+        return True
+
+    def add(self, user_id: str, provided_password: bytes, stored_hash: str):
+        if self._ttl <= 0 or self._max_size <= 0:
+            return
+
+        self._entries[user_id] = (self._digest(provided_password, stored_hash), time.monotonic() + self._ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
@@ -16,15 +16,54 @@ from QRServer.discord.webhook import Webhook
 
 log = logging.getLogger('qr.game_client_handler')
 
+# Messages which are only relayed to the opponent. Invalid <S> frames
+# are forwarded anyway by the deprecated handler, so these are not validated.
+_forwarded_messages: list[type[RequestMessage]] = [
+    UsePowerMessage,
+    SwitcherooMessage,
+    RemoveOneWayWallMessage,
+    BankruptActionMessage,
+    GameChatMessage,
+    GrabPieceMessage,
+    ReleasePieceMessage,
+    SwitchPlayerMessage,
+    RecursiveDoneMessage,
+    RemovePlayerMessage,
+    PowerNoEffectMessage,
+    NukeMessage,
+    JumpOnPieceMessage,
+    GetPowerSquareMessage,
+    SettingsLoadedMessage,
+    AssignPowerSquareMessage,
+    AssignNextPowerCountMessage,
+    NewGridCoordMessage,
+    ResignMessage,
+    SettingsReadyOnMessage,
+    SettingsReadyOnAgainMessage,
+    SettingsReadyOffMessage,
+    SettingsArenaSizeMessage,
+    SettingsSquadronSizeMessage,
+    SettingsTimerMessage,
+    SettingsTopBottomMessage,
+    SettingsColorMessage,
+]
+
 
 class GameClientHandler(ClientHandler, MatchParty):
     opponent_handler: Optional['GameClientHandler']
+    # Frames for the opponent received before they joined, e.g. the settings
+    _pending_forwards: list[bytes]
+    _pending_forward_bytes: int
+    _matched: bool
 
     def __init__(self, config, connector, reader, writer, game_server):
         super().__init__(config, connector, reader, writer)
         self.webhook = Webhook(config)
         self.opponent_handler = None
         self.game_server = game_server
+        self._pending_forwards = []
+        self._pending_forward_bytes = 0
+        self._matched = False
 
         self._user_id = None
         self.opponent_id = None
@@ -44,34 +83,10 @@ class GameClientHandler(ClientHandler, MatchParty):
         self.register_message_handler(VoidScoreRequest, self._handle_void_score)
         self.register_handler(b'<S>', self._handle_s)
 
-        # forwarding messages
-        self.register_message_handler(UsePowerMessage, self._handle_forward)
-        self.register_message_handler(SwitcherooMessage, self._handle_forward)
-        self.register_message_handler(RemoveOneWayWallMessage, self._handle_forward)
-        self.register_message_handler(BankruptActionMessage, self._handle_forward)
-        self.register_message_handler(GameChatMessage, self._handle_forward)
-        self.register_message_handler(GrabPieceMessage, self._handle_forward)
-        self.register_message_handler(ReleasePieceMessage, self._handle_forward)
-        self.register_message_handler(SwitchPlayerMessage, self._handle_forward)
-        self.register_message_handler(RecursiveDoneMessage, self._handle_forward)
-        self.register_message_handler(RemovePlayerMessage, self._handle_forward)
-        self.register_message_handler(PowerNoEffectMessage, self._handle_forward)
-        self.register_message_handler(NukeMessage, self._handle_forward)
-        self.register_message_handler(JumpOnPieceMessage, self._handle_forward)
-        self.register_message_handler(GetPowerSquareMessage, self._handle_forward)
-        self.register_message_handler(SettingsLoadedMessage, self._handle_forward)
-        self.register_message_handler(AssignPowerSquareMessage, self._handle_forward)
-        self.register_message_handler(AssignNextPowerCountMessage, self._handle_forward)
-        self.register_message_handler(NewGridCoordMessage, self._handle_forward)
-        self.register_message_handler(ResignMessage, self._handle_forward)
-        self.register_message_handler(SettingsReadyOnMessage, self._handle_forward)
-        self.register_message_handler(SettingsReadyOnAgainMessage, self._handle_forward)
-        self.register_message_handler(SettingsReadyOffMessage, self._handle_forward)
-        self.register_message_handler(SettingsArenaSizeMessage, self._handle_forward)
-        self.register_message_handler(SettingsSquadronSizeMessage, self._handle_forward)
-        self.register_message_handler(SettingsTimerMessage, self._handle_forward)
-        self.register_message_handler(SettingsTopBottomMessage, self._handle_forward)
-        self.register_message_handler(SettingsColorMessage, self._handle_forward)
+        # forwarding messages, relayed as raw frames unless they contain non-ASCII characters
+        for mtype in _forwarded_messages:
+            self.register_message_handler(mtype, self._handle_forward)
+            self.register_raw_handler(mtype, self._handle_forward_raw)
 
     @property
     def is_void_score(self):
@@ -94,13 +109,14 @@ class GameClientHandler(ClientHandler, MatchParty):
         if not isinstance(opponent, GameClientHandler):
             raise Exception('Wrong opponent')
         self.opponent_handler = opponent
+        self._matched = True
 
     def unmatch_opponent(self):
         self.opponent_handler = None
 
     async def _handle_policy(self, _: PolicyFileRequest):
         log.debug('Policy file requested')
-        await self.send_msg(CrossDomainPolicyAllowAllResponse.new())
+        await self.send_data(CrossDomainPolicyAllowAllResponse.data)
 
     async def _handle_hello_game(self, message: HelloGameRequest):
         pass
@@ -136,6 +152,9 @@ class GameClientHandler(ClientHandler, MatchParty):
         self.game_server.register_client(self)
         player_count = self.game_server.get_player_count()
         await self.send_msg(PlayerCountResponse.new(player_count))
+        if self.opponent_handler:
+            # The opponent might have sent something while waiting
+            await self.opponent_handler.flush_pending_forwards()
 
         if self.username < self.opponent_username:
             log.info(f'A match has started between {self.username} and {self.opponent_username}')
@@ -148,16 +167,50 @@ class GameClientHandler(ClientHandler, MatchParty):
     async def _handle_forward(self, message: RequestMessage):
         if not isinstance(message, ResponseMessage):
             raise Exception('Trying to send a non-response message')
-        if self.opponent_handler:
-            await self.opponent_handler.send_msg(message)
+        await self._forward(message.to_data())
+
+    async def _handle_forward_raw(self, data: bytes):
+        await self._forward(data + b'\x00')
+
+    async def _forward(self, data: bytes):
+        if self.opponent_handler is None:
+            if not self._matched:
+                self._add_pending_forward(data)
+            # Otherwise the opponent has left, nobody is going to receive it
+            return
+
+        if self._pending_forwards:
+            # Keep the order, the pending frames have not been flushed yet
+            self._add_pending_forward(data)
+            await self.flush_pending_forwards()
+        else:
+            await self.opponent_handler.send_data(data)
+
+    def _add_pending_forward(self, data: bytes):
+        max_pending_forward_bytes = self.config.game_max_pending_forward_bytes.get()
+        if self._pending_forward_bytes + len(data) > max_pending_forward_bytes:
+            log.warning(f'More than {max_pending_forward_bytes} bytes sent by {self.username} '
+                        f'before {self.opponent_username} joined, dropping')
+            return
+        self._pending_forwards.append(data)
+        self._pending_forward_bytes += len(data)
+
+    async def flush_pending_forwards(self):
+        """Sends the frames received before the opponent joined in one write"""
+        if self.opponent_handler is None or not self._pending_forwards:
+            return
+        data = b''.join(self._pending_forwards)
+        self._pending_forwards.clear()
+        self._pending_forward_bytes = 0
+        await self.opponent_handler.send_data(data)
 
     async def _handle_ping(self, message: ServerPingRequest):
-        await self.send_msg(ServerAliveResponse.new())
+        await self.send_data(ServerAliveResponse.data)
 
     async def _handle_void_score(self, _: VoidScoreRequest):
         self._is_void_score = True
         if self.opponent_handler:
-            await self.opponent_handler.send_msg(VoidScoreResponse.new())
+            await self.opponent_handler.send_data(VoidScoreResponse.data)
 
     async def _handle_add_stats(self, message: AddStatsRequest):
         await self.game_server.add_match_stats(self, message.to_stats())
@@ -165,7 +218,7 @@ class GameClientHandler(ClientHandler, MatchParty):
     async def _handle_disconnect(self, _: DisconnectRequest):
         log.debug('Connection closed by client')
         if self.opponent_handler is not None:
-            await self.opponent_handler.send_msg(OpponentDeadResponse.new())
+            await self.opponent_handler.send_data(OpponentDeadResponse.data)
 
         await self.game_server.remove_client(self)
         self.close_and_stop()
@@ -1,31 +1,123 @@
+import asyncio
 import logging
+import math
+import time
 
 from QRServer.common.classes import MatchId, Match, MatchStats
+from QRServer.common.timerwheel import TimerWheel
+from QRServer.db.models import DbMatchReport
 from QRServer.discord.webhook import Webhook
 from QRServer.game.gameclient import GameClientHandler
+from QRServer.lobby.lobbymanager import LobbyManager
 
 log = logging.getLogger('qr.game_server')
 
+# Waiting matches are expired with a precision of a second
+_rendezvous_tick_s = 1.0
+_rendezvous_slot_count = 64
+# Recording a match result which failed is retried with an exponential backoff
+_match_result_retry_min_delay_s = 1.0
+_match_result_retry_max_delay_s = 300.0
+
 
 class GameServer:
     matches: dict[MatchId, Match]
+    lobby_manager: LobbyManager | None  # None in game worker processes, they do not record results
+    # Players whose games are relayed by other processes
+    remote_playing_count: int
+    remote_waiting_count: int
+    # Matches the second player has not joined yet, with the deadline of joining
+    _rendezvous: dict[MatchId, float]
+    _rendezvous_wheel: TimerWheel[MatchId]
+    _party_count: int
+    _match_results_queued: asyncio.Event
 
-    def __init__(self, config, connector):
+    def __init__(self, config, connector, lobby_manager: LobbyManager | None):
         self.config = config
         self.connector = connector
+        self.lobby_manager = lobby_manager
         self.webhook = Webhook(config)
         self.matches = {}
+        self.opponent_timeout = config.game_opponent_timeout_sec.get()
+        self.remote_playing_count = 0
+        self.remote_waiting_count = 0
+        self._rendezvous = {}
+        self._rendezvous_wheel = TimerWheel(_rendezvous_tick_s, _rendezvous_slot_count, time.monotonic())
+        self._party_count = 0
+        self._match_results_queued = asyncio.Event()
 
     def register_client(self, client_handler: GameClientHandler):
         match_id = client_handler.match_id()
-        if match_id not in self.matches:
-            self.matches[match_id] = Match(match_id)
+        match = self.matches.get(match_id)
+        if match is None:
+            match = self.matches[match_id] = Match(match_id)
+            self._wait_for_opponent(match_id)
 
         log.debug(f'Player {client_handler.username} joins a match {match_id}')
-        self.matches[match_id].add_party(client_handler)
+        match.add_party(client_handler)
+        self._party_count += 1
+        if match.full():
+            self._stop_waiting(match_id)
+
+    def _wait_for_opponent(self, match_id: MatchId):
+        if self.opponent_timeout > 0:
+            deadline = time.monotonic() + self.opponent_timeout
+            self._rendezvous_wheel.schedule(match_id, deadline)
+        else:
+            deadline = math.inf
+        self._rendezvous[match_id] = deadline
+
+    def _stop_waiting(self, match_id: MatchId):
+        if self._rendezvous.pop(match_id, None) is not None:
+            self._rendezvous_wheel.cancel(match_id)
 
     def get_player_count(self):
-        return len(self.matches) * 2
+        return self.get_playing_count() + self.get_waiting_count()
+
+    def get_playing_count(self):
+        """Players whose opponent has joined"""
+        playing, _ = self.get_local_player_counts()
+        return playing + self.remote_playing_count
+
+    def get_waiting_count(self):
+        """Players waiting for the opponent to join"""
+        _, waiting = self.get_local_player_counts()
+        return waiting + self.remote_waiting_count
+
+    def get_local_player_counts(self) -> tuple[int, int]:
+        """
+        Returns:
+            the number of playing and waiting players of this process
+        """
+        # A match waits for the second player while only the first one has joined
+        waiting = len(self._rendezvous)
+        return self._party_count - waiting, waiting
+
+    async def expire_waiting_matches(self):
+        """Disconnects players whose opponent has not joined in time, runs until cancelled."""
+        while True:
+            await asyncio.sleep(_rendezvous_tick_s)
+            await self._expire_due_matches(time.monotonic())
+
+    async def _expire_due_matches(self, now: float):
+        for match_id in self._rendezvous_wheel.advance(now):
+            # Expiring the previous matches awaits, meanwhile the opponent might have joined,
+            # or the match might have been left and started waiting again with a new deadline
+            if match_id in self._rendezvous_wheel or self._rendezvous.pop(match_id, None) is None:
+                continue
+            await self._expire_match(match_id)
+
+    async def _expire_match(self, match_id: MatchId):
+        match = self.matches.get(match_id)
+        if match is None:
+            return
+
+        for party in list(match.parties):
+            if isinstance(party, GameClientHandler):
+                log.info(f'Player {party.username} has not been joined by {party.opponent_username} in time, '
+                         f'disconnecting')
+                await self.remove_client(party)
+                party.close()
 
     async def add_match_stats(self, client_handler: GameClientHandler, stats: MatchStats):
         match_id = client_handler.match_id()
@@ -44,25 +136,83 @@ class GameServer:
             # If the match is not full, it means the opponent has left
             # and there won't be a second stat, so we should only send this one.
             # It can occur due do disconnect (when players closes window without clicking quit).
+            # Recording the result takes a while, the player's connection
+            # should not wait for it. Queued results are persisted, so that
+            # they are recorded after a restart if the server stops earlier.
             try:
                 report = match.generate_match_report()
                 if report:
-                    await self.connector.add_match_result(report)
-                    log.debug(f'Added match report {report}')
-                    result = await self.connector.get_match_result(report.match_id)
-                    log.info(f'A match has ended; '
-                             f'{result.player_won} beat {result.player_lost} '
-                             f'{result.won_score}-{result.lost_score}')
-                    await self.webhook.invoke_webhook_game_ended(result)
+                    await self.queue_match_result(report)
                 else:
                     log.error('Failed to generate report')
             except Exception:
                 log.exception(f'Failed to generate report from results {match.match_stats}')
 
+    async def queue_match_result(self, report: DbMatchReport):
+        await self.connector.enqueue_match_result(report)
+        self._match_results_queued.set()
+        log.debug(f'Queued match report {report}')
+
+    async def process_match_results(self):
+        """Records queued match results in the background, runs until cancelled."""
+        retry_delay = _match_result_retry_min_delay_s
+        while True:
+            self._match_results_queued.clear()
+            try:
+                failed = await self._record_pending_match_results(retry_delay)
+            except Exception:
+                # E.g. the database is locked, the queue is read again later
+                log.exception(f'Failed to read queued match reports, retrying in {retry_delay}s')
+                failed = True
+
+            if not failed:
+                retry_delay = _match_result_retry_min_delay_s
+                await self._match_results_queued.wait()
+                continue
+
+            try:
+                await asyncio.wait_for(self._match_results_queued.wait(), retry_delay)
+            except TimeoutError:
+                pass
+            retry_delay = min(retry_delay * 2, _match_result_retry_max_delay_s)
+
+    async def _record_pending_match_results(self, retry_delay: float) -> bool:
+        """
+        Returns:
+            whether recording any of the results failed
+        """
+        failed = False
+        for pending_id, report in await self.connector.get_pending_match_results():
+            try:
+                await self._record_match_result(report)
+                await self.connector.remove_pending_match_result(pending_id)
+            except Exception:
+                # Kept in the queue, recording it is retried later
+                log.exception(f'Failed to record match report {report}, retrying in {retry_delay}s')
+                failed = True
+        return failed
+
+    async def _record_match_result(self, report: DbMatchReport):
+        # The server might have stopped after recording the result, but before removing it from the queue
+        if await self.connector.get_match(report.match_id) is None:
+            await self.connector.add_match_result(report)
+            if self.lobby_manager:
+                self.lobby_manager.invalidate_match_results()
+            log.debug(f'Added match report {report}')
+
+        result = await self.connector.get_match_result(report.match_id)
+        log.info(f'A match has ended; '
+                 f'{result.player_won} beat {result.player_lost} '
+                 f'{result.won_score}-{result.lost_score}')
+        await self.webhook.invoke_webhook_game_ended(result)
+
     async def remove_client(self, client: GameClientHandler):
         match_id = client.match_id()
-        if match_id in self.matches:
-            match = self.matches[match_id]
+        match = self.matches.get(match_id)
+        # The player might have been removed already, e.g. when they waited too long
+        if match is not None and client in match.parties:
             match.remove_party(client)
+            self._party_count -= 1
             if match.empty():
                 del self.matches[match_id]
+                self._stop_waiting(match_id)
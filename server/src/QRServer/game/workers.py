@@ -0,0 +1,496 @@
+"""
+Relaying games in several processes.
+
+The main process accepts game connections and reads them until the player
+tells which match they join. The socket is then passed to the worker chosen
+by the pair of usernames, so that both players of a match are relayed by the
+same worker. Workers do not open the database, the queries they need are run
+by the main process, which also records all match results. A worker which
+stops is restarted, its matches are relayed by the other workers meanwhile.
+"""
+import asyncio
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import pickle
+import signal
+import socket
+from asyncio import Future, StreamReader, StreamReaderProtocol, StreamWriter, Task, Transport
+from dataclasses import dataclass, field
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Coroutine
+
+from QRServer import config_handlers
+from QRServer.common.frames import FrameTooLargeError
+from QRServer.common.messages import Message, HelloGameRequest, JoinGameRequest
+from QRServer.config import Config
+from QRServer.db.connector import DbConnector
+from QRServer.db.models import DbUser, DbMatchReport
+from QRServer.discord import logger as discord_logger
+from QRServer.game.gameclient import GameClientHandler
+from QRServer.game.gameserver import GameServer
+
+log = logging.getLogger('qr.game_workers')
+
+# More than a stream reader ever buffers, so that nothing is left behind
+# in the reader when the connection is passed on
+_read_size = 1024 * 1024
+# Players which do not join a match in time are disconnected
+_join_timeout_s = 30
+# A worker which keeps crashing on startup should not be restarted in a busy loop
+_restart_delay_s = 1.0
+
+
+class GameWorkerPool:
+    """
+    Runs the game worker processes, passes game connections on to them,
+    and serves their database queries.
+    """
+    config: Config
+    connector: DbConnector
+    game_server: GameServer
+    _workers: list['_Worker']
+    _call_tasks: set[Task]
+    _methods: dict[str, Callable[..., Coroutine[Any, Any, Any]]]
+
+    def __init__(self, config: Config, connector: DbConnector, game_server: GameServer):
+        self.config = config
+        self.connector = connector
+        self.game_server = game_server
+        self._workers = []
+        self._call_tasks = set()
+        self._methods = {
+            'authenticate_user': connector.authenticate_user,
+            'get_user_by_username': connector.get_user_by_username,
+            # Results are queued by the game server, so that they are recorded right away
+            'enqueue_match_result': game_server.queue_match_result,
+        }
+
+    def start(self):
+        for idx in range(self.config.game_workers.get()):
+            self._workers.append(_Worker(idx, *self._start_process(idx)))
+        log.info(f'Started {len(self._workers)} game workers')
+
+    def _start_process(self, idx: int) -> tuple[BaseProcess, '_Channel']:
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = multiprocessing.get_context('spawn').Process(
+            target=_run_worker,
+            args=(self.config, child_sock),
+            name=f'Game worker {idx}',
+            daemon=True)
+        process.start()
+        child_sock.close()
+        return process, _Channel(parent_sock, _max_message_size(self.config))
+
+    async def wait_started(self):
+        """Waits until the workers are ready to relay games"""
+        await asyncio.gather(*(worker.started.wait() for worker in self._workers))
+
+    async def run(self):
+        """Serves the workers until cancelled, stops them afterwards"""
+        try:
+            await asyncio.gather(*(self._serve_worker(worker) for worker in self._workers))
+            await asyncio.Event().wait()
+        finally:
+            await self._stop()
+
+    async def _stop(self):
+        for task in self._call_tasks:
+            task.cancel()
+        await asyncio.gather(*self._call_tasks, return_exceptions=True)
+
+        for worker in self._workers:
+            # Workers stop when the channel is closed
+            worker.channel.close()
+        for worker in self._workers:
+            await asyncio.to_thread(worker.process.join, 5)
+            if worker.process.is_alive():
+                log.warning(f'Game worker {worker.idx} did not stop, terminating it')
+                worker.process.terminate()
+                await asyncio.to_thread(worker.process.join)
+
+    async def hand_over(self, reader: StreamReader, writer: StreamWriter):
+        """Reads the connection until the player joins a match, and passes it on to the worker relaying the match"""
+        try:
+            prefix, message = await asyncio.wait_for(
+                self._read_until_join(reader, writer),
+                _join_timeout_s)
+        except TimeoutError:
+            log.debug(f'Game client {writer.get_extra_info("peername")} did not join a match in time')
+            writer.close()
+            return
+        except (ConnectionError, FrameTooLargeError) as e:
+            log.debug(f'Failed to read from game client {writer.get_extra_info("peername")}: {e}')
+            writer.close()
+            return
+        except Exception:
+            # The data comes from the client, it might not parse
+            log.exception(f'Failed to read the match joined by game client {writer.get_extra_info("peername")}')
+            writer.close()
+            return
+
+        if message is None:
+            writer.close()
+            return
+
+        worker = self._route(message, writer)
+        if worker is None:
+            log.warning(f'No game worker is running, disconnecting {writer.get_extra_info("peername")}')
+            writer.close()
+            return
+
+        sock = writer.get_extra_info('socket')
+        try:
+            await worker.channel.send(('connection', prefix), [sock.fileno()])
+        except OSError as e:
+            log.warning(f'Failed to pass a game connection to worker {worker.idx}: {e}')
+        finally:
+            # The worker has its own copy of the socket, the connection stays open
+            writer.close()
+
+    async def _read_until_join(self, reader: StreamReader, writer: StreamWriter) -> tuple[bytes, Message | None]:
+        """
+        Returns:
+            all data read, and the first message after the hello, None when the connection is closed before
+        """
+        max_frame_size = self.config.max_frame_size.get()
+        buffer = bytearray()
+        frame_start = 0
+        while True:
+            chunk = await reader.read(_read_size)
+            if not chunk:
+                return b'', None
+
+            buffer += chunk
+            if len(buffer) > max_frame_size:
+                raise FrameTooLargeError(f'Received {len(buffer)} bytes before joining a match')
+
+            frame_end = buffer.find(0, frame_start)
+            while frame_end != -1:
+                message = Message.from_data(bytes(buffer[frame_start:frame_end]))
+                frame_start = frame_end + 1
+                if not isinstance(message, HelloGameRequest):
+                    # The rest is read by the worker
+                    transport: Transport = writer.transport  # type: ignore[assignment]
+                    transport.pause_reading()
+                    return bytes(buffer), message
+                frame_end = buffer.find(0, frame_start)
+
+    def _route(self, message: Message, writer: StreamWriter) -> '_Worker | None':
+        """
+        Returns:
+            the running worker with the highest weight for the key, None when no worker is running
+        """
+        if isinstance(message, JoinGameRequest):
+            # Both players of a match send the same pair of usernames
+            key = '\0'.join(sorted([message.get_username(), message.get_opponent_username()]))
+        else:
+            # Not joining a match, e.g. a policy file request
+            key = str(writer.get_extra_info('peername'))
+        # Weighting every worker instead of taking the key modulo their count, so that
+        # only the matches of a stopped worker are routed elsewhere until it is restarted
+        encoded_key = key.encode('utf-8')
+        return max(
+            (worker for worker in self._workers if worker.running),
+            key=lambda worker: hashlib.blake2b(encoded_key, digest_size=8, salt=worker.idx.to_bytes(16)).digest(),
+            default=None)
+
+    async def _serve_worker(self, worker: '_Worker'):
+        while True:
+            try:
+                message, _ = await worker.channel.receive()
+            except ConnectionError:
+                await self._restart_worker(worker)
+                continue
+
+            match message:
+                case ('call', call_id, method, args, kwargs):
+                    task = asyncio.create_task(self._call(worker, call_id, method, args, kwargs))
+                    self._call_tasks.add(task)
+                    task.add_done_callback(self._call_tasks.discard)
+                case ('started',):
+                    log.debug(f'Game worker {worker.idx} started')
+                    worker.running = True
+                    worker.started.set()
+                    await self._update_player_counts()
+                case ('player_count', playing_count, waiting_count):
+                    worker.playing_count, worker.waiting_count = playing_count, waiting_count
+                    await self._update_player_counts()
+                case _:
+                    log.error(f'Unknown message from game worker {worker.idx}: {message}')
+
+    async def _restart_worker(self, worker: '_Worker'):
+        log.error(f'Game worker {worker.idx} has stopped, restarting it')
+        worker.running = False
+        # Nobody waits for a worker which did not start
+        worker.started.set()
+        worker.playing_count, worker.waiting_count = 0, 0
+        await self._update_player_counts()
+
+        worker.channel.close()
+        await asyncio.to_thread(worker.process.join, 5)
+        if worker.process.is_alive():
+            worker.process.terminate()
+            await asyncio.to_thread(worker.process.join)
+        await asyncio.sleep(_restart_delay_s)
+        worker.process, worker.channel = self._start_process(worker.idx)
+
+    async def _call(self, worker: '_Worker', call_id: int, method: str, args: tuple, kwargs: dict):
+        try:
+            response = ('result', call_id, True, await self._methods[method](*args, **kwargs))
+        except Exception as e:
+            log.exception(f'Failed to call {method} for game worker {worker.idx}')
+            response = ('result', call_id, False, str(e))
+
+        try:
+            await worker.channel.send(response)
+        except OSError as e:
+            log.warning(f'Failed to send the result of {method} to game worker {worker.idx}: {e}')
+
+    async def _update_player_counts(self):
+        playing_count = sum(worker.playing_count for worker in self._workers)
+        waiting_count = sum(worker.waiting_count for worker in self._workers)
+        self.game_server.remote_playing_count = playing_count
+        self.game_server.remote_waiting_count = waiting_count
+        for worker in self._workers:
+            if worker.running:
+                try:
+                    await worker.channel.send((
+                        'remote_player_count',
+                        playing_count - worker.playing_count,
+                        waiting_count - worker.waiting_count))
+                except OSError as e:
+                    log.warning(f'Failed to send the player count to game worker {worker.idx}: {e}')
+
+
+@dataclass
+class _Worker:
+    idx: int
+    process: BaseProcess
+    channel: '_Channel'
+    playing_count: int = field(default=0)
+    waiting_count: int = field(default=0)
+    started: asyncio.Event = field(default_factory=asyncio.Event)
+    # Whether connections can be passed on to the worker
+    running: bool = field(default=False)
+
+
+class _Channel:
+    """Pickled messages, optionally with file descriptors, sent over a SOCK_SEQPACKET socket"""
+    _sock: socket.socket
+    _max_message_size: int
+    _send_lock: asyncio.Lock
+
+    def __init__(self, sock: socket.socket, max_message_size: int):
+        sock.setblocking(False)
+        self._sock = sock
+        self._max_message_size = max_message_size
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: tuple, fds: list[int] | None = None):
+        """
+        Raises:
+            OSError: when the channel is closed
+        """
+        data = pickle.dumps(message)
+        async with self._send_lock:
+            while True:
+                try:
+                    socket.send_fds(self._sock, [data], fds or [])
+                    return
+                except BlockingIOError:
+                    await self._wait(writable=True)
+
+    async def receive(self) -> tuple[tuple, list[int]]:
+        """
+        Returns:
+            the message and the file descriptors received with it
+
+        Raises:
+            ConnectionError: when the channel is closed
+        """
+        while True:
+            try:
+                data, fds, _, _ = socket.recv_fds(self._sock, self._max_message_size, 1)
+            except BlockingIOError:
+                await self._wait(writable=False)
+                continue
+            except OSError as e:
+                raise ConnectionResetError('Channel closed') from e
+
+            if not data:
+                raise ConnectionResetError('Channel closed')
+            return pickle.loads(data), fds
+
+    async def _wait(self, writable: bool):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self._sock.fileno()
+        if writable:
+            loop.add_writer(fd, _set_result, ready)
+        else:
+            loop.add_reader(fd, _set_result, ready)
+        try:
+            await ready
+        finally:
+            if writable:
+                loop.remove_writer(fd)
+            else:
+                loop.remove_reader(fd)
+
+    def close(self):
+        self._sock.close()
+
+
+class RemoteConnector:
+    """The database queries game clients make, run by the main process"""
+    _channel: _Channel
+    _results: dict[int, Future]
+
+    def __init__(self, channel: _Channel):
+        self._channel = channel
+        self._call_ids = itertools.count()
+        self._results = {}
+
+    async def authenticate_user(self, **kwargs) -> DbUser | None:
+        return await self._call('authenticate_user', **kwargs)
+
+    async def get_user_by_username(self, username: str) -> DbUser | None:
+        return await self._call('get_user_by_username', username)
+
+    async def enqueue_match_result(self, report: DbMatchReport):
+        await self._call('enqueue_match_result', report)
+
+    async def _call(self, method: str, *args, **kwargs):
+        call_id = next(self._call_ids)
+        result = asyncio.get_running_loop().create_future()
+        self._results[call_id] = result
+        try:
+            await self._channel.send(('call', call_id, method, args, kwargs))
+            return await result
+        finally:
+            del self._results[call_id]
+
+    def set_result(self, call_id: int, ok: bool, value):
+        result = self._results.get(call_id)
+        if result is None or result.done():
+            return
+        if ok:
+            result.set_result(value)
+        else:
+            result.set_exception(RemoteCallError(value))
+
+    def fail_all(self):
+        for result in self._results.values():
+            if not result.done():
+                result.set_exception(RemoteCallError('Main process has stopped'))
+
+
+class RemoteCallError(Exception):
+    pass
+
+
+class _WorkerGameServer(GameServer):
+    """Reports the number of players to the main process"""
+    player_count_changed: asyncio.Event
+
+    def __init__(self, config: Config, connector: RemoteConnector):
+        super().__init__(config, connector, None)
+        self.player_count_changed = asyncio.Event()
+
+    def register_client(self, client_handler: GameClientHandler):
+        super().register_client(client_handler)
+        self.player_count_changed.set()
+
+    async def remove_client(self, client: GameClientHandler):
+        await super().remove_client(client)
+        self.player_count_changed.set()
+
+
+class _GameWorker:
+    config: Config
+    channel: _Channel
+    connector: RemoteConnector
+    game_server: _WorkerGameServer
+    _tasks: set[Task]
+
+    def __init__(self, config: Config, sock: socket.socket):
+        self.config = config
+        self.channel = _Channel(sock, _max_message_size(config))
+        self.connector = RemoteConnector(self.channel)
+        self.game_server = _WorkerGameServer(config, self.connector)
+        self._tasks = set()
+
+    async def run(self):
+        self._start_task('Discord Logger', discord_logger.get_daemon_task(self.config))
+        self._start_task('Player Count', self._report_player_count())
+        self._start_task('Waiting Matches', self.game_server.expire_waiting_matches())
+        try:
+            await self.channel.send(('started',))
+            while True:
+                try:
+                    message, fds = await self.channel.receive()
+                except ConnectionError:
+                    log.debug('Main process has closed the channel, stopping')
+                    return
+
+                match message:
+                    case ('connection', prefix):
+                        await self._accept(prefix, fds[0])
+                    case ('result', call_id, ok, value):
+                        self.connector.set_result(call_id, ok, value)
+                    case ('remote_player_count', playing_count, waiting_count):
+                        self.game_server.remote_playing_count = playing_count
+                        self.game_server.remote_waiting_count = waiting_count
+                    case _:
+                        log.error(f'Unknown message from the main process: {message}')
+        finally:
+            self.connector.fail_all()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self.channel.close()
+
+    async def _accept(self, prefix: bytes, fd: int):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(fileno=fd)
+        sock.setblocking(False)
+
+        # Data read by the main process comes first
+        reader = StreamReader()
+        reader.feed_data(prefix)
+        protocol = StreamReaderProtocol(reader)
+        transport, _ = await loop.connect_accepted_socket(lambda: protocol, sock)
+        writer = StreamWriter(transport, protocol, reader, loop)
+
+        handler = GameClientHandler(self.config, self.connector, reader, writer, self.game_server)
+        self._start_task(f'Game client {writer.get_extra_info("peername")}', handler.run())
+
+    async def _report_player_count(self):
+        while True:
+            await self.game_server.player_count_changed.wait()
+            self.game_server.player_count_changed.clear()
+            await self.channel.send(('player_count', *self.game_server.get_local_player_counts()))
+
+    def _start_task(self, name: str, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def _run_worker(config: Config, sock: socket.socket):
+    # Interrupts are handled by the main process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config_handlers.refresh_logger_configuration(config)
+    asyncio.run(_GameWorker(config, sock).run())
+
+
+def _max_message_size(config: Config) -> int:
+    # The data read before passing a connection on is limited by the frame size
+    return config.max_frame_size.get() + 4096
+
+
+def _set_result(future: Future):
+    if not future.done():
+        future.set_result(None)
@@ -1,28 +1,36 @@
 import asyncio
 import logging
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING
 
 from QRServer.common import utils
 from QRServer.common.classes import LobbyPlayer
 from QRServer.common.clienthandler import ClientHandler
 from QRServer.common.messages import BroadcastCommentResponse, OldSwfResponse, LobbyDuplicateResponse, \
-    ServerAliveResponse, LobbyBadMemberResponse, LastPlayedResponse, ServerRankingThisMonthResponse, \
-    HelloLobbyRequest, JoinLobbyRequest, ServerRecentRequest, ServerRankingRequest, ServerAliveRequest, \
+    ServerAliveResponse, LobbyBadMemberResponse, HelloLobbyRequest, JoinLobbyRequest, ServerRecentRequest, \
+    ServerRankingRequest, ServerAliveRequest, \
     LobbyStateResponse, LobbyChatMessage, SetCommentRequest, ChallengeMessage, ChallengeAuthMessage, \
     DisconnectRequest, PolicyFileRequest, CrossDomainPolicyAllowAllResponse, NameTakenRequest, \
     NameTakenResponseYes, NameTakenResponseNo, ChangePasswordRequest, ChangePasswordResponseOk
 from QRServer.discord.webhook import Webhook
 
+if TYPE_CHECKING:
+    from QRServer.lobby.lobbymanager import LobbyManager
+    from QRServer.lobby.lobbyserver import LobbyServer
+
 log = logging.getLogger('qr.lobby_client_handler')
 
 
 class LobbyClientHandler(ClientHandler):
     player: LobbyPlayer
+    lobby_manager: 'LobbyManager'
+    lobby_server: 'LobbyServer | None'  # The room, known after joining
 
-    def __init__(self, config, connector, reader, writer, lobby_server):
+    def __init__(self, config, connector, reader, writer, lobby_manager):
         super().__init__(config, connector, reader, writer)
         self.webhook = Webhook(config)
-        self.lobby_server = lobby_server
+        self.lobby_manager = lobby_manager
+        self.lobby_server = None
 
         self.player = LobbyPlayer()
 
@@ -48,12 +56,12 @@ class LobbyClientHandler(ClientHandler):
 
     async def _handle_policy(self, _: PolicyFileRequest):
         log.debug('policy file requested')
-        await self.send_msg(CrossDomainPolicyAllowAllResponse.new())
+        await self.send_data(CrossDomainPolicyAllowAllResponse.data)
 
     async def _handle_hello_lobby(self, message: HelloLobbyRequest):
         swf_version = message.get_swf_version()
         if swf_version != 5:
-            await self.send_msg(OldSwfResponse.new())
+            await self.send_data(OldSwfResponse.data)
             log.debug(f'Client with invalid version tried to connect, version: {swf_version}')
             self.close_and_stop()
 
@@ -76,9 +84,9 @@ class LobbyClientHandler(ClientHandler):
             self.close_and_stop()
             return
 
-        if self.lobby_server.username_exists(username):
+        if self.lobby_manager.username_exists(username):
             log.debug('Client duplicate in lobby: ' + username)
-            await self.send_msg(LobbyDuplicateResponse.new())
+            await self.send_data(LobbyDuplicateResponse.data)
             self.close_and_stop()  # FIXME it seems that the connection shouldnt be completely closed
             return
 
@@ -92,15 +100,15 @@ class LobbyClientHandler(ClientHandler):
         self.player.user_id = db_user.user_id
         self.player.username = username
         self.player.joined_at = datetime.now(timezone.utc)
-        self.player.idx = await self.lobby_server.add_client(self)
-        await self.send_msg(LobbyStateResponse.new(self.lobby_server.get_players()))
+        self.lobby_server, self.player.idx = await self.lobby_manager.add_client(self)
+        await self.send_data(self.lobby_server.get_lobby_state_data())
 
         if self.player.is_guest:
             log.info('Guest joined lobby: ' + username)
         else:
             log.info('Member joined lobby: ' + username)
 
-        total_players = self.lobby_server.get_player_count()
+        total_players = self.lobby_manager.get_player_count()
         await self.webhook.invoke_webhook_lobby_joined(username, total_players)
 
         if self.config.lobby_motd.get():
@@ -111,7 +119,7 @@ class LobbyClientHandler(ClientHandler):
         challenged_idx = message.get_challenged_idx()
 
         success = False
-        if challenger_idx != self.player.idx:
+        if self.lobby_server is None or challenger_idx != self.player.idx:
             log.warning(f'Error while challenging: wrong idx, expected {self.player.idx} was {challenger_idx}')
         else:
             log.debug('Challenge issued')
@@ -125,7 +133,8 @@ class LobbyClientHandler(ClientHandler):
         challenger_idx = message.get_challenger_idx()
         challenged_idx = message.get_challenged_idx()
         challenger_auth = message.get_auth()
-        success = await self.lobby_server.setup_challenge(challenger_idx, challenged_idx, challenger_auth)
+        success = self.lobby_server is not None and \
+            await self.lobby_server.setup_challenge(challenger_idx, challenged_idx, challenger_auth)
         if not success:
             log.warning(f'Failed to respond to challenge {challenged_idx} by {challenger_idx}')
             await self.send_msg(LobbyChatMessage.new(None, 'Could not respond to the challenge'))
@@ -134,35 +143,31 @@ class LobbyClientHandler(ClientHandler):
             self.close_and_stop()
 
     async def _handle_server_recent(self, _: ServerRecentRequest):
-        recent_matches = await self.connector.get_recent_matches()
-        await self.send_msg(self.lobby_server.get_last_logged())
-        await self.send_msg(LastPlayedResponse.new(recent_matches))
+        recent_matches_data = await self.lobby_manager.get_recent_matches_data()
+        await self.send_msg(self.lobby_manager.get_last_logged())
+        await self.send_data(recent_matches_data)
 
     async def _handle_server_ranking(self, request: ServerRankingRequest):
-        start_date, end_date = utils.make_month_dates(request.get_month(), request.get_year())
-
-        rankings = await self.connector.get_ranking(
-            start_date=start_date,
-            end_date=end_date,
-            ranked_only=self.config.leaderboards_ranked_only.get(),
-            include_void=self.config.leaderboards_include_void.get()
-        )
-        await self.send_msg(ServerRankingThisMonthResponse.new(rankings))
+        await self.send_data(await self.lobby_manager.get_ranking_data(request.get_month(), request.get_year()))
 
     async def _handle_server_alive(self, _: ServerAliveRequest):
-        await self.send_msg(ServerAliveResponse.new())
+        await self.send_data(ServerAliveResponse.data)
 
     async def _handle_set_comment(self, message: SetCommentRequest):
         who = message.get_idx()
         comment = message.get_comment()
-        if who != self.player.idx:
+        if self.lobby_server is None or who != self.player.idx:
             log.debug(f'Error while setting comment: wrong idx, expected {self.player.idx} was {who}')
             return
         self.player.comment = comment
+        self.lobby_server.invalidate_lobby_state()
         await self.lobby_server.broadcast_msg(BroadcastCommentResponse.new(who, comment))
         await self.webhook.invoke_webhook_lobby_set_comment(self.player.username, comment)
 
     async def _handle_chat_message(self, message: LobbyChatMessage):
+        if self.lobby_server is None:
+            log.debug('Chat message sent before joining the lobby')
+            return
         await self.lobby_server.broadcast_msg(message)
         text = message.get_text()
         text_message = text.split(':', 1)[1].strip()
@@ -172,10 +177,10 @@ class LobbyClientHandler(ClientHandler):
 
     async def _handle_disconnect(self, _: DisconnectRequest):
         log.debug('Connection closed by client')
-        if self.player.idx is not None:
+        if self.lobby_server is not None:
             log.info(f'Player left lobby: {self.player.username}')
             await self.lobby_server.remove_client(self.player.idx)
-            total_players = self.lobby_server.get_player_count()
+            total_players = self.lobby_manager.get_player_count()
             await self.webhook.invoke_webhook_lobby_left(self.player.username, total_players)
 
         self.close_and_stop()
@@ -190,9 +195,9 @@ class LobbyClientHandler(ClientHandler):
         user = await self.connector.get_user_by_username(username)
 
         if user:
-            await self.send_msg(NameTakenResponseYes.new())
+            await self.send_data(NameTakenResponseYes.data)
         else:
-            await self.send_msg(NameTakenResponseNo.new())
+            await self.send_data(NameTakenResponseNo.data)
 
     async def _handle_change_password(self, message: ChangePasswordRequest):
         if self.player.user_id is None:
@@ -216,7 +221,7 @@ class LobbyClientHandler(ClientHandler):
 
         log.info(f'Member {self.player.username} has changed their password')
 
-        await self.send_msg(ChangePasswordResponseOk.new())
+        await self.send_data(ChangePasswordResponseOk.data)
 
     async def _error_bad_member(self):
-        await self.send_msg(LobbyBadMemberResponse.new())
+        await self.send_data(LobbyBadMemberResponse.data)
@@ -0,0 +1,134 @@
+import logging
+from datetime import datetime, timezone
+
+from QRServer.common import utils
+from QRServer.common.messages import LastLoggedResponse, LastPlayedResponse, ServerRankingThisMonthResponse
+from QRServer.common.stats import Histogram
+from QRServer.config import Config
+from QRServer.db.connector import DbConnector
+from QRServer.lobby.lobbyclient import LobbyClientHandler
+from QRServer.lobby.lobbyserver import LobbyServer
+
+log = logging.getLogger('qr.lobby_manager')
+
+
+class LobbyManager:
+    """
+    Hosts independent lobby rooms. Players join the first room with a free slot,
+    a new room is opened when all of them are full.
+    """
+    rooms: list[LobbyServer]
+    last_logged: LobbyClientHandler | None
+    broadcast_latency: Histogram
+    match_results_version: int
+    _recent_matches_data: bytes | None
+    _ranking_data: dict[tuple[int, int], bytes]
+
+    def __init__(self, config: Config, connector: DbConnector):
+        self.config = config
+        self.connector = connector
+        self.max_rooms = max(config.lobby_max_rooms.get(), 1)
+        self.rooms = [LobbyServer(self)]
+        self.last_logged = None
+        self.broadcast_latency = Histogram()
+        self.match_results_version = 0
+        self._recent_matches_data = None
+        self._ranking_data = {}
+
+    async def add_client(self, client: LobbyClientHandler) -> tuple[LobbyServer, int]:
+        """
+        Returns:
+            the room the client has joined and its index in the room
+        """
+        room = self._find_room()
+        return room, await room.add_client(client)
+
+    def _find_room(self) -> LobbyServer:
+        for room in self.rooms:
+            if not room.is_full():
+                return room
+
+        if len(self.rooms) < self.max_rooms:
+            room = LobbyServer(self)
+            self.rooms.append(room)
+            log.info(f'All lobby rooms are full, opened room {len(self.rooms)}')
+            return room
+
+        # No more rooms can be opened, the oldest player has to make room
+        return min(self.rooms, key=lambda r: min(c.connected_at for c in r.clients if c))
+
+    def username_exists(self, username) -> bool:
+        return any(room.username_exists(username) for room in self.rooms)
+
+    def get_player_count(self) -> int:
+        return sum(room.get_player_count() for room in self.rooms)
+
+    def get_room_stats(self) -> list[dict]:
+        return [{
+            'player_count': room.get_player_count(),
+            'capacity': len(room.clients),
+        } for room in self.rooms]
+
+    def get_last_logged(self) -> LastLoggedResponse:
+        if self.last_logged:
+            username = self.last_logged.username
+            joined_at = self.last_logged.get_joined_at()
+            if username and joined_at:
+                return LastLoggedResponse.new(username, joined_at, '')
+
+        return LastLoggedResponse.new('<>', datetime.now(timezone.utc), '')
+
+    def invalidate_match_results(self):
+        """Has to be called whenever a match result is recorded"""
+        self.match_results_version += 1
+        self._recent_matches_data = None
+        self._ranking_data.clear()
+
+    async def get_recent_matches_data(self) -> bytes:
+        """
+        Returns:
+            the encoded LastPlayedResponse, reused until match results are invalidated
+        """
+        if self._recent_matches_data is None:
+            version = self.match_results_version
+            data = LastPlayedResponse.new(await self.connector.get_recent_matches()).to_data()
+            if version != self.match_results_version:
+                # A match was recorded in the meantime, the data might be outdated already
+                return data
+            self._recent_matches_data = data
+        return self._recent_matches_data
+
+    async def get_ranking_data(self, month: int, year: int) -> bytes:
+        """
+        Returns:
+            the encoded ServerRankingThisMonthResponse of the month, reused until match results are invalidated
+        """
+        # Only the recent months are requested often, caching any month the client asks for would grow without bound
+        cached_months = self._cached_ranking_months()
+        data = self._ranking_data.get((year, month))
+        if data is None:
+            version = self.match_results_version
+            start_date, end_date = utils.make_month_dates(month, year)
+            rankings = await self.connector.get_ranking(
+                start_date=start_date,
+                end_date=end_date,
+                ranked_only=self.config.leaderboards_ranked_only.get(),
+                include_void=self.config.leaderboards_include_void.get()
+            )
+            data = ServerRankingThisMonthResponse.new(rankings).to_data()
+            if version == self.match_results_version and (year, month) in cached_months:
+                for key in [key for key in self._ranking_data if key not in cached_months]:
+                    del self._ranking_data[key]
+                self._ranking_data[(year, month)] = data
+        return data
+
+    @staticmethod
+    def _cached_ranking_months() -> set[tuple[int, int]]:
+        """
+        Returns:
+            the current and previous month as (year, month)
+        """
+        now = datetime.now(timezone.utc)
+        if now.month == 1:
+            return {(now.year, 1), (now.year - 1, 12)}
+        return {(now.year, now.month), (now.year, now.month - 1)}
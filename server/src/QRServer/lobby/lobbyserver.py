@@ -1,57 +1,90 @@
+import asyncio
+import heapq
 import logging
+import time
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING
 
 from QRServer.common.classes import LobbyPlayer
 from QRServer.common.clienthandler import SendMessageException
-from QRServer.common.messages import ResponseMessage, LastLoggedResponse, LobbyStateResponse, ChallengeMessage, \
-    ChallengeAuthMessage
+from QRServer.common.messages import ResponseMessage, LobbyStateResponse, ChallengeMessage, ChallengeAuthMessage
 from QRServer.lobby.lobbyclient import LobbyClientHandler
 
+if TYPE_CHECKING:
+    from QRServer.lobby.lobbymanager import LobbyManager
+
 log = logging.getLogger('qr.lobby_server')
 
 
 class LobbyServer:
+    """A single lobby room, the client protocol does not know about the other rooms"""
     __server_boot_time = datetime.now(timezone.utc)
-    last_logged: LobbyClientHandler | None
+    lobby_manager: 'LobbyManager'
     clients: list[LobbyClientHandler | None]
-
-    def __init__(self):
+    lobby_state_version: int
+    _lobby_state_data: bytes | None
+    # Kept in sync with clients, so that joining and lookups do not scan the slots
+    _idxs_by_username: dict[str, int]
+    _free_idxs: list[int]  # A min-heap, players take the first free slot
+    _player_count: int
+
+    def __init__(self, lobby_manager: 'LobbyManager'):
+        self.lobby_manager = lobby_manager
         self.clients = [None] * 13  # The lobby allows only 13 people at once, last one is kicked
-        self.last_logged = None
+        self.lobby_state_version = 0
+        self._lobby_state_data = None
+        self._idxs_by_username = {}
+        self._free_idxs = list(range(len(self.clients)))
+        self._player_count = 0
 
     async def add_client(self, client: LobbyClientHandler):
         idx = await self.ensure_free_idx()
         self.clients[idx] = client
+        if client.username is not None:
+            self._idxs_by_username[client.username] = idx
+        self._player_count += 1
+        self.invalidate_lobby_state()
         await self.broadcast_lobby_state(idx)
         return idx
 
-    async def ensure_free_idx(self):
-        for idx in range(13):
-            if not self.clients[idx]:
-                return idx
+    def is_full(self) -> bool:
+        return not self._free_idxs
 
-        to_kick_idx = min(enumerate(self.clients), key=lambda e: e[1].connected_at)[0]
-        await self.remove_client(to_kick_idx)
-        return to_kick_idx
+    async def ensure_free_idx(self) -> int:
+        """
+        Returns:
+            a free slot, taken out of the free ones, the client has to be put there before the next await
+        """
+        # Somebody else might take the slot while the oldest client is being kicked
+        while not self._free_idxs:
+            to_kick_idx, _ = min(((i, c) for i, c in enumerate(self.clients) if c), key=lambda e: e[1].connected_at)
+            await self.remove_client(to_kick_idx)
+        return heapq.heappop(self._free_idxs)
 
     async def remove_client(self, idx, excluded_idx=None):
-        if self.clients[idx] is None:
-            log.warning(f'Not removing client {idx} as it\'s already gone')
-            return
+        await self._remove_clients([idx], idx if excluded_idx is None else excluded_idx)
+
+    async def _remove_clients(self, idxs: list[int], excluded_idx):
+        removed = False
+        for idx in idxs:
+            client = self.clients[idx]
+            if client is None:
+                log.warning(f'Not removing client {idx} as it\'s already gone')
+                continue
 
-        self.last_logged = self.clients[idx]
-        self.clients[idx].close()
-        self.clients[idx] = None
+            self.lobby_manager.last_logged = client
+            client.close()
+            self.clients[idx] = None
+            if client.username is not None and self._idxs_by_username.get(client.username) == idx:
+                del self._idxs_by_username[client.username]
+            heapq.heappush(self._free_idxs, idx)
+            self._player_count -= 1
+            removed = True
 
-        if excluded_idx is None:
-            excluded_idx = idx
-        await self.broadcast_lobby_state(excluded_idx)
+        if removed:
+            self.invalidate_lobby_state()
 
-    def username_exists(self, username):
-        for i in self.clients:
-            if i and i.username == username:
-                return True
-        return False
+            await self.broadcast_lobby_state(excluded_idx)
 
     def get_players(self) -> list[LobbyPlayer | None]:
         players: list[LobbyPlayer | None] = []
@@ -63,33 +96,63 @@ class LobbyServer:
         return players
 
     def get_player_count(self) -> int:
-        return sum(player is not None for player in self.get_players())
+        return self._player_count
+
+    def username_exists(self, username) -> bool:
+        return username in self._idxs_by_username
 
-    def get_last_logged(self) -> LastLoggedResponse:
-        if self.last_logged:
-            username = self.last_logged.username
-            joined_at = self.last_logged.get_joined_at()
-            if username and joined_at:
-                return LastLoggedResponse.new(username, joined_at, '')
+    def get_client(self, username) -> LobbyClientHandler | None:
+        idx = self._idxs_by_username.get(username)
+        return None if idx is None else self.clients[idx]
 
-        return LastLoggedResponse.new('<>', datetime.now(timezone.utc), '')
+    def invalidate_lobby_state(self):
+        """Has to be called whenever a slot or a player shown in the lobby changes"""
+        self.lobby_state_version += 1
+        self._lobby_state_data = None
+
+    def get_lobby_state_data(self) -> bytes:
+        """
+        Returns:
+            the encoded LobbyStateResponse, reused until the lobby state is invalidated
+        """
+        if self._lobby_state_data is None:
+            self._lobby_state_data = LobbyStateResponse.new(self.get_players()).to_data()
+        return self._lobby_state_data
 
     async def broadcast_lobby_state(self, excluded_idx):
         # send the current lobby state to all the connected clients (forces refresh) (i hope it does...)
-        message = LobbyStateResponse.new(self.get_players())
-        for i in range(13):
-            if i == excluded_idx:
-                continue
-            try:
-                if self.clients[i]:
-                    await self.clients[i].send_msg(message)
-            except SendMessageException as e:
-                log.warning(f'Failed to send lobby state to {e.username} ({i}), kicking them')
-                # Removing client will rebroadcast lobby state. Just make sure
-                # the original idx is excluded in order not to send spurious
-                # messages.
-                await self.remove_client(i, excluded_idx)
-                return
+        failed_idxs = await self._broadcast_data(self.get_lobby_state_data(), excluded_idx)
+        if failed_idxs:
+            log.warning(f'Failed to send lobby state to {failed_idxs}, kicking them')
+            # Removing clients will rebroadcast lobby state. Just make sure
+            # the original idx is excluded in order not to send spurious
+            # messages.
+            await self._remove_clients(failed_idxs, excluded_idx)
+
+    async def _broadcast_data(self, data: bytes, excluded_idx=None) -> list[int]:
+        """
+        Sends the frame to all clients concurrently, so that a client which
+        drains slowly does not delay the others.
+
+        Returns:
+            indices of the clients the frame could not be sent to
+        """
+        started_at = time.perf_counter()
+        recipients = [(i, client) for i, client in enumerate(self.clients) if client and i != excluded_idx]
+        results = await asyncio.gather(
+            *(client.send_data(data) for _, client in recipients),
+            return_exceptions=True)
+        self.lobby_manager.broadcast_latency.observe(time.perf_counter() - started_at)
+
+        failed_idxs = []
+        for (i, client), result in zip(recipients, results):
+            if isinstance(result, SendMessageException):
+                # The slot might have been taken over in the meantime
+                if self.clients[i] is client:
+                    failed_idxs.append(i)
+            elif isinstance(result, BaseException):
+                raise result
+        return failed_idxs
 
     async def challenge_user(self, challenger_idx, challenged_idx) -> bool:
         """
@@ -127,9 +190,10 @@ class LobbyServer:
 
     async def broadcast_msg(self, message: ResponseMessage):
         log.debug(f'Broadcasting {message}')
-        for client in self.clients:
-            if client:
-                await client.send_msg(message)
+        failed_idxs = await self._broadcast_data(message.to_data())
+        if failed_idxs:
+            log.warning(f'Failed to broadcast {message} to {failed_idxs}, kicking them')
+            await self._remove_clients(failed_idxs, None)
 
 # compare with screenshot
 # <S>~<SERVER>~<LAST_LOGGED>~turing guest~33~
@@ -5,15 +5,15 @@ from asyncio import Task, Server, StreamReader, StreamWriter, CancelledError
 from typing import Coroutine
 
 from QRServer.api.api import ApiServer
-from QRServer.common.clienthandler import ClientHandler
 from QRServer.config import Config
 from QRServer.db.connector import create_connector, DbConnector
 from QRServer.discord import logger as discord_logger
 from QRServer.discord.bot import DiscordBot
 from QRServer.game.gameclient import GameClientHandler
 from QRServer.game.gameserver import GameServer
+from QRServer.game.workers import GameWorkerPool
 from QRServer.lobby.lobbyclient import LobbyClientHandler
-from QRServer.lobby.lobbyserver import LobbyServer
+from QRServer.lobby.lobbymanager import LobbyManager
 
 log = logging.getLogger('qr.server')
 
@@ -27,7 +27,8 @@ class QRServer:
     _lobby_sock_server: Server
     _game_sock_server: Server
     _game_server: GameServer
-    _lobby_server: LobbyServer
+    _game_workers: GameWorkerPool | None
+    _lobby_manager: LobbyManager
     _api_server: ApiServer | None
 
     # events
@@ -49,6 +50,7 @@ class QRServer:
         self._game_port = None
         self._server_stopped = asyncio.Event()
         self._api_server = None
+        self._game_workers = None
 
     @property
     def tasks(self):
@@ -74,8 +76,8 @@ class QRServer:
         return self._game_server
 
     @property
-    def lobby_server(self):
-        return self._lobby_server
+    def lobby_manager(self):
+        return self._lobby_manager
 
     async def start(self):
         try:
@@ -91,6 +93,8 @@ class QRServer:
         await asyncio.gather(
             self._lobby_ready.wait(),
             self._game_ready.wait())
+        if self._game_workers:
+            await self._game_workers.wait_started()
 
     async def run(self):
         await self.start()
@@ -141,14 +145,21 @@ class QRServer:
             self._discord_bot = DiscordBot(self.config, self.connector)
             self.start_task("Discord Bot", self._discord_bot.run_bot())
 
-        self._game_server = GameServer(self.config, self.connector)
-        self._lobby_server = LobbyServer()
+        self._lobby_manager = LobbyManager(self.config, self.connector)
+        self._game_server = GameServer(self.config, self.connector, self._lobby_manager)
+        self.start_task("Match Results", self._game_server.process_match_results())
+        self.start_task("Waiting Matches", self._game_server.expire_waiting_matches())
+
+        if self.config.game_workers.get() > 0:
+            self._game_workers = GameWorkerPool(self.config, self.connector, self._game_server)
+            self._game_workers.start()
+            self.start_task("Game Workers", self._game_workers.run())
 
         if self.config.api_enabled.get():
             self._api_server = ApiServer(
                 config=self.config,
                 connector=self.connector,
-                lobby_server=self._lobby_server,
+                lobby_manager=self._lobby_manager,
                 game_server=self._game_server
             )
             self.start_task("QR API", self._api_server.run())
@@ -156,29 +167,34 @@ class QRServer:
             log.info('QR API disabled')
 
         await self._game_listener_task(self.config, self.connector, self._game_server)
-        await self._lobby_listener_task(self.config, self.connector, self._lobby_server)
+        await self._lobby_listener_task(self.config, self.connector, self._lobby_manager)
 
-    async def _lobby_listener_task(self, config, connector, lobby_server):
-        def handler_factory(reader, writer):
-            return LobbyClientHandler(config, connector, reader, writer, lobby_server)
+    async def _lobby_listener_task(self, config, connector, lobby_manager):
+        def run_client(reader, writer):
+            return LobbyClientHandler(config, connector, reader, writer, lobby_manager).run()
 
         try:
-            await self._listen_for_connections(config.lobby_port.get(), handler_factory, True)
+            await self._listen_for_connections(config.lobby_port.get(), run_client, True)
         except Exception:
             log.exception('Failed setting up the server')
             await self.stop()
 
     async def _game_listener_task(self, config, connector, game_server):
-        def handler_factory(reader, writer):
-            return GameClientHandler(config, connector, reader, writer, game_server)
+        game_workers = self._game_workers
+
+        def run_client(reader, writer):
+            if game_workers:
+                # The game is relayed by a worker process
+                return game_workers.hand_over(reader, writer)
+            return GameClientHandler(config, connector, reader, writer, game_server).run()
 
         try:
-            await self._listen_for_connections(config.game_port.get(), handler_factory, False)
+            await self._listen_for_connections(config.game_port.get(), run_client, False)
         except Exception:
             log.exception('Failed setting up the server')
             await self.stop()
 
-    async def _listen_for_connections(self, conn_port, handler_factory, is_lobby):
+    async def _listen_for_connections(self, conn_port, run_client, is_lobby):
         conn_host = self.config.address.get()
 
         if is_lobby:
@@ -187,10 +203,9 @@ class QRServer:
             log.info(f'Game starting on {conn_host}:{conn_port}')
 
         def handle_client(reader: StreamReader, writer: StreamWriter):
-            handler: ClientHandler = handler_factory(reader, writer)
             addr = writer.get_extra_info('peername')
             name = f'Lobby client {addr}' if is_lobby else f'Game client {addr}'
-            self.start_task(name, handler.run())
+            self.start_task(name, run_client(reader, writer))
 
         server = await asyncio.start_server(handle_client, conn_host, conn_port)
         if is_lobby:
@@ -217,7 +232,7 @@ class QRServer:
         log.debug(f'Running cron logger with delay of {delay} seconds')
         while True:
             await asyncio.sleep(delay)
-            lobby_count = self.lobby_server.get_player_count()
+            lobby_count = self.lobby_manager.get_player_count()
             game_count = self.game_server.get_player_count()
             if lobby_count > 0 or game_count > 0:
                 log.info(f'There are currently {lobby_count} players in the lobby, '
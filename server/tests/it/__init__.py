@@ -54,8 +54,9 @@ class TestClientConnection:
         server_client.writer.drain = broken_drain
 
     def _find_server_lobby_client(self):
-        for client in self.server.lobby_server.clients:
-            if client and client.username == self.username:
+        for room in self.server.lobby_manager.rooms:
+            client = room.get_client(self.username)
+            if client:
                 return client
         return None
 
@@ -142,18 +143,8 @@ class TestClientConnection:
 
     async def wait_for_disconnect(self):
         async def wait_lobby():
-            while True:
-                clients = self.server.lobby_server.clients
-                exists = False
-                for i in range(13):
-                    if clients[i] and clients[i].username == self.username:
-                        exists = True
-                        break
-
-                if not exists:
-                    return
-                else:
-                    await asyncio.sleep(0.01)
+            while self.server.lobby_manager.username_exists(self.username):
+                await asyncio.sleep(0.01)
 
         async def wait_game():
             while True:
@@ -26,6 +26,8 @@ class ApiGameIT(QuadradiusIntegrationTestCase):
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
                 'player_count': 0,
+                'playing_count': 0,
+                'waiting_count': 0,
             })
 
         client1 = await self.new_game_client()
@@ -37,7 +39,9 @@ class ApiGameIT(QuadradiusIntegrationTestCase):
         async with api_client.get('game/stats') as r:
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
-                'player_count': 2,
+                'player_count': 1,
+                'playing_count': 0,
+                'waiting_count': 1,
             })
 
         client2 = await self.new_game_client()
@@ -50,6 +54,8 @@ class ApiGameIT(QuadradiusIntegrationTestCase):
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
                 'player_count': 2,
+                'playing_count': 2,
+                'waiting_count': 0,
             })
 
         client3 = await self.new_game_client()
@@ -61,7 +67,9 @@ class ApiGameIT(QuadradiusIntegrationTestCase):
         async with api_client.get('game/stats') as r:
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
-                'player_count': 4,
+                'player_count': 3,
+                'playing_count': 2,
+                'waiting_count': 1,
             })
 
         client4 = await self.new_game_client()
@@ -73,7 +81,9 @@ class ApiGameIT(QuadradiusIntegrationTestCase):
         async with api_client.get('game/stats') as r:
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
-                'player_count': 6,
+                'player_count': 4,
+                'playing_count': 2,
+                'waiting_count': 2,
             })
 
         await client4.disconnect_and_wait()
@@ -81,5 +91,7 @@ class ApiGameIT(QuadradiusIntegrationTestCase):
         async with api_client.get('game/stats') as r:
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
-                'player_count': 4,
+                'player_count': 3,
+                'playing_count': 2,
+                'waiting_count': 1,
             })
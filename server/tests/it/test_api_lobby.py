@@ -12,6 +12,8 @@ class ApiLobbyIT(QuadradiusIntegrationTestCase):
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
                 'player_count': 0,
+                'room_count': 1,
+                'rooms': [{'player_count': 0, 'capacity': 13}],
             })
 
         client1 = await self.new_lobby_client()
@@ -21,6 +23,8 @@ class ApiLobbyIT(QuadradiusIntegrationTestCase):
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
                 'player_count': 1,
+                'room_count': 1,
+                'rooms': [{'player_count': 1, 'capacity': 13}],
             })
 
         client2 = await self.new_lobby_client()
@@ -30,6 +34,8 @@ class ApiLobbyIT(QuadradiusIntegrationTestCase):
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
                 'player_count': 2,
+                'room_count': 1,
+                'rooms': [{'player_count': 2, 'capacity': 13}],
             })
 
         await client1.disconnect_and_wait()
@@ -38,4 +44,23 @@ class ApiLobbyIT(QuadradiusIntegrationTestCase):
             self.assertEqual(r.status, 200)
             self.assertEqual(await r.json(), {
                 'player_count': 1,
+                'room_count': 1,
+                'rooms': [{'player_count': 1, 'capacity': 13}],
             })
+
+    async def test_lobby_broadcast_stats(self):
+        api_client = await self.new_api_client('v1')
+        async with api_client.get('lobby/stats/broadcasts') as r:
+            self.assertEqual(r.status, 200)
+            latency = (await r.json())['latency_seconds']
+            self.assertEqual(latency['count'], 0)
+            self.assertEqual(latency['buckets']['+Inf'], 0)
+
+        client1 = await self.new_lobby_client()
+        await client1.join_lobby('Player', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+
+        async with api_client.get('lobby/stats/broadcasts') as r:
+            self.assertEqual(r.status, 200)
+            latency = (await r.json())['latency_seconds']
+            self.assertEqual(latency['count'], 1)
+            self.assertEqual(latency['buckets']['+Inf'], 1)
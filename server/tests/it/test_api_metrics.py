@@ -0,0 +1,60 @@
+import asyncio
+
+from QRServer.common.messages import ServerAliveRequest, ServerAliveResponse
+from . import QuadradiusIntegrationTestCase
+
+
+class ApiMetricsIT(QuadradiusIntegrationTestCase):
+    async def itSetUpConfig(self, config):
+        config.set('api.enabled', True)
+        config.set('auth.auto_register', True)
+
+    async def get_metrics(self) -> dict[str, float]:
+        api_client = await self.new_api_client('v1')
+        async with api_client.get('metrics') as r:
+            self.assertEqual(r.status, 200)
+            self.assertTrue(r.headers['Content-Type'].startswith('text/plain'))
+            text = await r.text()
+
+        metrics = {}
+        for line in text.splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                metrics[name] = float(value)
+        return metrics
+
+    async def test_metrics(self):
+        client = await self.new_lobby_client()
+        await client.join_lobby('Player', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+
+        metrics = await self.get_metrics()
+        self.assertEqual(1, metrics['qr_lobby_players'])
+        self.assertEqual(0, metrics['qr_game_players'])
+        self.assertEqual(0, metrics['qr_game_waiting_players'])
+        self.assertEqual(1, metrics['qr_lobby_broadcast_duration_seconds_count'])
+        received = metrics.get('qr_messages_received_total{type="ServerAliveRequest"}', 0)
+        sent = metrics['qr_messages_sent_total']
+
+        await client.send_message(ServerAliveRequest.new())
+        await client.assert_received_message(ServerAliveResponse.new())
+
+        metrics = await self.get_metrics()
+        self.assertEqual(received + 1, metrics['qr_messages_received_total{type="ServerAliveRequest"}'])
+        self.assertEqual(received + 1, metrics['qr_message_handling_latency_seconds_count{type="ServerAliveRequest"}'])
+        self.assertEqual(sent + 1, metrics['qr_messages_sent_total'])
+        self.assertIn('qr_received_bytes_total{type="JoinLobbyRequest"}', metrics)
+
+    async def test_closed_connection_not_recorded(self):
+        client = await self.new_lobby_client()
+        await client.join_lobby('Player', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+        received = (await self.get_metrics()).get('qr_messages_received_total{type="DisconnectRequest"}', 0)
+
+        # Closing without sending a disconnect request
+        await client.close()
+        await client.wait_for_disconnect()
+        await asyncio.sleep(0.1)
+
+        metrics = await self.get_metrics()
+        self.assertEqual(received, metrics.get('qr_messages_received_total{type="DisconnectRequest"}', 0))
+        self.assertEqual(
+            received, metrics.get('qr_message_handling_latency_seconds_count{type="DisconnectRequest"}', 0))
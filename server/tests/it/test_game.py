@@ -0,0 +1,281 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from QRServer.common.messages import GrabPieceMessage, NewGridCoordMessage, UsePowerMessage, GameChatMessage, \
+    SettingsTimerMessage, SettingsArenaSizeMessage, SettingsColorMessage, ServerRecentRequest, ServerRankingRequest, \
+    LastLoggedResponse, LastPlayedResponse, ServerRankingThisMonthResponse, AddStatsRequest, ServerPingRequest, \
+    ServerAliveResponse
+from QRServer.common import utils
+from QRServer.db.common import UpdateCollisionError
+from QRServer.db.models import DbMatchReport
+from . import QuadradiusIntegrationTestCase, TestClientConnection
+
+
+class GameIT(QuadradiusIntegrationTestCase):
+    async def itSetUpConfig(self, config):
+        config.set('auth.auto_register', True)
+
+    async def start_match(self) -> tuple[TestClientConnection, TestClientConnection]:
+        for username in ['PlayerA', 'PlayerB']:
+            client = await self.new_lobby_client()
+            await client.join_lobby(username, 'ff585d509bf09ce1d2ff5d4226b7dacb')
+
+        client_a = await self.new_game_client()
+        await client_a.join_game('PlayerA', '1234', 'PlayerB', '4321', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        client_b = await self.new_game_client()
+        await client_b.join_game('PlayerB', '4321', 'PlayerA', '1234', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        return client_a, client_b
+
+    async def test_forward_moves(self):
+        client_a, client_b = await self.start_match()
+
+        await client_a.send_message(GrabPieceMessage.new(3))
+        await client_a.send_message(NewGridCoordMessage.new(3, 4, 5, 0))
+        await client_b.assert_received_message(GrabPieceMessage.new(3))
+        await client_b.assert_received_message(NewGridCoordMessage.new(3, 4, 5, 0))
+
+        await client_b.send_message(UsePowerMessage.new('PLATEAU', 7))
+        await client_a.assert_received_message(UsePowerMessage.new('PLATEAU', 7))
+
+    async def test_forward_settings(self):
+        client_a, client_b = await self.start_match()
+
+        await client_a.send_message(SettingsTimerMessage.new(60000))
+        await client_a.send_message(SettingsArenaSizeMessage.new('large'))
+        await client_b.assert_received_message(SettingsTimerMessage.new(60000))
+        await client_b.assert_received_message(SettingsArenaSizeMessage.new('large'))
+        await client_b.assert_no_more_messages()
+
+    async def join_lobby(self, *usernames: str):
+        for username in usernames:
+            client = await self.new_lobby_client()
+            await client.join_lobby(username, 'ff585d509bf09ce1d2ff5d4226b7dacb')
+
+    async def test_forward_before_opponent_joins(self):
+        await self.join_lobby('PlayerA', 'PlayerB')
+        client_a = await self.new_game_client()
+        await client_a.join_game('PlayerA', '1234', 'PlayerB', '4321', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        await client_a.send_message(SettingsArenaSizeMessage.new('large'))
+        await client_a.send_message(SettingsColorMessage.new(3, 'red'))
+        # Make sure the messages have been handled before the opponent joins
+        await client_a.send_message(ServerPingRequest.new())
+        await client_a.assert_received_message(ServerAliveResponse.new())
+
+        # Sent right after the player count
+        client_b = await self.new_game_client()
+        await client_b.join_game('PlayerB', '4321', 'PlayerA', '1234', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        await client_b.assert_received_message(SettingsArenaSizeMessage.new('large'))
+        await client_b.assert_received_message(SettingsColorMessage.new(3, 'red'))
+
+        await client_a.send_message(SettingsTimerMessage.new(60000))
+        await client_b.assert_received_message(SettingsTimerMessage.new(60000))
+        await client_b.assert_no_more_messages()
+
+    async def test_forward_before_opponent_joins_limited(self):
+        self.config.set('game.max_pending_forward_bytes', len(SettingsArenaSizeMessage.new('large').to_data()))
+        await self.join_lobby('PlayerA', 'PlayerB')
+        client_a = await self.new_game_client()
+        await client_a.join_game('PlayerA', '1234', 'PlayerB', '4321', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        await client_a.send_message(SettingsArenaSizeMessage.new('large'))
+        with self.assertLogs('qr.game_client_handler', 'WARNING'):
+            await client_a.send_message(SettingsTimerMessage.new(60000))
+            await client_a.send_message(ServerPingRequest.new())
+            await client_a.assert_received_message(ServerAliveResponse.new())
+            client_b = await self.new_game_client()
+            await client_b.join_game('PlayerB', '4321', 'PlayerA', '1234', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+
+        await client_b.assert_received_message(SettingsArenaSizeMessage.new('large'))
+        await client_b.assert_no_more_messages()
+
+    async def test_forward_non_ascii_chat(self):
+        client_a, client_b = await self.start_match()
+
+        await client_a.send_data('<S>~<CHAT>~PlayerA: zażółć\x00'.encode('utf-8'))
+        await client_b.assert_received_message(GameChatMessage.new('PlayerA: za????????'))
+
+    async def test_match_results_shown_in_lobby(self):
+        client_a, client_b = await self.start_match()
+        lobby_client = await self.new_lobby_client()
+        await lobby_client.join_lobby_guest('Observer')
+        now = datetime.now(timezone.utc)
+        connector = self.server.connector
+
+        with patch.object(connector, 'get_recent_matches', wraps=connector.get_recent_matches) as get_recent_matches, \
+                patch.object(connector, 'get_ranking', wraps=connector.get_ranking) as get_ranking:
+            for _ in range(2):
+                await lobby_client.send_message(ServerRecentRequest.new())
+                await lobby_client.assert_received_message_type(LastLoggedResponse)
+                recent = await lobby_client.receive_message()
+                self.assertIsInstance(recent, LastPlayedResponse)
+                self.assertIn('No recent battles# # ', recent.args)
+
+                await lobby_client.send_message(ServerRankingRequest.new(now.year, now.month))
+                await lobby_client.assert_received_message(ServerRankingThisMonthResponse.new([]))
+
+            # Served from the lobby cache the second time
+            self.assertEqual(get_recent_matches.call_count, 1)
+            self.assertEqual(get_ranking.call_count, 1)
+
+            await client_a.send_message(AddStatsRequest.new(10, 0, 20, 'small', 'small'))
+            await client_b.send_message(AddStatsRequest.new(0, 10, 20, 'small', 'small'))
+
+            async def wait_for_result():
+                while self.server.lobby_manager.match_results_version == 0:
+                    await asyncio.sleep(0.01)
+
+            await asyncio.wait_for(wait_for_result(), 1)
+
+            await lobby_client.send_message(ServerRecentRequest.new())
+            await lobby_client.assert_received_message_type(LastLoggedResponse)
+            recent = await lobby_client.receive_message()
+            self.assertIsInstance(recent, LastPlayedResponse)
+            self.assertIn('PlayerA beat PlayerB#10-0#0:00', recent.args)
+
+            await lobby_client.send_message(ServerRankingRequest.new(now.year, now.month))
+            ranking = await lobby_client.receive_message()
+            self.assertIsInstance(ranking, ServerRankingThisMonthResponse)
+            self.assertEqual(ranking.args[3:], ['PlayerA', '1', '1', 'PlayerB', '0', '1'])
+
+            self.assertEqual(get_recent_matches.call_count, 2)
+            self.assertEqual(get_ranking.call_count, 2)
+
+    async def test_queued_match_results_recorded(self):
+        client_a, client_b = await self.start_match()
+        connector = self.server.connector
+        player_a = await connector.get_user_by_username('PlayerA')
+        player_b = await connector.get_user_by_username('PlayerB')
+
+        # Left in the queue, e.g. when the server stopped before recording it
+        leftover = DbMatchReport(
+            winner_id=player_b.user_id,
+            loser_id=player_a.user_id,
+            winner_pieces_left=5,
+            loser_pieces_left=0,
+            move_counter=30,
+            grid_size='small',
+            squadron_size='small',
+            started_at=datetime(2020, 1, 1, 0, 0, 0, tzinfo=timezone.utc),
+            finished_at=datetime(2020, 1, 1, 1, 0, 0, tzinfo=timezone.utc),
+            is_ranked=True,
+            is_void=False,
+        )
+        await connector.enqueue_match_result(leftover)
+
+        await client_a.send_message(AddStatsRequest.new(10, 0, 20, 'small', 'small'))
+        await client_b.send_message(AddStatsRequest.new(0, 10, 20, 'small', 'small'))
+
+        async def wait_for_results():
+            while await connector.get_pending_match_results():
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(wait_for_results(), 1)
+
+        self.assertEqual(self.server.lobby_manager.match_results_version, 2)
+        self.assertIsNotNone(await connector.get_match(leftover.match_id))
+        recent = await connector.get_recent_matches()
+        self.assertEqual([(r.player_won, r.player_lost) for r in recent],
+                         [('PlayerA', 'PlayerB'), ('PlayerB', 'PlayerA')])
+
+    async def test_failed_match_result_retried(self):
+        client_a, client_b = await self.start_match()
+        connector = self.server.connector
+        update_or_insert_rating = connector._update_or_insert_rating
+        collisions = 0
+
+        # More collisions than recording the result retries at once
+        async def collide(*args, **kwargs):
+            nonlocal collisions
+            if collisions < 3:
+                collisions += 1
+                raise UpdateCollisionError('Rating changed')
+            return await update_or_insert_rating(*args, **kwargs)
+
+        with patch.object(connector, '_update_or_insert_rating', side_effect=collide), \
+                patch('QRServer.game.gameserver._match_result_retry_min_delay_s', 0.1), \
+                self.assertLogs('qr.game_server', 'ERROR'):
+            await client_a.send_message(AddStatsRequest.new(10, 0, 20, 'small', 'small'))
+            await client_b.send_message(AddStatsRequest.new(0, 10, 20, 'small', 'small'))
+
+            # Retried without waiting for another result to be queued
+            async def wait_for_results():
+                while not await connector.get_recent_matches() or await connector.get_pending_match_results():
+                    await asyncio.sleep(0.01)
+
+            await asyncio.wait_for(wait_for_results(), 3)
+
+        player_a = await connector.get_user_by_username('PlayerA')
+        player_b = await connector.get_user_by_username('PlayerB')
+        now = datetime.now(timezone.utc)
+        rating_a, rating_b = utils.calculate_new_ratings(500, 500)
+        self.assertEqual((await connector.get_user_rating(player_a.user_id, now.month, now.year)).rating, rating_a)
+        self.assertEqual((await connector.get_user_rating(player_b.user_id, now.month, now.year)).rating, rating_b)
+        ranking = await connector.get_ranking(*utils.make_month_dates(now.month, now.year))
+        self.assertEqual([(e.username, e.wins, e.games) for e in ranking], [('PlayerA', 1, 1), ('PlayerB', 0, 1)])
+
+    async def test_match_results_processed_after_queue_read_fails(self):
+        client_a, client_b = await self.start_match()
+        connector = self.server.connector
+        get_pending_match_results = connector.get_pending_match_results
+        failures = 0
+
+        async def fail_once():
+            nonlocal failures
+            if failures < 1:
+                failures += 1
+                raise sqlite3.OperationalError('database is locked')
+            return await get_pending_match_results()
+
+        with patch.object(connector, 'get_pending_match_results', side_effect=fail_once), \
+                patch('QRServer.game.gameserver._match_result_retry_min_delay_s', 0.1), \
+                self.assertLogs('qr.game_server', 'ERROR'):
+            await client_a.send_message(AddStatsRequest.new(10, 0, 20, 'small', 'small'))
+            await client_b.send_message(AddStatsRequest.new(0, 10, 20, 'small', 'small'))
+
+            async def wait_for_results():
+                while not await connector.get_recent_matches() or await get_pending_match_results():
+                    await asyncio.sleep(0.01)
+
+            await asyncio.wait_for(wait_for_results(), 3)
+
+        self.assertEqual(failures, 1)
+        recent = await connector.get_recent_matches()
+        self.assertEqual([(r.player_won, r.player_lost) for r in recent], [('PlayerA', 'PlayerB')])
+
+
+class GameRendezvousIT(QuadradiusIntegrationTestCase):
+    async def itSetUpConfig(self, config):
+        config.set('auth.auto_register', True)
+        config.set('game.opponent_timeout_sec', 1)
+
+    async def join_game(self, username: str, opponent_username: str) -> TestClientConnection:
+        client = await self.new_game_client()
+        await client.join_game(username, '1234', opponent_username, '4321', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        return client
+
+    async def test_waiting_players_disconnected(self):
+        for username in ['PlayerA', 'PlayerB', 'PlayerC', 'PlayerD', 'PlayerE', 'PlayerF']:
+            client = await self.new_lobby_client()
+            await client.join_lobby(username, 'ff585d509bf09ce1d2ff5d4226b7dacb')
+
+        client_a = await self.join_game('PlayerA', 'PlayerB')
+        client_b = await self.join_game('PlayerB', 'PlayerA')
+        client_c = await self.join_game('PlayerC', 'PlayerD')
+        client_e = await self.join_game('PlayerE', 'PlayerF')
+
+        game_server = self.server.game_server
+        self.assertEqual(game_server.get_playing_count(), 2)
+        self.assertEqual(game_server.get_waiting_count(), 2)
+
+        # Both waiting players are disconnected, nobody else
+        await asyncio.wait_for(client_c.connection_closed.wait(), 3)
+        await asyncio.wait_for(client_e.connection_closed.wait(), 3)
+        self.assertFalse(client_a.connection_closed.is_set())
+        self.assertFalse(client_b.connection_closed.is_set())
+        self.assertEqual(len(game_server.matches), 1)
+        self.assertEqual(game_server.get_playing_count(), 2)
+        self.assertEqual(game_server.get_waiting_count(), 0)
+
+        await client_a.send_message(GrabPieceMessage.new(3))
+        await client_b.assert_received_message(GrabPieceMessage.new(3))
@@ -0,0 +1,118 @@
+import asyncio
+from unittest.mock import patch
+
+from QRServer.common.messages import GrabPieceMessage, NewGridCoordMessage, UsePowerMessage, AddStatsRequest, \
+    PolicyFileRequest, CrossDomainPolicyAllowAllResponse, Message
+from . import QuadradiusIntegrationTestCase, TestClientConnection
+
+
+class GameWorkersIT(QuadradiusIntegrationTestCase):
+    async def itSetUpConfig(self, config):
+        config.set('api.enabled', True)
+        config.set('auth.auto_register', True)
+        config.set('game.workers', 2)
+
+    async def start_match(self, username_a: str, username_b: str) -> tuple[TestClientConnection, TestClientConnection]:
+        for username in [username_a, username_b]:
+            client = await self.new_lobby_client()
+            await client.join_lobby(username, 'ff585d509bf09ce1d2ff5d4226b7dacb')
+
+        client_a = await self.new_game_client()
+        await client_a.join_game(username_a, '1234', username_b, '4321', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        client_b = await self.new_game_client()
+        await client_b.join_game(username_b, '4321', username_a, '1234', 'ff585d509bf09ce1d2ff5d4226b7dacb')
+        return client_a, client_b
+
+    async def wait_for_game_player_count(self, player_count: int):
+        async def wait():
+            while self.server.game_server.get_player_count() != player_count:
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(wait(), 5)
+
+    async def assert_moves_forwarded(self, matches: list[tuple[TestClientConnection, TestClientConnection]]):
+        for i, (client_a, client_b) in enumerate(matches):
+            await client_a.send_message(GrabPieceMessage.new(i))
+            await client_a.send_message(NewGridCoordMessage.new(i, 4, 5, 0))
+            await client_b.send_message(UsePowerMessage.new('PLATEAU', i))
+
+        for i, (client_a, client_b) in enumerate(matches):
+            await client_b.assert_received_message(GrabPieceMessage.new(i))
+            await client_b.assert_received_message(NewGridCoordMessage.new(i, 4, 5, 0))
+            await client_a.assert_received_message(UsePowerMessage.new('PLATEAU', i))
+
+    async def test_forward_moves(self):
+        # Several matches, so that they are spread over the workers
+        matches = [await self.start_match(f'Player{i}A', f'Player{i}B') for i in range(4)]
+        await self.assert_moves_forwarded(matches)
+
+        # Games are relayed by the workers only
+        self.assertEqual(self.server.game_server.matches, {})
+        await self.wait_for_game_player_count(8)
+
+        api_client = await self.new_api_client('v1')
+        async with api_client.get('game/stats') as r:
+            self.assertEqual(r.status, 200)
+            self.assertEqual(await r.json(), {'player_count': 8, 'playing_count': 8, 'waiting_count': 0})
+
+        client_a, client_b = matches[0]
+        await client_a.disconnect()
+        await client_b.disconnect()
+        await self.wait_for_game_player_count(6)
+
+    async def test_match_result_recorded(self):
+        client_a, client_b = await self.start_match('PlayerA', 'PlayerB')
+
+        await client_a.send_message(AddStatsRequest.new(10, 0, 20, 'small', 'small'))
+        await client_b.send_message(AddStatsRequest.new(0, 10, 20, 'small', 'small'))
+
+        async def wait_for_result():
+            # Queued by the worker in the main process, and recorded there
+            while not await self.connector.get_recent_matches() or await self.connector.get_pending_match_results():
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(wait_for_result(), 5)
+
+        recent = await self.connector.get_recent_matches()
+        self.assertEqual([(r.player_won, r.player_lost) for r in recent], [('PlayerA', 'PlayerB')])
+        self.assertEqual(self.server.lobby_manager.match_results_version, 1)
+
+    async def test_policy_file(self):
+        client = await self.new_game_client()
+        await client.send_message(PolicyFileRequest.new())
+        await client.assert_received_message(CrossDomainPolicyAllowAllResponse.new())
+
+    async def test_malformed_join_disconnected(self):
+        client = await self.new_game_client()
+        with patch.object(Message, 'from_data', side_effect=RuntimeError('malformed')), \
+                self.assertLogs('qr.game_workers', 'ERROR'):
+            await client.send_message(PolicyFileRequest.new())
+            await client.assert_connection_closed()
+
+    async def test_matches_not_routed_to_stopped_worker(self):
+        workers = self.server._game_workers._workers
+        workers[0].running = False
+        try:
+            matches = [await self.start_match(f'Player{i}A', f'Player{i}B') for i in range(4)]
+            await self.assert_moves_forwarded(matches)
+            await self.wait_for_game_player_count(8)
+            self.assertEqual((workers[0].playing_count, workers[1].playing_count), (0, 8))
+        finally:
+            workers[0].running = True
+
+    async def test_stopped_worker_restarted(self):
+        worker = self.server._game_workers._workers[0]
+        process = worker.process
+
+        async def wait_restarted():
+            while worker.process is process or not worker.running:
+                await asyncio.sleep(0.01)
+
+        with self.assertLogs('qr.game_workers', 'ERROR'):
+            process.kill()
+            await asyncio.wait_for(wait_restarted(), 10)
+
+        matches = [await self.start_match(f'Player{i}A', f'Player{i}B') for i in range(4)]
+        await self.assert_moves_forwarded(matches)
+        await self.wait_for_game_player_count(8)
+        self.assertGreater(worker.playing_count, 0)
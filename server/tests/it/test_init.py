@@ -9,6 +9,7 @@ class InitIT(QuadradiusIntegrationTestCase):
         self.assertGreater(self.server.lobby_socks[0].getsockname()[1], 1023)
         self.assertGreater(self.server.game_socks[0].getsockname()[1], 1023)
         # ensure no clients are connected
+        self.assertEqual(len(self.server.lobby_manager.rooms), 1)
         for i in range(13):
-            self.assertIsNone(self.server.lobby_server.clients[i])
+            self.assertIsNone(self.server.lobby_manager.rooms[0].clients[i])
         self.assertEqual(len(self.server.game_server.matches), 0)
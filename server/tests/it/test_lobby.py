@@ -22,11 +22,43 @@ class LobbyIT(QuadradiusIntegrationTestCase):
             LobbyStateResponse.new([LobbyPlayer(username='John')]))
         await client.assert_no_more_messages()
 
-        clients = self.server.lobby_server.clients
+        clients = self.server.lobby_manager.rooms[0].clients
         self.assertEqual(clients[0].username, 'John')
         for i in range(1, 13):
             self.assertEqual(clients[i], None)
 
+    async def test_lobby_state_cached(self):
+        lobby_server = self.server.lobby_manager.rooms[0]
+        client1 = await self.new_lobby_client()
+        await client1.join_lobby('John', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+
+        version = lobby_server.lobby_state_version
+        data = lobby_server.get_lobby_state_data()
+        self.assertIs(data, lobby_server.get_lobby_state_data())
+
+        await client1.send_message(SetCommentRequest.new(0, 'comment'))
+        await client1.receive_message()
+        self.assertGreater(lobby_server.lobby_state_version, version)
+        self.assertEqual(
+            LobbyStateResponse.new([LobbyPlayer(username='John', comment='comment')]).to_data(),
+            lobby_server.get_lobby_state_data())
+
+        version = lobby_server.lobby_state_version
+        client2 = await self.new_lobby_client()
+        await client2.join_lobby('Mark', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+        await client1.assert_received_message(LobbyStateResponse.new([
+            LobbyPlayer(username='John', comment='comment'),
+            LobbyPlayer(username='Mark'),
+        ]))
+        self.assertGreater(lobby_server.lobby_state_version, version)
+
+        version = lobby_server.lobby_state_version
+        await client2.disconnect_and_wait()
+        await client1.assert_received_message(LobbyStateResponse.new([
+            LobbyPlayer(username='John', comment='comment'),
+        ]))
+        self.assertGreater(lobby_server.lobby_state_version, version)
+
     async def test_join_multiple(self):
         client1 = await self.new_lobby_client()
         client2 = await self.new_lobby_client()
@@ -45,7 +77,7 @@ class LobbyIT(QuadradiusIntegrationTestCase):
         await client1.assert_no_more_messages()
         await client2.assert_no_more_messages()
 
-        clients = self.server.lobby_server.clients
+        clients = self.server.lobby_manager.rooms[0].clients
         self.assertEqual(clients[0].username, 'John')
         self.assertEqual(clients[1].username, 'Robert')
         for i in range(2, 13):
@@ -57,7 +89,7 @@ class LobbyIT(QuadradiusIntegrationTestCase):
             LobbyStateResponse.new([None, LobbyPlayer(username='Robert')]))
         await client2.assert_no_more_messages()
 
-        clients = self.server.lobby_server.clients
+        clients = self.server.lobby_manager.rooms[0].clients
         self.assertEqual(clients[0], None)
         self.assertEqual(clients[1].username, 'Robert')
         for i in range(2, 13):
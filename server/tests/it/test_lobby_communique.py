@@ -81,3 +81,41 @@ class LobbyCommuniqueIT(QuadradiusIntegrationTestCase):
             LobbyPlayer(username='Bobert'),
         ]))
         await client2.assert_no_more_messages()
+
+    async def test_communique_send_error(self):
+        client1 = await self.new_lobby_client()
+        await client1.join_lobby('Robert', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+
+        client2 = await self.new_lobby_client()
+        await client2.join_lobby('Bobert', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+        await client1.assert_received_message_type(LobbyStateResponse)
+
+        client3 = await self.new_lobby_client()
+        await client3.join_lobby('John', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+        await client1.assert_received_message_type(LobbyStateResponse)
+        await client2.assert_received_message_type(LobbyStateResponse)
+
+        await client2.drop()
+        await client1.send_message(
+            SetCommentRequest.new(0, 'test communique'))
+
+        # The broadcast reaches everyone else, and the client it failed for is kicked
+        expected_lobby_state = LobbyStateResponse.new([
+            LobbyPlayer(username='Robert', comment='test communique'),
+            None,
+            LobbyPlayer(username='John'),
+        ])
+        await client1.assert_received_message(BroadcastCommentResponse.new(0, 'test communique'))
+        await client1.assert_received_message(expected_lobby_state)
+        await client3.assert_received_message(BroadcastCommentResponse.new(0, 'test communique'))
+        await client3.assert_received_message(expected_lobby_state)
+        await client2.wait_for_disconnect()
+
+        # The handler of the sender is still running
+        await client1.send_message(
+            SetCommentRequest.new(0, 'second communique'))
+        await client1.assert_received_message(BroadcastCommentResponse.new(0, 'second communique'))
+        await client3.assert_received_message(BroadcastCommentResponse.new(0, 'second communique'))
+
+        await client1.assert_no_more_messages()
+        await client3.assert_no_more_messages()
@@ -0,0 +1,72 @@
+from QRServer.common.classes import LobbyPlayer
+from QRServer.common.messages import LobbyStateResponse, LobbyChatMessage, JoinLobbyRequest, LobbyDuplicateResponse
+from . import QuadradiusIntegrationTestCase, TestClientConnection
+
+
+class LobbyRoomsIT(QuadradiusIntegrationTestCase):
+    async def itSetUpConfig(self, config):
+        config.set('api.enabled', True)
+        config.set('auth.auto_register', True)
+        config.set('lobby.max_rooms', 2)
+
+    async def fill_room(self, prefix: str) -> list[TestClientConnection]:
+        clients = []
+        for i in range(13):
+            client = await self.new_lobby_client()
+            await client.join_lobby(f'{prefix} {i}', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+            clients.append(client)
+        return clients
+
+    async def test_new_room_opened_when_full(self):
+        first_room = await self.fill_room('Player')
+        self.assertEqual(len(self.server.lobby_manager.rooms), 1)
+        for client in first_room:
+            while not client.messages.empty():
+                await client.receive_message()
+
+        client = await self.new_lobby_client()
+        await client.send_message(JoinLobbyRequest.new('Player Over Limit', 'cf585d509bf09ce1d2ff5d4226b7dacb'))
+        await client.assert_received_message(LobbyStateResponse.new([LobbyPlayer(username='Player Over Limit')]))
+
+        rooms = self.server.lobby_manager.rooms
+        self.assertEqual(len(rooms), 2)
+        self.assertEqual(rooms[1].clients[0].username, 'Player Over Limit')
+
+        # Nobody is kicked, and the rooms do not see each other
+        await client.send_message(LobbyChatMessage.new(0, 'Player Over Limit: hello'))
+        await client.assert_received_message(LobbyChatMessage.new(0, 'Player Over Limit: hello'))
+        for first_room_client in first_room:
+            await first_room_client.assert_no_more_messages()
+            self.assertFalse(first_room_client.connection_closed.is_set())
+
+        api_client = await self.new_api_client('v1')
+        async with api_client.get('lobby/stats') as r:
+            self.assertEqual(r.status, 200)
+            self.assertEqual(await r.json(), {
+                'player_count': 14,
+                'room_count': 2,
+                'rooms': [
+                    {'player_count': 13, 'capacity': 13},
+                    {'player_count': 1, 'capacity': 13},
+                ],
+            })
+
+    async def test_duplicate_in_other_room(self):
+        await self.fill_room('Player')
+
+        client = await self.new_lobby_client()
+        await client.send_message(JoinLobbyRequest.new('Player 0', 'cf585d509bf09ce1d2ff5d4226b7dacb'))
+        await client.assert_received_message(LobbyDuplicateResponse.new())
+
+    async def test_kick_when_all_rooms_full(self):
+        first_room = await self.fill_room('Player')
+        second_room = await self.fill_room('Other')
+        self.assertEqual(len(self.server.lobby_manager.rooms), 2)
+
+        client = await self.new_lobby_client()
+        await client.join_lobby('Player Over Limit', 'cf585d509bf09ce1d2ff5d4226b7dacb')
+
+        # The oldest player of all rooms is kicked
+        await first_room[0].assert_connection_closed()
+        self.assertEqual(self.server.lobby_manager.rooms[0].clients[0].username, 'Player Over Limit')
+        self.assertFalse(second_room[0].connection_closed.is_set())
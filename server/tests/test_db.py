@@ -1,16 +1,20 @@
 import asyncio
+import os
+import sqlite3
 import unittest
 from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
 import uuid
 from QRServer.common.classes import GameResultHistory
 from QRServer.db import migrations
+from QRServer.db.common import UpdateCollisionError
 from QRServer.db.connector import DbConnector
 from QRServer.db.models import DbMatchReport, Tournament, TournamentParticipant
 from QRServer.common.classes import RankingEntry
 from QRServer.common import utils
 from QRServer.config import Config
-from QRServer.db.password import password_hash
+from QRServer.db.password import CredentialCache, password_hash
 
 
 class DbTest(unittest.IsolatedAsyncioTestCase):
@@ -38,6 +42,78 @@ class DbTest(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(user.created_at, datetime(2020, 1, 1, 0, 0, 0, tzinfo=timezone.utc).timestamp())
             self.assertTrue(user.is_guest)
 
+    async def test_authenticate_member(self):
+        user_id = await self.conn.create_member('test_member', b'password')
+
+        user = await self.conn.authenticate_user('test_member', b'password')
+        self.assertEqual(user.user_id, user_id)
+        self.assertIsNone(await self.conn.authenticate_user('test_member', b'wrong'))
+        self.assertIsNone(await self.conn.authenticate_user('test_member', None))
+
+        await self.conn.change_user_password(user_id, b'changed')
+        self.assertIsNone(await self.conn.authenticate_user('test_member', b'password'))
+        self.assertEqual((await self.conn.authenticate_user('test_member', b'changed')).user_id, user_id)
+
+    async def test_authenticate_member_cached(self):
+        user_id = await self.conn.create_member('test_member', b'password')
+
+        with patch.object(self.conn._password_hasher, 'verify', wraps=self.conn._password_hasher.verify) as verify:
+            self.assertIsNotNone(await self.conn.authenticate_user('test_member', b'password'))
+            self.assertIsNotNone(await self.conn.authenticate_user('test_member', b'password'))
+            self.assertEqual(verify.call_count, 1)
+
+            self.assertIsNone(await self.conn.authenticate_user('test_member', b'wrong'))
+            self.assertEqual(verify.call_count, 2)
+
+            await self.conn.ban_user(user_id, 'discord_id', 'reason')
+            user = await self.conn.authenticate_user('test_member', b'password')
+            self.assertIsNotNone(user.banned_at)
+            self.assertEqual(verify.call_count, 3)
+
+    async def test_authenticate_existing_user_not_hashed(self):
+        with patch.object(self.conn._password_hasher, 'hash', wraps=self.conn._password_hasher.hash) as hash_mock:
+            user = await self.conn.authenticate_user('test_user', b'password', auto_create=True)
+            self.assertEqual(hash_mock.call_count, 1)
+
+            for _ in range(3):
+                self.assertEqual(
+                    (await self.conn.authenticate_user('test_user', b'password', auto_create=True)).user_id,
+                    user.user_id)
+            self.assertIsNone(await self.conn.authenticate_user('test_user', b'wrong', auto_create=True))
+            self.assertEqual(hash_mock.call_count, 1)
+
+    async def test_credential_cache_expiry(self):
+        cache = CredentialCache(ttl=10, max_size=2)
+        with patch('QRServer.db.password.time.monotonic') as mock_monotonic:
+            mock_monotonic.return_value = 100
+            cache.add('1', b'password', 'hash')
+            cache.add('2', b'password', 'hash')
+            self.assertTrue(cache.contains('1', b'password', 'hash'))
+            self.assertFalse(cache.contains('1', b'password', 'changed hash'))
+            self.assertFalse(cache.contains('1', b'wrong', 'hash'))
+
+            cache.add('3', b'password', 'hash')
+            self.assertFalse(cache.contains('2', b'password', 'hash'))
+
+            mock_monotonic.return_value = 110
+            self.assertFalse(cache.contains('1', b'password', 'hash'))
+
+    async def test_password_hashing_does_not_block(self):
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticker = asyncio.create_task(tick())
+        try:
+            await asyncio.gather(*(self.conn.create_member(f'test_member_{i}', b'password') for i in range(4)))
+        finally:
+            ticker.cancel()
+        self.assertGreater(ticks, 4)
+
     async def test_add_match_results(self):
         with patch('uuid.uuid4') as mock_uuid:
             mock_uuid.return_value = '1'
@@ -104,6 +180,31 @@ class DbTest(unittest.IsolatedAsyncioTestCase):
         match = await self.conn.get_match('1234')
         self.assertIsNone(match)
 
+    async def test_pending_match_results(self):
+        self.assertEqual(await self.conn.get_pending_match_results(), [])
+
+        reports = [DbMatchReport(
+            winner_id='1',
+            loser_id='2',
+            winner_pieces_left=i,
+            loser_pieces_left=0,
+            move_counter=20,
+            grid_size='small',
+            squadron_size='medium',
+            started_at=datetime(2020, 1, 1, 0, i, 0, tzinfo=timezone.utc),
+            finished_at=datetime(2020, 1, 1, 1, i, 0, tzinfo=timezone.utc),
+            is_ranked=bool(i % 2),
+            is_void=False,
+        ) for i in range(3)]
+        for report in reports:
+            await self.conn.enqueue_match_result(report)
+
+        pending = await self.conn.get_pending_match_results()
+        self.assertEqual([report for _, report in pending], reports)
+
+        await self.conn.remove_pending_match_result(pending[1][0])
+        self.assertEqual(await self.conn.get_pending_match_results(), [pending[0], pending[2]])
+
     async def test_get_recent_matches(self):
         with patch('uuid.uuid4') as mock_uuid:
             recent_matches = []
@@ -155,6 +256,74 @@ class DbTest(unittest.IsolatedAsyncioTestCase):
                 self.assertEqual(matches[i].start, recent_matches[i].start)
                 self.assertEqual(matches[i].finish, recent_matches[i].finish)
 
+    async def test_rebuild_rankings(self):
+        users = [await self.conn.authenticate_user(f'test_user_{i} GUEST', None, auto_create=True) for i in range(4)]
+        for i, (winner, loser) in enumerate([(0, 1), (0, 2), (1, 2), (3, 0), (2, 3), (0, 1)]):
+            await self.conn.add_match_result(DbMatchReport(
+                winner_id=users[winner].user_id,
+                loser_id=users[loser].user_id,
+                winner_pieces_left=10,
+                loser_pieces_left=0,
+                move_counter=20,
+                grid_size='small',
+                squadron_size='medium',
+                started_at=datetime(2020, 1 + i % 2, 1, i, 0, 0, tzinfo=timezone.utc),
+                finished_at=datetime(2020, 1 + i % 2, 1, i + 1, 0, 0, tzinfo=timezone.utc),
+                is_ranked=True,
+                is_void=False,
+            ))
+
+        async def get_rankings():
+            return [await self.conn.get_ranking(*utils.make_month_dates(month, 2020)) for month in (1, 2)]
+
+        rankings = await get_rankings()
+        # Matches 0, 2 and 4 are in January
+        self.assertEqual({e.user_id: (e.wins, e.games) for e in rankings[0]}, {
+            users[0].user_id: (1, 1),
+            users[1].user_id: (1, 2),
+            users[2].user_id: (1, 2),
+            users[3].user_id: (0, 1),
+        })
+
+        async with self.conn._transaction('w') as c:
+            await c.execute('delete from user_monthly_stats')
+            await c.execute('delete from rankings')
+        self.assertEqual(await get_rankings(), [[], []])
+
+        self.assertEqual(await self.conn.rebuild_rankings(), 2)
+        self.assertEqual(await get_rankings(), rankings)
+
+    async def test_update_ranking_removes_stale_positions(self):
+        winner = await self.conn.authenticate_user('test_user_1 GUEST', None, auto_create=True)
+        loser = await self.conn.authenticate_user('test_user_2 GUEST', None, auto_create=True)
+        async with self.conn._transaction('w') as c:
+            await c.execute(
+                "insert into rankings (year, month, position, user_id, wins, total_games)"
+                " values (2020, 1, 3, ?, 5, 5), (2020, 2, 3, ?, 5, 5)",
+                (winner.user_id, winner.user_id))
+
+        await self.conn.add_match_result(DbMatchReport(
+            winner_id=winner.user_id,
+            loser_id=loser.user_id,
+            winner_pieces_left=10,
+            loser_pieces_left=0,
+            move_counter=20,
+            grid_size='small',
+            squadron_size='medium',
+            started_at=datetime(2020, 1, 1, 0, 0, 0, tzinfo=timezone.utc),
+            finished_at=datetime(2020, 1, 1, 1, 0, 0, tzinfo=timezone.utc),
+            is_ranked=True,
+            is_void=False,
+        ))
+
+        async with self.conn._transaction('r') as c:
+            await c.execute('select year, month, position, user_id from rankings order by year, month, position')
+            self.assertEqual(await c.fetchall(), [
+                (2020, 1, 1, winner.user_id),
+                (2020, 1, 2, loser.user_id),
+                (2020, 2, 3, winner.user_id),
+            ])
+
     async def test_get_ranking(self):
         with patch('uuid.uuid4') as mock_uuid:
             # Set up 4 users
@@ -406,11 +575,11 @@ class DbTest(unittest.IsolatedAsyncioTestCase):
 
         month, year = 4, 2025
 
-        async def call():
-            await self.conn._update_users_rating(winner.user_id, loser.user_id, month, year)
+        async def call(hour: int):
+            await self.conn.add_match_result(self.new_match_report(winner.user_id, loser.user_id, hour))
 
         await asyncio.wait_for(
-            asyncio.gather(call(), call(), return_exceptions=False),
+            asyncio.gather(call(0), call(1), return_exceptions=False),
             timeout=5,
         )
 
@@ -423,6 +592,110 @@ class DbTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(winner_rating.revision, 1)
         self.assertEqual(loser_rating.revision, 1)
 
+    async def test_rating_update_retried_after_collision(self):
+        with patch('uuid.uuid4') as mock_uuid:
+            mock_uuid.return_value = '0'
+            await self.conn.authenticate_user('test_user_0 GUEST', None, auto_create=True)
+            mock_uuid.return_value = '1'
+            await self.conn.authenticate_user('test_user_1 GUEST', None, auto_create=True)
+
+        month, year = 4, 2025
+        await self.conn.add_match_result(self.new_match_report('0', '1', hour=0))
+        rating_0 = (await self.conn.get_user_rating('0', month, year)).rating
+        rating_1 = (await self.conn.get_user_rating('1', month, year)).rating
+
+        with patch.object(self.conn, '_update_or_insert_rating',
+                          wraps=self.conn._update_or_insert_rating) as update_or_insert_rating, \
+                self.patch_concurrent_match(self.new_match_report('1', '0', hour=1)):
+            await self.conn.add_match_result(self.new_match_report('0', '1', hour=2))
+
+        # The collision is detected on the first write, then the update is retried with the new ratings
+        self.assertEqual(update_or_insert_rating.call_count, 5)
+
+        rating_1, rating_0 = utils.calculate_new_ratings(rating_1, rating_0)
+        rating_0, rating_1 = utils.calculate_new_ratings(rating_0, rating_1)
+        winner_rating = await self.conn.get_user_rating('0', month, year)
+        loser_rating = await self.conn.get_user_rating('1', month, year)
+        self.assertEqual((winner_rating.rating, winner_rating.revision), (rating_0, 2))
+        self.assertEqual((loser_rating.rating, loser_rating.revision), (rating_1, 2))
+
+    def patch_concurrent_match(self, other_report: DbMatchReport):
+        """Records the other match between reading and writing the ratings of the next match"""
+        compute_users_rating = self.conn._compute_users_rating
+
+        async def compute_then_record_other(*args, **kwargs):
+            rating_updates = await compute_users_rating(*args, **kwargs)
+            if self.conn._compute_users_rating.call_count == 1:
+                await self.conn.add_match_result(other_report)
+            return rating_updates
+
+        return patch.object(self.conn, '_compute_users_rating', side_effect=compute_then_record_other)
+
+    def new_match_report(self, winner_id: str, loser_id: str, hour: int = 0) -> DbMatchReport:
+        return DbMatchReport(
+            winner_id=winner_id,
+            loser_id=loser_id,
+            winner_pieces_left=10,
+            loser_pieces_left=0,
+            move_counter=20,
+            grid_size='small',
+            squadron_size='medium',
+            started_at=datetime(2025, 4, 1, hour, 0, 0, tzinfo=timezone.utc),
+            finished_at=datetime(2025, 4, 1, hour, 30, 0, tzinfo=timezone.utc),
+            is_ranked=True,
+            is_void=False,
+        )
+
+    async def test_match_result_retried_after_collision(self):
+        user_0 = await self.conn.authenticate_user('test_user_0 GUEST', None, auto_create=True)
+        user_1 = await self.conn.authenticate_user('test_user_1 GUEST', None, auto_create=True)
+        month, year = 4, 2025
+
+        with self.patch_concurrent_match(self.new_match_report(user_1.user_id, user_0.user_id, 1)) \
+                as compute_users_rating:
+            await self.conn.add_match_result(self.new_match_report(user_0.user_id, user_1.user_id))
+        # The other match, then the match again from the start, with the new ratings
+        self.assertEqual(compute_users_rating.call_count, 3)
+
+        # Both matches are rated one after the other
+        rating_1, rating_0 = utils.calculate_new_ratings(500, 500)
+        rating_0, rating_1 = utils.calculate_new_ratings(rating_0, rating_1)
+        self.assertEqual((await self.conn.get_user_rating(user_0.user_id, month, year)).rating, rating_0)
+        self.assertEqual((await self.conn.get_user_rating(user_1.user_id, month, year)).rating, rating_1)
+        ranking = await self.conn.get_ranking(*utils.make_month_dates(month, year))
+        self.assertEqual({e.user_id: (e.wins, e.games) for e in ranking}, {
+            user_0.user_id: (1, 2),
+            user_1.user_id: (1, 2),
+        })
+
+    async def test_match_result_not_recorded_when_collisions_persist(self):
+        user_0 = await self.conn.authenticate_user('test_user_0 GUEST', None, auto_create=True)
+        user_1 = await self.conn.authenticate_user('test_user_1 GUEST', None, auto_create=True)
+        report = self.new_match_report(user_0.user_id, user_1.user_id)
+        month, year = 4, 2025
+
+        with patch.object(self.conn, '_update_or_insert_rating',
+                          side_effect=UpdateCollisionError('Rating changed')) as update_or_insert_rating:
+            with self.assertRaises(UpdateCollisionError):
+                await self.conn.add_match_result(report)
+        self.assertEqual(update_or_insert_rating.call_count, 3)
+
+        # Nothing is recorded, so that recording the match can be repeated
+        self.assertIsNone(await self.conn.get_match(report.match_id))
+        self.assertIsNone(await self.conn.get_user_rating(user_0.user_id, month, year))
+        self.assertEqual(await self.conn.get_ranking(*utils.make_month_dates(month, year)), [])
+
+        await self.conn.add_match_result(report)
+        new_rating_0, new_rating_1 = utils.calculate_new_ratings(500, 500)
+        self.assertIsNotNone(await self.conn.get_match(report.match_id))
+        self.assertEqual((await self.conn.get_user_rating(user_0.user_id, month, year)).rating, new_rating_0)
+        self.assertEqual((await self.conn.get_user_rating(user_1.user_id, month, year)).rating, new_rating_1)
+        ranking = await self.conn.get_ranking(*utils.make_month_dates(month, year))
+        self.assertEqual({e.user_id: (e.wins, e.games) for e in ranking}, {
+            user_0.user_id: (1, 1),
+            user_1.user_id: (0, 1),
+        })
+
     async def test_ban_user(self):
         user_id = await self.conn.create_member('test_user', b'password', '11111111111')
         user = await self.conn.get_user(user_id)
@@ -542,6 +815,46 @@ class DbTest(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(len(rows), 0)
 
 
+class DbReadPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.data_dir = TemporaryDirectory()
+        self.conn = DbConnector(os.path.join(self.data_dir.name, 'database.sqlite3'), Config())
+        await self.conn.connect()
+
+    async def asyncTearDown(self):
+        await self.conn.close()
+        self.data_dir.cleanup()
+
+    async def test_wal_mode(self):
+        async with self.conn._transaction('r') as c:
+            await c.execute('pragma journal_mode')
+            self.assertEqual(await c.fetchone(), ('wal',))
+
+    async def test_reads_isolated_from_write_transaction(self):
+        await self.conn.authenticate_user('test_user_1 GUEST', None, auto_create=True)
+
+        async with self.conn._transaction('w') as c:
+            await c.execute(
+                "insert into users (id, username, created_at) values ('2', 'test_user_2 GUEST', 0)")
+
+            # Other tasks read committed data from the pool, without waiting for the write
+            other_task_reads = await asyncio.gather(
+                asyncio.create_task(self.conn.get_user_by_username('test_user_1 GUEST')),
+                asyncio.create_task(self.conn.get_user_by_username('test_user_2 GUEST')))
+            self.assertIsNotNone(other_task_reads[0])
+            self.assertIsNone(other_task_reads[1])
+
+            # Reads within the write transaction see its changes
+            self.assertIsNotNone(await self.conn.get_user_by_username('test_user_2 GUEST'))
+
+        self.assertIsNotNone(await self.conn.get_user_by_username('test_user_2 GUEST'))
+
+    async def test_read_connections_are_read_only(self):
+        async with self.conn._transaction('r') as c:
+            with self.assertRaises(sqlite3.OperationalError):
+                await c.execute("insert into users (id, username, created_at) values ('1', 'test GUEST', 0)")
+
+
 class DbMigrationTest(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         import aiosqlite
@@ -991,6 +1304,84 @@ class DbMigrationTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(table_info[4][:3], (4, 'source_discord_id', 'varchar'))
         self.assertEqual(table_info[5][:3], (5, 'ban_reason', 'varchar'))
 
+    async def test_migration_v11(self):
+        await migrations.execute_migrations(self.transaction, self.dbconn.config, 10)
+
+        self.assertNotIn('user_monthly_stats', await self.get_table_names())
+
+        async with self.transaction('w') as c:
+            for match_id, winner_id, loser_id, finished_at, is_void in [
+                ('1', '1', '2', datetime(2020, 1, 1, 1, 0, 0, tzinfo=timezone.utc), 0),
+                ('2', '2', '1', datetime(2020, 1, 31, 23, 0, 0, tzinfo=timezone.utc), 0),
+                ('3', '1', '2', datetime(2020, 2, 1, 1, 0, 0, tzinfo=timezone.utc), 0),
+                ('4', '1', '2', datetime(2020, 2, 1, 2, 0, 0, tzinfo=timezone.utc), 1),
+            ]:
+                await c.execute(
+                    "insert into matches (id, user_1, user_2, is_ranked, started_at) values (?, ?, ?, 1, ?)",
+                    (match_id, '1', '2', finished_at.timestamp() - 60))
+                await c.execute(
+                    "insert into match_results (match_id, winner_id, loser_id, finished_at, is_void)"
+                    " values (?, ?, ?, ?, ?)",
+                    (match_id, winner_id, loser_id, finished_at.timestamp(), is_void))
+
+        await migrations.execute_migrations(self.transaction, self.dbconn.config, 11)
+
+        ver = await self.get_db_version()
+        self.assertEqual(ver, 11)
+        self.assertIn('user_monthly_stats', await self.get_table_names())
+
+        table_info = await self.get_table_info('user_monthly_stats')
+        self.assertEqual(len(table_info), 5)
+        self.assertEqual(table_info[0][:3], (0, 'user_id', 'varchar'))
+        self.assertEqual(table_info[1][:3], (1, 'year', 'INTEGER'))
+        self.assertEqual(table_info[2][:3], (2, 'month', 'INTEGER'))
+        self.assertEqual(table_info[3][:3], (3, 'wins', 'INTEGER'))
+        self.assertEqual(table_info[4][:3], (4, 'total_games', 'INTEGER'))
+
+        async with self.transaction('r') as c:
+            await c.execute('select * from user_monthly_stats order by year, month, user_id')
+            self.assertEqual(await c.fetchall(), [
+                ('1', 2020, 1, 1, 2),
+                ('2', 2020, 1, 1, 2),
+                ('1', 2020, 2, 1, 1),
+                ('2', 2020, 2, 0, 1),
+            ])
+
+    async def test_migration_v12(self):
+        await migrations.execute_migrations(self.transaction, self.dbconn.config, 11)
+
+        async def get_index_names(table_name: str) -> list[str]:
+            async with self.transaction('r') as c:
+                await c.execute(f'pragma index_list(\'{table_name}\')')
+                return [row[1] for row in await c.fetchall()]
+
+        self.assertNotIn('users_discord_user_id', await get_index_names('users'))
+        self.assertNotIn('match_results_finished_at', await get_index_names('match_results'))
+
+        await migrations.execute_migrations(self.transaction, self.dbconn.config, 12)
+
+        ver = await self.get_db_version()
+        self.assertEqual(ver, 12)
+        self.assertIn('users_discord_user_id', await get_index_names('users'))
+        self.assertIn('match_results_finished_at', await get_index_names('match_results'))
+
+    async def test_migration_v13(self):
+        await migrations.execute_migrations(self.transaction, self.dbconn.config, 12)
+
+        self.assertNotIn('pending_match_results', await self.get_table_names())
+
+        await migrations.execute_migrations(self.transaction, self.dbconn.config, 13)
+
+        ver = await self.get_db_version()
+        self.assertEqual(ver, 13)
+        self.assertIn('pending_match_results', await self.get_table_names())
+
+        table_info = await self.get_table_info('pending_match_results')
+        self.assertEqual([column[1] for column in table_info], [
+            'id', 'match_id', 'winner_id', 'loser_id', 'winner_pieces_left', 'loser_pieces_left', 'move_counter',
+            'grid_size', 'squadron_size', 'started_at', 'finished_at', 'is_ranked', 'is_void',
+        ])
+
 
 class DbTournamentsTest(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
@@ -1223,3 +1614,131 @@ class DbTournamentsTest(unittest.IsolatedAsyncioTestCase):
 
         duel_matches = await self.dbconn.get_duel_matches(tournament_id, 0)
         self.assertEqual(len(duel_matches), 2)
+
+
+class DbQueryPlanTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the queries of every connector method through EXPLAIN QUERY PLAN,
+    and fails when a table is scanned in full instead of using an index.
+    """
+
+    def database_file(self) -> str:
+        return ':memory:'
+
+    async def asyncSetUp(self):
+        self.conn = DbConnector(self.database_file(), Config())
+        await self.conn.connect()
+
+        self.user1 = await self.conn.authenticate_user('test_user_1 GUEST', None, auto_create=True)
+        self.user2 = await self.conn.authenticate_user('test_user_2 GUEST', None, auto_create=True)
+        self.match = DbMatchReport(
+            winner_id=self.user1.user_id,
+            loser_id=self.user2.user_id,
+            winner_pieces_left=10,
+            loser_pieces_left=0,
+            move_counter=20,
+            grid_size='small',
+            squadron_size='medium',
+            started_at=datetime(2020, 1, 1, 0, 0, 0, tzinfo=timezone.utc),
+            finished_at=datetime(2020, 1, 1, 1, 0, 0, tzinfo=timezone.utc),
+            is_ranked=True,
+            is_void=False,
+        )
+        self.tournament_id = await self.conn.create_tournament('test_tournament', '1', '2', 3)
+
+    async def asyncTearDown(self):
+        await self.conn.close()
+
+    async def trace_statements(self, query) -> list[str]:
+        # Reads go through the read connections when the database is a file
+        connections = [self.conn.conn, *self.conn._read_conns]
+        statements: list[str] = []
+        for connection in connections:
+            await connection.set_trace_callback(statements.append)
+        try:
+            await query
+        finally:
+            for connection in connections:
+                await connection.set_trace_callback(None)
+        return statements
+
+    async def get_full_scans(self, query) -> list[str]:
+        statements = await self.trace_statements(query)
+
+        full_scans = []
+        for statement in statements:
+            if statement.split()[0].lower() in ('begin', 'commit', 'rollback'):
+                continue
+            async with self.conn.conn.execute(f'explain query plan {statement}') as c:
+                for row in await c.fetchall():
+                    detail = row[3]
+                    # Scans of subqueries, constant rows and ordered scans of an index are fine
+                    if detail.startswith('SCAN ') and not detail.startswith(('SCAN (', 'SCAN CONSTANT ROW')) \
+                            and ' USING ' not in detail:
+                        full_scans.append(f'{detail} in: {statement}')
+        return full_scans
+
+    async def test_query_plans(self):
+        start_date, end_date = utils.make_month_dates(1, 2020)
+        queries = {
+            'add_match_result': lambda: self.conn.add_match_result(self.match),
+            'get_user': lambda: self.conn.get_user(self.user1.user_id),
+            'get_user_by_username': lambda: self.conn.get_user_by_username('test_user_1 GUEST'),
+            'get_users_by_discord_id': lambda: self.conn.get_users_by_discord_id('1'),
+            'authenticate_user': lambda: self.conn.authenticate_user('test_user_3 GUEST', None, auto_create=True),
+            'change_user_password': lambda: self.conn.change_user_password(self.user1.user_id, None),
+            'claim_member': lambda: self.conn.claim_member(self.user1.user_id, None, '1'),
+            'get_match': lambda: self.conn.get_match(self.match.match_id),
+            'get_match_result': lambda: self.conn.get_match_result(self.match.match_id),
+            'get_recent_matches': lambda: self.conn.get_recent_matches(),
+            'get_ranking': lambda: self.conn.get_ranking(start_date, end_date),
+            'get_user_rating': lambda: self.conn.get_user_rating(self.user1.user_id, 1, 2020),
+            'get_tournament': lambda: self.conn.get_tournament(self.tournament_id),
+            'list_tournament_users': lambda: self.conn.list_tournament_users(self.tournament_id),
+            'add_participant': lambda: self.conn.add_participant(self.tournament_id, self.user1.user_id),
+            'list_participants': lambda: self.conn.list_participants(self.tournament_id),
+            'remove_participant': lambda: self.conn.remove_participant(self.tournament_id, self.user1.user_id),
+            'start_tournament': lambda: self.conn.start_tournament(self.tournament_id),
+            'add_duel': lambda: self.conn.add_duel(
+                self.tournament_id, 0, datetime(2020, 2, 1, tzinfo=timezone.utc),
+                self.user1.user_id, self.user2.user_id),
+            'list_duels': lambda: self.conn.list_duels(self.tournament_id),
+            'get_duel': lambda: self.conn.get_duel(self.tournament_id, 0),
+            'add_duel_match': lambda: self.conn.add_duel_match(self.tournament_id, 0, self.match.match_id),
+            'get_duel_matches': lambda: self.conn.get_duel_matches(self.tournament_id, 0),
+            'list_tournament_matches': lambda: self.conn.list_tournament_matches(self.tournament_id),
+            'ban_user': lambda: self.conn.ban_user(self.user2.user_id, '1', 'reason'),
+            'unban_user': lambda: self.conn.unban_user(self.user2.user_id, '1'),
+        }
+        for name, query in queries.items():
+            with self.subTest(name):
+                self.assertEqual(await self.get_full_scans(query()), [])
+
+
+class DbReadPoolQueryPlanTest(DbQueryPlanTest):
+    """
+    Checks the query plans with a file database, whose reads go through the read connections.
+    """
+
+    def database_file(self) -> str:
+        return os.path.join(self.dir.name, 'database.sqlite3')
+
+    async def asyncSetUp(self):
+        self.dir = TemporaryDirectory()
+        await super().asyncSetUp()
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.dir.cleanup()
+
+    async def test_reads_traced_on_read_connections(self) -> None:
+        self.assertTrue(self.conn._read_conns)
+        read_statements: list[str] = []
+        for connection in self.conn._read_conns:
+            await connection.set_trace_callback(read_statements.append)
+        try:
+            await self.conn.get_user(self.user1.user_id)
+        finally:
+            for connection in self.conn._read_conns:
+                await connection.set_trace_callback(None)
+        self.assertEqual(len(read_statements), 1)
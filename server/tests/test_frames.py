@@ -0,0 +1,132 @@
+import asyncio
+import unittest
+
+from QRServer.common.frames import read_frames, FrameTooLargeError, FrameWriter, SlowConsumerError
+
+
+class FramesTest(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    async def read_all(chunks: list[bytes], max_frame_size=64) -> list[bytes]:
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        return [frame async for frame in read_frames(reader, max_frame_size)]
+
+    async def test_single_frame(self):
+        self.assertEqual([b'<QR_G>'], await self.read_all([b'<QR_G>\x00']))
+
+    async def test_multiple_frames_in_chunk(self):
+        self.assertEqual(
+            [b'<S>~<GRAB_PIECE>~1', b'', b'<S>~<RELEASE_PIECE>~1'],
+            await self.read_all([b'<S>~<GRAB_PIECE>~1\x00\x00<S>~<RELEASE_PIECE>~1\x00']))
+
+    async def test_frame_split_across_chunks(self):
+        reader = asyncio.StreamReader()
+        frames = read_frames(reader, 64)
+
+        reader.feed_data(b'<S>~<GRAB_')
+        next_frame = asyncio.ensure_future(anext(frames))
+        await asyncio.sleep(0)
+        self.assertFalse(next_frame.done())
+
+        reader.feed_data(b'PIECE>~1\x00<S>')
+        self.assertEqual(b'<S>~<GRAB_PIECE>~1', await next_frame)
+
+        reader.feed_data(b'~<NUKE>\x00')
+        self.assertEqual(b'<S>~<NUKE>', await anext(frames))
+
+    async def test_incomplete_frame_discarded(self):
+        self.assertEqual([b'<QR_G>'], await self.read_all([b'<QR_G>\x00<QR_']))
+
+    async def test_frame_too_large(self):
+        with self.assertRaises(FrameTooLargeError):
+            await self.read_all([b'a' * 65 + b'\x00'])
+
+    async def test_incomplete_frame_too_large(self):
+        with self.assertRaises(FrameTooLargeError):
+            await self.read_all([b'a' * 40, b'a' * 40])
+
+    async def test_frame_at_limit(self):
+        self.assertEqual([b'a' * 64], await self.read_all([b'a' * 64 + b'\x00']))
+
+
+class FakeTransport:
+    def __init__(self):
+        self.buffered = 0
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class FakeWriter:
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.writes = []
+        self.drained = asyncio.Event()
+        self.drain_error = None
+        self.closed = False
+
+    def write(self, data):
+        self.writes.append(data)
+
+    async def drain(self):
+        await self.drained.wait()
+        if self.drain_error:
+            raise self.drain_error
+
+    def close(self):
+        self.closed = True
+
+
+class FrameWriterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.writer = FakeWriter()
+        self.frame_writer = FrameWriter(self.writer, 16)
+        self.task = asyncio.create_task(self.frame_writer.run())
+
+    async def asyncTearDown(self):
+        self.task.cancel()
+
+    async def test_send(self):
+        self.writer.drained.set()
+        await self.frame_writer.send(b'<A>\x00')
+        self.assertEqual([b'<A>\x00'], self.writer.writes)
+
+    async def test_sends_coalesced_while_draining(self):
+        first = asyncio.create_task(self.frame_writer.send(b'<A>\x00'))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(self.frame_writer.send(b'<B>\x00'))
+        third = asyncio.create_task(self.frame_writer.send(b'<C>\x00'))
+        await asyncio.sleep(0)
+        self.assertEqual([b'<A>\x00'], self.writer.writes)
+
+        self.writer.drained.set()
+        await asyncio.gather(first, second, third)
+        self.assertEqual([b'<A>\x00', b'<B>\x00<C>\x00'], self.writer.writes)
+
+    async def test_slow_consumer_evicted(self):
+        self.writer.transport.buffered = 10
+        first = asyncio.create_task(self.frame_writer.send(b'<A>\x00'))
+        await asyncio.sleep(0)
+        with self.assertRaises(SlowConsumerError):
+            await self.frame_writer.send(b'<BBBB>\x00')
+        with self.assertRaises(SlowConsumerError):
+            await first
+        with self.assertRaises(SlowConsumerError):
+            await self.frame_writer.send(b'<C>\x00')
+        self.assertTrue(self.writer.closed)
+
+    async def test_write_failure(self):
+        self.writer.drain_error = ConnectionResetError()
+        first = asyncio.create_task(self.frame_writer.send(b'<A>\x00'))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(self.frame_writer.send(b'<B>\x00'))
+        await asyncio.sleep(0)
+        self.writer.drained.set()
+        with self.assertRaises(ConnectionResetError):
+            await first
+        with self.assertRaises(ConnectionResetError):
+            await second
+        with self.assertRaises(ConnectionResetError):
+            await self.frame_writer.send(b'<C>\x00')
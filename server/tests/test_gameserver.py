@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+
+from QRServer.common.classes import MatchId
+from QRServer.config import Config
+from QRServer.game.gameserver import GameServer
+
+
+class GameServerRendezvousTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with patch('QRServer.game.gameserver.time.monotonic', return_value=0.0):
+            self.server = GameServer(Config(), None, None)
+
+    def wait_for_opponent(self, match_id: MatchId, now: float):
+        with patch('QRServer.game.gameserver.time.monotonic', return_value=now):
+            self.server._wait_for_opponent(match_id)
+
+    async def test_matches_changed_while_expiring(self):
+        match_ids = [MatchId('1', '2'), MatchId('3', '4'), MatchId('5', '6')]
+        for match_id in match_ids:
+            self.wait_for_opponent(match_id, 0.0)
+
+        expired = []
+        rejoined = []
+
+        async def expire_match(match_id: MatchId):
+            if not expired:
+                # While the first match expires, the opponent of another one joins,
+                # and the players of the last one leave and it starts waiting again
+                joined, left = [other for other in match_ids if other != match_id]
+                self.server._stop_waiting(joined)
+                self.server._stop_waiting(left)
+                self.wait_for_opponent(left, 30.0)
+                rejoined.append(left)
+            expired.append(match_id)
+
+        with patch.object(self.server, '_expire_match', side_effect=expire_match):
+            await self.server._expire_due_matches(61.0)
+            self.assertEqual(len(expired), 1)
+            self.assertEqual(list(self.server._rendezvous), rejoined)
+
+            await self.server._expire_due_matches(89.0)
+            self.assertEqual(len(expired), 1)
+            await self.server._expire_due_matches(91.0)
+            self.assertEqual(expired[1:], rejoined)
+            self.assertEqual(self.server._rendezvous, {})
@@ -0,0 +1,147 @@
+import asyncio
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+from QRServer.common.classes import LobbyPlayer
+from QRServer.config import Config
+from QRServer.lobby.lobbymanager import LobbyManager
+from QRServer.lobby.lobbyserver import LobbyServer
+
+
+class FakeLobbyClient:
+    def __init__(self, username: str, connected_at: datetime):
+        self.username = username
+        self.connected_at = connected_at
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def get_player(self) -> LobbyPlayer:
+        return LobbyPlayer(username=self.username)
+
+    async def send_data(self, data: bytes):
+        await asyncio.sleep(0)
+
+
+class LobbyServerIndexTest(unittest.IsolatedAsyncioTestCase):
+    """Random joins and leaves, checking that the indexes agree with the slots after every step"""
+
+    async def asyncSetUp(self):
+        # Debug mode records a traceback for every broadcast task, which makes thousands of joins slow
+        asyncio.get_running_loop().set_debug(False)
+        self.reset()
+
+    def reset(self):
+        self.manager = LobbyManager(Config(), None)
+        self.room = self.manager.rooms[0]
+        self.connected_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.joined = 0
+
+    def new_client(self) -> FakeLobbyClient:
+        self.joined += 1
+        return FakeLobbyClient(f'Player {self.joined}', self.connected_at + timedelta(seconds=self.joined))
+
+    def assert_consistent(self, room: LobbyServer):
+        occupied = {idx: client for idx, client in enumerate(room.clients) if client}
+        free = [idx for idx, client in enumerate(room.clients) if not client]
+
+        self.assertEqual(room.get_player_count(), len(occupied))
+        self.assertEqual(room.is_full(), not free)
+        self.assertEqual(sorted(room._free_idxs), free)
+        if free:
+            self.assertEqual(room._free_idxs[0], free[0])
+        self.assertEqual(room._idxs_by_username, {client.username: idx for idx, client in occupied.items()})
+        for client in occupied.values():
+            self.assertTrue(room.username_exists(client.username))
+            self.assertIs(room.get_client(client.username), client)
+
+    async def test_random_joins_and_leaves(self):
+        for seed in range(30):
+            with self.subTest(seed=seed):
+                self.reset()
+                rng = random.Random(seed)
+                for _ in range(200):
+                    occupied = [idx for idx, client in enumerate(self.room.clients) if client]
+                    if occupied and rng.random() < 0.45:
+                        idx = rng.choice(occupied)
+                        client = self.room.clients[idx]
+                        await self.room.remove_client(idx)
+                        self.assertTrue(client.closed)
+                        self.assertFalse(self.room.username_exists(client.username))
+                        self.assertIsNone(self.room.get_client(client.username))
+                    else:
+                        free = [idx for idx, client in enumerate(self.room.clients) if not client]
+                        oldest = min((client for client in self.room.clients if client),
+                                     key=lambda c: c.connected_at, default=None)
+                        client = self.new_client()
+                        idx = await self.room.add_client(client)
+                        if free:
+                            # The first free slot is taken
+                            self.assertEqual(idx, free[0])
+                        else:
+                            self.assertTrue(oldest.closed)
+                            self.assertFalse(self.room.username_exists(oldest.username))
+                        self.assertIs(self.room.clients[idx], client)
+
+                    self.assert_consistent(self.room)
+
+    async def test_concurrent_joins_to_full_room(self):
+        for _ in range(13):
+            await self.room.add_client(self.new_client())
+
+        clients = [self.new_client() for _ in range(5)]
+        idxs = await asyncio.gather(*(self.room.add_client(client) for client in clients))
+
+        self.assertEqual(len(set(idxs)), len(idxs))
+        for idx, client in zip(idxs, clients):
+            self.assertIs(self.room.clients[idx], client)
+        self.assert_consistent(self.room)
+
+    async def test_removing_empty_slot(self):
+        client = self.new_client()
+        await self.room.add_client(client)
+        await self.room.remove_client(0)
+        with self.assertLogs('qr.lobby_server', 'WARNING'):
+            await self.room.remove_client(0)
+
+        self.assert_consistent(self.room)
+        self.assertEqual(self.room._free_idxs.count(0), 1)
+
+
+class LobbyManagerRankingCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.connector = AsyncMock()
+        self.connector.get_ranking.return_value = []
+        self.manager = LobbyManager(Config(), self.connector)
+
+    async def get_ranking_data(self, month: int, year: int, now: datetime):
+        with patch('QRServer.lobby.lobbymanager.datetime') as mock_datetime:
+            mock_datetime.now.return_value = now
+            return await self.manager.get_ranking_data(month, year)
+
+    async def test_recent_months_cached(self):
+        now = datetime(2025, 1, 15, tzinfo=timezone.utc)
+        for _ in range(2):
+            await self.get_ranking_data(1, 2025, now)
+            await self.get_ranking_data(12, 2024, now)
+        self.assertEqual(self.connector.get_ranking.call_count, 2)
+        self.assertEqual(self.manager._ranking_data.keys(), {(2025, 1), (2024, 12)})
+
+        self.manager.invalidate_match_results()
+        await self.get_ranking_data(1, 2025, now)
+        self.assertEqual(self.connector.get_ranking.call_count, 3)
+
+    async def test_other_months_not_cached(self):
+        now = datetime(2025, 6, 15, tzinfo=timezone.utc)
+        for year in range(2000, 2100):
+            await self.get_ranking_data(3, year, now)
+        self.assertEqual(self.connector.get_ranking.call_count, 100)
+        self.assertEqual(self.manager._ranking_data, {})
+
+    async def test_past_months_evicted(self):
+        await self.get_ranking_data(5, 2025, datetime(2025, 5, 31, tzinfo=timezone.utc))
+        await self.get_ranking_data(7, 2025, datetime(2025, 7, 1, tzinfo=timezone.utc))
+        self.assertEqual(self.manager._ranking_data.keys(), {(2025, 7)})
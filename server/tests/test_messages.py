@@ -15,7 +15,8 @@ from QRServer.common.messages import AddStatsRequest, AssignNextPowerCountMessag
     ServerRankingThisMonthResponse, SetCommentRequest, SettingsArenaSizeMessage, SettingsColorMessage, \
     SettingsLoadedMessage, SettingsReadyOffMessage, SettingsReadyOnAgainMessage, SettingsSquadronSizeMessage, \
     SettingsTimerMessage, SettingsTopBottomMessage, SwitchPlayerMessage, SwitcherooMessage, UsePowerMessage, \
-    ChallengeMessage, ChallengeAuthMessage, SettingsReadyOnMessage, ResignMessage, VoidScoreRequest, VoidScoreResponse
+    ChallengeMessage, ChallengeAuthMessage, SettingsReadyOnMessage, ResignMessage, VoidScoreRequest, \
+    VoidScoreResponse, ConstantResponseMessage, Message
 
 
 class MessagesTest(unittest.TestCase):
@@ -26,6 +27,11 @@ class MessagesTest(unittest.TestCase):
             self.assertNotIn(message.message_type_id, ids)
             ids.add(message.message_type_id)
 
+    def test_every_message_is_slotted(self):
+        for message in getattr(messages, "__message_classes"):
+            for clazz in message.__mro__[:-1]:
+                self.assertIn('__slots__', clazz.__dict__, f'{clazz} has no __slots__')
+
     def test_every_message_has_mapping(self):
         self.assertEqual(messages.get_message_type_from_id(0), DisconnectRequest)
         self.assertEqual(messages.get_message_type_from_id(1), PolicyFileRequest)
@@ -154,6 +160,9 @@ class RequestMessagesTest(unittest.TestCase):
         else:
             self.fail()
 
+    def test_add_stats_invalid(self):
+        self.assertIsNone(messages._parse_data('<SERVER>~<STATS>~1~a~3~small~small'))
+
     def test_server_ranking_invalid(self):
         msg = messages._parse_data('<SERVER>~<RANKING>~1')
         self.assertIsNone(msg)
@@ -293,6 +302,21 @@ class ResponseMessagesTest(unittest.TestCase):
             b'test2~7~7\x00',
             data)
 
+    def test_constant_responses(self):
+        for clazz in getattr(messages, "__message_classes"):
+            if not issubclass(clazz, ConstantResponseMessage):
+                continue
+            msg = clazz.new()
+            self.assertIs(msg, clazz.new())
+            self.assertEqual(clazz(list(clazz.prefix)), msg)
+            self.assertEqual('~'.join(clazz.prefix).encode('ascii') + b'\x00', msg.to_data())
+            self.assertIs(msg.to_data(), clazz.data)
+
+    def test_constant_response_parsed(self):
+        msg = Message.from_data(b'<S>~<SERVER>~<ALIVE>')
+        self.assertEqual(ServerAliveResponse.new(), msg)
+        self.assertEqual(ServerAliveResponse.data, msg.to_data())
+
     def test_use_power_response_exception(self):
         self.assertRaises(ValueError, lambda: UsePowerMessage.new('power_name', 12))
 
@@ -309,3 +333,49 @@ class ResponseMessagesTest(unittest.TestCase):
         self.assertEqual(
             data,
             b'<S>~<USE_POWER>~PLATEAU~4~arg\x00')
+
+
+class MessageDispatchTest(unittest.TestCase):
+    @staticmethod
+    def _linear_type(args: list[str]):
+        for clazz in getattr(messages, "__message_classes"):
+            if messages._valid(args, clazz.prefix, clazz.argc):
+                return clazz
+        return None
+
+    def test_dispatch_matches_linear_scan(self):
+        frames = [
+            '<QR_G>', '<QR_L>', '<DISCONNECTED>', '<policy-file-request/>',
+            '<L>~a~b', '<L>~1~2~3~4~5', '<L>~<DUPLICATE>', '<L>~<BAD_MEMBER>', '<L>~1',
+            '<SERVER>~<RECENT>', '<SERVER>~<RANKING>~2020~1', '<SERVER>~<PING>', '<SERVER>~<ALIVE?>',
+            '<S>~<SERVER>~<NAME_TAKEN>~<NO>', '<S>~<SERVER>~<NAME_TAKEN>~<YES>', '<S>~<SERVER>~<NAME_TAKEN>~x',
+            '<S>~<SERVER>~<RANKING(thisMonth)>', '<S>~<SERVER>~<RANKING(thisMonth)>~a~1~2',
+            '<S>~1~2~<SHALLWEPLAYAGAME?>', '<S>~1~2~<AUTHENTICATION>~asdf',
+            '<S>~<USE_POWER>~x~<SHALLWEPLAYAGAME?>', '<S>~<USE_POWER>~PLATEAU~7~arg',
+            '<S>~<SETTINGS>~<READY_ON>', '<S>~<SETTINGS>~<READY_ON>~10~2~1~0000FF',
+            '<S>~<GRAB_PIECE>~3', '<S>~<NEW_GRID_CORD>~1~2~3~4', '<S>~<UNKNOWN>~1', '', 'garbage',
+        ]
+        for frame in frames:
+            args = frame.split(messages.delim)
+            self.assertEqual(
+                self._linear_type(args),
+                messages.get_message_type_from_args(args),
+                f'Wrong type for {frame!r}')
+
+    def test_dispatch_every_message_class(self):
+        for clazz in getattr(messages, "__message_classes"):
+            argc = clazz.argc[0] if clazz.argc[0] != -1 else len(clazz.prefix)
+            args = [p if p is not None else '1' for p in clazz.prefix]
+            args += ['1'] * (argc - len(args))
+            self.assertEqual(self._linear_type(args), messages.get_message_type_from_args(args))
+
+    def test_dispatch_invalid_args(self):
+        self.assertIsNone(messages._parse_data('<S>~<SETTINGS>~<TIMER>~1'))
+        self.assertIsNone(messages._parse_data('<S>~<GRAB_PIECE>'))
+
+    def test_dispatch_raw_data(self):
+        self.assertEqual(GrabPieceMessage, messages.get_message_type_from_data(b'<S>~<GRAB_PIECE>~3'))
+        self.assertEqual(ChallengeMessage, messages.get_message_type_from_data(b'<S>~1~2~<SHALLWEPLAYAGAME?>'))
+        self.assertEqual(NameTakenResponse, messages.get_message_type_from_data(b'<S>~<SERVER>~<NAME_TAKEN>~<NO>'))
+        self.assertIsNone(messages.get_message_type_from_data(b'<S>~<GRAB_PIECE>'))
+        self.assertIsNone(messages.get_message_type_from_data(b''))
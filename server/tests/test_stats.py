@@ -0,0 +1,57 @@
+import unittest
+
+from QRServer.common.messages import GrabPieceMessage
+from QRServer.common.stats import Histogram, MessageStats, prometheus_histogram
+
+
+class HistogramTest(unittest.TestCase):
+    def test_empty(self):
+        histogram = Histogram((1.0, 2.0))
+        self.assertEqual({
+            'count': 0,
+            'sum': 0.0,
+            'buckets': {'1.0': 0, '2.0': 0, '+Inf': 0},
+        }, histogram.to_dict())
+
+    def test_observe(self):
+        histogram = Histogram((1.0, 2.0))
+        histogram.observe(0.5)
+        histogram.observe(1.0)
+        histogram.observe(1.5)
+        histogram.observe(3.0)
+        self.assertEqual({
+            'count': 4,
+            'sum': 6.0,
+            'buckets': {'1.0': 2, '2.0': 3, '+Inf': 4},
+        }, histogram.to_dict())
+
+    def test_prometheus_histogram(self):
+        histogram = Histogram((1.0,))
+        histogram.observe(0.5)
+        histogram.observe(1.5)
+        self.assertEqual([
+            'latency_bucket{type="a",le="1.0"} 1',
+            'latency_bucket{type="a",le="+Inf"} 2',
+            'latency_sum{type="a"} 2.0',
+            'latency_count{type="a"} 2',
+        ], prometheus_histogram('latency', histogram, 'type="a"'))
+
+
+class MessageStatsTest(unittest.TestCase):
+    def test_record(self):
+        stats = MessageStats()
+        stats.record_received(GrabPieceMessage, 10, 0.001)
+        stats.record_received(GrabPieceMessage, 12, 0.002)
+        stats.record_received(None, 5, 0.0)
+        stats.record_sent(7)
+
+        self.assertEqual({'GrabPieceMessage': 2, 'unknown': 1}, stats.received_count)
+        self.assertEqual({'GrabPieceMessage': 22, 'unknown': 5}, stats.received_bytes)
+        self.assertEqual(2, stats.handling_latency['GrabPieceMessage'].count)
+
+        lines = stats.to_prometheus()
+        self.assertIn('qr_messages_received_total{type="GrabPieceMessage"} 2', lines)
+        self.assertIn('qr_received_bytes_total{type="unknown"} 5', lines)
+        self.assertIn('qr_messages_sent_total 1', lines)
+        self.assertIn('qr_sent_bytes_total 7', lines)
+        self.assertIn('qr_message_handling_latency_seconds_count{type="GrabPieceMessage"} 2', lines)
@@ -0,0 +1,69 @@
+import random
+import unittest
+
+from QRServer.common.timerwheel import TimerWheel
+
+
+class TimerWheelTest(unittest.TestCase):
+    def test_expire_when_due(self):
+        wheel: TimerWheel[str] = TimerWheel(1.0, 8, 100.0)
+        wheel.schedule('a', 101.5)
+        wheel.schedule('b', 102.0)
+        wheel.schedule('c', 104.2)
+
+        self.assertEqual(wheel.advance(101.4), [])
+        self.assertEqual(wheel.advance(102.0), ['a', 'b'])
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(104.9), [])
+        self.assertEqual(wheel.advance(105.0), ['c'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_cancel_and_reschedule(self):
+        wheel: TimerWheel[str] = TimerWheel(1.0, 8, 0.0)
+        wheel.schedule('a', 1.0)
+        wheel.schedule('b', 1.0)
+        self.assertTrue(wheel.cancel('a'))
+        self.assertFalse(wheel.cancel('a'))
+        self.assertNotIn('a', wheel)
+        wheel.schedule('b', 3.0)
+
+        self.assertEqual(wheel.advance(2.0), [])
+        self.assertEqual(wheel.advance(4.0), ['b'])
+
+    def test_past_deadline(self):
+        wheel: TimerWheel[str] = TimerWheel(1.0, 8, 10.0)
+        wheel.schedule('a', 5.0)
+        self.assertEqual(wheel.advance(11.0), ['a'])
+
+    def test_deadlines_beyond_one_turn(self):
+        wheel: TimerWheel[str] = TimerWheel(1.0, 4, 0.0)
+        wheel.schedule('a', 2.5)
+        wheel.schedule('b', 6.5)
+        wheel.schedule('c', 30.0)
+
+        self.assertEqual(wheel.advance(3.0), ['a'])
+        self.assertEqual(wheel.advance(6.0), [])
+        self.assertEqual(wheel.advance(7.0), ['b'])
+        # Skipping many turns at once
+        self.assertEqual(wheel.advance(100.0), ['c'])
+
+    def test_random_deadlines(self):
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                wheel: TimerWheel[int] = TimerWheel(0.5, 16, 0.0)
+                deadlines = {key: rng.uniform(0, 30) for key in range(200)}
+                for key, deadline in deadlines.items():
+                    wheel.schedule(key, deadline)
+
+                now = 0.0
+                expired_at = {}
+                while now < 40:
+                    now += rng.uniform(0, 3)
+                    for key in wheel.advance(now):
+                        expired_at[key] = now
+
+                self.assertEqual(len(wheel), 0)
+                self.assertEqual(expired_at.keys(), deadlines.keys())
+                for key, deadline in deadlines.items():
+                    self.assertGreaterEqual(expired_at[key], deadline)